@@ -1,10 +1,18 @@
+import argparse
 import requests
 import json
 
-# Exact settings from your working curl command
-url = "http://localhost:11434/api/generate"
-model = "qwen2.5-coder:latest"
-prompt = "Are you working?"
+parser = argparse.ArgumentParser(description="Check that an Ollama (or fake Ollama) server answers")
+# Defaults: exact settings from your working curl command
+parser.add_argument("--url", default="http://localhost:11434/api/generate",
+                    help="Generate endpoint, e.g. http://127.0.0.1:11435/api/generate for the fake server")
+parser.add_argument("--model", default="qwen2.5-coder:latest")
+parser.add_argument("--prompt", default="Are you working?")
+args = parser.parse_args()
+
+url = args.url
+model = args.model
+prompt = args.prompt
 
 print(f"--- TESTING CONNECTION ---")
 print(f"Target URL: {url}")
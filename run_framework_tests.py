@@ -1,10 +1,46 @@
 import unittest
+import argparse
+import time
 import sys
 import os
 
-def run_tests():
+from src.utils.cassette import CASSETTE_ENV, CASSETTE_MODE_ENV
+
+DEFAULT_CASSETTE = os.path.join(os.path.dirname(__file__), 'tests', 'cassettes', 'framework_llm.jsonl')
+
+def configure_cassette(args):
+    """Points the shared LLM client at a cassette via the environment (read on first use)."""
+    if args.live:
+        print("🌐 LLM mode: live (no cassette)")
+        return
+    if args.record:
+        mode = "record"
+    elif os.path.exists(args.cassette):
+        mode = "replay"
+    else:
+        print(f"🌐 LLM mode: live ({args.cassette} not recorded yet; use --record)")
+        return
+    os.environ[CASSETTE_ENV] = args.cassette
+    os.environ[CASSETTE_MODE_ENV] = mode
+    print(f"📼 LLM mode: {mode} ({args.cassette})")
+
+def report_cassette():
+    from src.utils.ollama_client import get_client
+    cassette = get_client().cassette
+    if cassette is None:
+        return
+    cassette.close()  # Tidy the file once; entries were appended as they were recorded
+    stats = cassette.stats()
+    print(f"📼 Cassette: {stats['hits']} replayed, {stats['misses']} missed, {stats['recorded']} recorded "
+          f"({stats['entries']} entries)")
+    if stats['mode'] == "replay":
+        # Recorded wall time of the calls this run made: rises if a change adds calls or retries
+        print(f"   Recorded LLM time for this run: {stats['replayed_seconds']:.1f}s")
+
+def run_tests(args):
     print("🛡️  RUNNING MIGRATION FRAMEWORK TESTS")
     print("=======================================")
+    configure_cassette(args)
     
     # Auto-discover tests in the 'tests' folder
     loader = unittest.TestLoader()
@@ -17,7 +53,10 @@ def run_tests():
     suite = loader.discover(start_dir, pattern='test_*.py')
     
     runner = unittest.TextTestRunner(verbosity=2)
+    start = time.perf_counter()
     result = runner.run(suite)
+    print(f"\n⏱️  Suite wall time: {time.perf_counter() - start:.1f}s")
+    report_cassette()
     
     if result.wasSuccessful():
         print("\n✅ FRAMEWORK HEALTHY. Safe to run pipeline.")
@@ -27,4 +66,8 @@ def run_tests():
         sys.exit(1)
 
 if __name__ == "__main__":
-    run_tests()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the framework test suite")
+    parser.add_argument("--cassette", default=DEFAULT_CASSETTE, help="LLM record/replay file")
+    parser.add_argument("--record", action="store_true", help="Call the live model and (re)record the cassette")
+    parser.add_argument("--live", action="store_true", help="Call the live model without touching the cassette")
+    run_tests(parser.parse_args())
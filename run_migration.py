@@ -2,58 +2,204 @@ import sys
 import argparse
 import os
 from src.utils.manifest_manager import ManifestManager
-from src.specs.analyst import SpecAnalyst
+from src.specs.analyst import SpecAnalyst, ANALYST_PROMPT, CHUNK_NOTE, ANALYST_MERGE_PROMPT
 from src.specs.architect import RArchitect
 # Removed: from src.specs.validator import CodeValidator (No longer needed globally)
 from src.specs.optimizer import CodeOptimizer
 from src.specs.controller import PipelineController
-from src.specs.qa_engineer import QAEngineer
+from src.specs.qa_engineer import QAEngineer, QA_PROMPT
+from src.specs.prompts import ARCHITECT_PROMPT, OPTIMIZER_PROMPT_V2
 from src.specs.package_manager import PackageManager
+from src.utils.ollama_client import get_client, configure_client, DEFAULT_CONCURRENCY, DEFAULT_MODEL, DEFAULT_KEEP_ALIVE
+from src.utils.llm_cache import ResponseCache
+from src.utils.telemetry import Telemetry
+from src.utils.fake_ollama_server import FakeOllamaServer
+from src.utils.retry import DEFAULT_MAX_RETRIES
+from src.utils.pipeline_scheduler import PipelineScheduler, Stage, LLM, R, DEFAULT_R_WORKERS
+from src.utils.build_tracker import BuildTracker, file_hash, text_hash
+from src.utils.manifest_store import BACKENDS
+from src.utils.pipeline_context import PipelineContext
+from src.utils.scan_engine import DEFAULT_SCAN_WORKERS
 
-def run_full_migration(target_dir, force_optimize=False):
+def build_stages(context, tracker, force_optimize=False, model=DEFAULT_MODEL):
+    """
+    Per-file pipeline: analyse -> architect -> optimize -> QA suite -> run tests.
+
+    Each stage declares the hashes it depends on (see BuildTracker), so an
+    incremental run redoes only the stages whose inputs changed. Every
+    agent shares the run's PipelineContext and asks `model`.
+    """
+    analyst = SpecAnalyst(context=context, model=model)
+    architect = RArchitect(context=context, model=model)
+    optimizer = CodeOptimizer(context=context, model=model)
+    qa = QAEngineer(context=context, model=model)
+
+    analyst_prompt = text_hash(ANALYST_PROMPT + CHUNK_NOTE + ANALYST_MERGE_PROMPT)
+    # Specs are written from macro-expanded source, so editing a macro re-analyses them
+    macros = context.macros.table
+    macro_inputs = {"macros": macros.digest()} if len(macros) else {}
+    architect_context = text_hash(ARCHITECT_PROMPT + architect.get_schema() + architect.load_glossary())
+    optimizer_prompt = text_hash(OPTIMIZER_PROMPT_V2)
+    qa_prompt = text_hash(QA_PROMPT)
+
+    def analyse(entry):
+        return analyst.analyze_file(entry)
+
+    def optimize(entry):
+        return optimizer.optimize_file(entry, force=force_optimize)
+
+    def write_suite(entry):
+        return qa.generate_tests(entry) is not None
+
+    def run_suite(entry):
+        passed = qa.run_tests(qa.test_path(entry))
+        if not passed:
+            print(f"   ⚠️ Unit tests failed for {entry['r_function_name']}.")
+        return passed
+
+    drafted = lambda entry: entry.get('role') != 'controller'
+    testable = lambda entry: drafted(entry) and os.path.exists(entry['r_file'])
+    spec = lambda entry: entry['spec_file']
+    r_file = lambda entry: entry['r_file']
+    return [
+        Stage("analyse", analyse, LLM, output=spec, inputs=lambda entry: {
+            "source": entry.get('source_hash') or file_hash(entry['legacy_file']),
+            "prompt": analyst_prompt, "model": model, **macro_inputs}),
+        Stage("architect", architect.architect_file, LLM, applies=drafted, output=r_file, inputs=lambda entry: {
+            "spec": file_hash(entry['spec_file']), "prompt": architect_context, "model": model}),
+        # The Optimizer handles "Mid-Stage Verification" internally per file.
+        # It rewrites r_file, so it depends on the draft the Architect recorded.
+        Stage("optimize", optimize, R, applies=lambda entry: entry.get('role') == 'logic', output=r_file,
+              inputs=None if force_optimize else lambda entry: {
+                  "draft": tracker.output_of(entry, "architect"),
+                  "prompt": optimizer_prompt, "model": model}),
+        Stage("qa", write_suite, LLM, applies=testable, output=qa.test_path, inputs=lambda entry: {
+            "r_file": file_hash(entry['r_file']), "spec": file_hash(entry['spec_file']),
+            "prompt": qa_prompt, "model": model}),
+        Stage("test", run_suite, R, applies=testable, inputs=lambda entry: {
+            "r_file": file_hash(entry['r_file']), "tests": file_hash(qa.test_path(entry))}),
+    ]
+
+def run_full_migration(target_dir, force_optimize=False, warm_models=None, prometheus_path=None,
+                       llm_workers=None, r_workers=DEFAULT_R_WORKERS, rebuild=False,
+                       resume=False, manifest_backend=None, scan_workers=DEFAULT_SCAN_WORKERS,
+                       model=DEFAULT_MODEL):
     print("🚀 STARTING MIGRATION PIPELINE 🚀")
     print("====================================")
 
+    # 0. WARM-UP (load models once, up front, instead of in each stage's first call)
+    if warm_models:
+        print("\n[Step 0] 🔥 Warming up models...")
+        for label, seconds in get_client().preload(warm_models).items():
+            status = f"{seconds:.1f}s" if seconds is not None else "FAILED"
+            print(f"   {label:<48} {status}")
+
     # 1. MANIFEST
     print("\n[Step 1] 🗺️  Mapping Dependencies...")
     syntax_dir = os.path.join(target_dir, "syntax")
-    manager = ManifestManager(syntax_dir)
-    manager.generate_manifest()
-
-    # 2. ANALYST
-    print("\n[Step 2] 🧠 Analyzing Intent...")
-    analyst = SpecAnalyst()
-    analyst.run()
-
-    # 3. ARCHITECT
-    print("\n[Step 3] 🏗️  Drafting R Code...")
-    architect = RArchitect(project_root=target_dir) 
-    architect.run()
-
-    # [Step 4] Optimizing & Testing...
-    # The Optimizer now handles "Mid-Stage Verification" internally per file
-    print("\n[Step 4] 🔧 Optimizing & Testing (With Safety Latch)...")
-    optimizer = CodeOptimizer(project_root=target_dir)
-    optimizer.run(force_all=force_optimize)
-    
+    manager = ManifestManager(syntax_dir, backend=manifest_backend, workers=scan_workers)
+    if resume and manager.store.exists():
+        # Rescanning would reset the status of any file edited since; keep the interrupted run's view
+        print(f"   ⏯️  Resuming from {manager.manifest_path}")
+    else:
+        manager.generate_manifest()
+
+    # 2-4. PER-FILE PIPELINE
+    # Each file moves through Analyst -> Architect -> Optimizer -> QA on its own,
+    # so one slow file no longer holds every other file at a stage barrier
+    llm_workers = llm_workers or get_client().concurrency
+    print(f"\n[Step 2-4] 🧠🏗️🔧🧪 Analyse -> Draft -> Optimize -> Test per file "
+          f"({llm_workers} LLM workers, {r_workers} R workers)...")
+    # Paths, manifest, schema, glossary and package list: resolved and read once for every stage
+    context = PipelineContext(target_dir, manifest_path=manager.manifest_path, store=manager.store)
+    manifest = context.manifest
+    tracker = BuildTracker(manager.store, manifest, rebuild=rebuild, resume=resume)
+    scheduler = PipelineScheduler(
+        build_stages(context, tracker, force_optimize, model=model), workers={LLM: llm_workers, R: r_workers}, tracker=tracker
+    )
+    outcomes = scheduler.run(manifest)
+    for index, outcome in outcomes.items():
+        tracker.set_status(manifest[index], "done" if outcome == "done" else f"failed:{outcome}")
+    tracker.save()
+    build = tracker.stats()
+    if build:
+        print("♻️  Incremental build (stages run / skipped as unchanged):")
+        for stage in ("analyse", "architect", "optimize", "qa", "test"):
+            if stage in build:
+                print(f"   {stage:<10} built={build[stage]['built']:<5} skipped={build[stage]['skipped']}")
+
+    sched = scheduler.stats()
+    print(f"⏱️  Pipeline wall time {sched['wall_seconds']:.1f}s "
+          f"(critical path {sched['critical_path_seconds']:.1f}s, "
+          f"stage barriers would take ~{sched['barrier_seconds']:.1f}s)")
+    if sched['stopped']:
+        print("\n⚠️ WARNING: Some files did not complete the pipeline:")
+        for index, stage in sorted(sched['stopped'].items()):
+            print(f"   {manifest[index]['r_function_name']:<32} stopped at {stage}")
+
     # [Step 4.2] Packaging...
     print("\n[Step 4.2] 📦 Packaging...")
     pm = PackageManager(target_dir) 
     pm.generate_description()
-
-    # [Step 4.5] QA Engineering...
-    print("\n[Step 4.5] 🧪 QA Engineering (Comprehensive Unit Tests)...")
-    qa = QAEngineer()
-    qa_passed = qa.run()
-    
-    if not qa_passed:
-        print("\n⚠️ WARNING: Some Unit Tests Failed.")
+    context.invalidate("package_libs")
 
     # 5. CONTROLLER
     print("\n[Step 5] 🎛️  Building Main Controller...")
-    controller = PipelineController()
+    controller = PipelineController(context=context)
     controller.generate_main()
 
+    stats = get_client().pool_stats()
+    print(f"\n🔌 LLM Connections: {stats['connections_opened']} opened for {stats['requests']} requests "
+          f"(reuse rate {stats['reuse_rate']:.0%})")
+
+    endpoint_stats = get_client().endpoint_pool.stats()
+    if len(endpoint_stats) > 1:
+        print("🖥️  LLM Endpoints:")
+        for ep in endpoint_stats:
+            latency = f"{ep['latency']:.1f}s" if ep['latency'] is not None else "n/a"
+            state = {"closed": "up", "half-open": "TRIAL"}.get(ep['state'], "DOWN")
+            print(f"   {ep['endpoint']:<32} {state:<5} requests={ep['requests']:<5} "
+                  f"failures={ep['failures']:<3} latency={latency}")
+
+    if get_client().retries:
+        print(f"🔁 Retried {get_client().retries} LLM requests after transient failures")
+
+    if get_client().single_flight.coalesced:
+        print(f"🔗 Coalesced {get_client().single_flight.coalesced} duplicate in-flight LLM requests")
+
+    if get_client().continuations:
+        print(f"✂️  Continued {get_client().continuations} truncated LLM responses "
+              f"({get_client().truncated_responses} still cut off)")
+
+    telemetry = get_client().telemetry.summary()
+    if telemetry:
+        print("📈 LLM Telemetry:")
+        print(f"   {'stage':<12} {'calls':>5} {'p50':>7} {'p95':>7} {'prompt tok':>10} {'output tok':>10} {'tok/s':>7}")
+        for stage, t in sorted(telemetry.items()):
+            print(f"   {stage:<12} {t['calls']:>5} {t['p50_latency']:>6.1f}s {t['p95_latency']:>6.1f}s "
+                  f"{t['prompt_tokens']:>10} {t['output_tokens']:>10} {t['tokens_per_second']:>7.1f}")
+    if prometheus_path:
+        get_client().telemetry.write_prometheus(prometheus_path)
+        print(f"   Prometheus metrics written to {prometheus_path}")
+
+    timings = get_client().timings.stats()
+    if timings:
+        print("⏱️  Model time (load vs generate):")
+        for stage, t in sorted(timings.items()):
+            print(f"   {stage:<12} calls={t['calls']:<5} cold_loads={t['cold_loads']:<3} "
+                  f"load={t['load_seconds']:.1f}s generate={t['generate_seconds']:.1f}s")
+
+    cache = get_client().cache
+    if cache is not None:
+        print("🗃️  LLM Cache:")
+        for stage, counts in sorted(cache.stats().items()):
+            print(f"   {stage:<12} hits={counts['hits']:<5} misses={counts['misses']}")
+
+    if get_client().streaming:
+        ss = get_client().stream_stats.summary()
+        print(f"📡 Streaming: {ss['streams']} streams, avg first token {ss['avg_ttft']:.2f}s, "
+              f"{ss['early_stops']} stopped early (up to {ss['tokens_saved']} tokens saved)")
+
     print("\n✅ MIGRATION PIPELINE COMPLETE.")
     print(f"👉 Run: Rscript {target_dir}/main.R")
 
@@ -61,8 +207,89 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run the SPSS to R Migration Pipeline")
     parser.add_argument("--target", default="~/git/dummy_spss_repo", help="Path to target repo")
     parser.add_argument("--force", action="store_true", help="Force re-optimization even if lint is clean")
+    parser.add_argument("--endpoint", action="append", default=None,
+                        help="Ollama server URL; repeat to load-balance across several boxes")
+    parser.add_argument("--fake-ollama", metavar="LATENCY", nargs="?", const="lognormal:0.5:0.4", default=None,
+                        help="Benchmark against an in-process fake Ollama (optional latency spec, see fake_ollama_server)")
+    parser.add_argument("--fake-tokens-per-sec", type=float, default=40.0, help="Generation speed of the fake server")
+    parser.add_argument("--model", action="append", default=None,
+                        help=f"Model every stage asks (default: {DEFAULT_MODEL}); repeat to preload extra models, "
+                             "the first one does the work")
+    parser.add_argument("--keep-alive", default=DEFAULT_KEEP_ALIVE,
+                        help="How long Ollama keeps models resident between calls (e.g. 30m, -1 for forever)")
+    parser.add_argument("--no-warmup", action="store_true", help="Skip preloading models at pipeline start")
+    parser.add_argument("--pool-size", type=int, default=10, help="Max keep-alive connections to the Ollama server")
+    parser.add_argument("--connect-timeout", type=float, default=5, help="Seconds to wait for an LLM connection")
+    parser.add_argument("--read-timeout", type=float, default=120,
+                        help="Minimum seconds to wait for an LLM response (grows with prompt and output size)")
+    parser.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES,
+                        help="Retries per LLM request after a timeout, reset or 5xx (jittered backoff)")
+    parser.add_argument("--concurrency", type=int, default=None, help="Parallel LLM requests per stage (default: $OLLAMA_NUM_PARALLEL or 1)")
+    parser.add_argument("--llm-workers", type=int, default=None,
+                        help="Files in LLM-bound stages at once (default: --concurrency)")
+    parser.add_argument("--r-workers", type=int, default=DEFAULT_R_WORKERS,
+                        help="Files in R-bound stages (optimize, unit tests) at once")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="Redo every stage for every file, ignoring the content hashes in the manifest")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue an interrupted run from its last committed step instead of rescanning")
+    parser.add_argument("--scan-workers", type=int, default=DEFAULT_SCAN_WORKERS,
+                        help="Threads reading and processes parsing .sps files during the dependency scan (1: sequential)")
+    parser.add_argument("--manifest-backend", choices=BACKENDS, default=None,
+                        help="Keep the manifest in JSON or in SQLite (WAL, row-level updates); "
+                             "default: SQLite if migration_manifest.db exists")
+    parser.add_argument("--stream", action="store_true", help="Stream responses and stop once the code block is complete")
+    parser.add_argument("--cache-dir", default=None, help="LLM response cache (default: <target>/.llm_cache)")
+    parser.add_argument("--cache-max-mb", type=int, default=512, help="Evict least recently used responses beyond this size")
+    parser.add_argument("--cache-read-only", action="store_true", help="Serve cached responses but never write (CI)")
+    parser.add_argument("--telemetry", default=None,
+                        help="Per-call LLM metrics as JSONL (default: <target>/llm_telemetry.jsonl)")
+    parser.add_argument("--prometheus-textfile", default=None,
+                        help="Also write LLM metrics in Prometheus text format to this path")
+    parser.add_argument("--no-cache", action="store_true", help="Always ask the model, ignoring the response cache")
     
     args = parser.parse_args()
     target_path = os.path.expanduser(args.target)
-    
-    run_full_migration(target_path, force_optimize=args.force)
\ No newline at end of file
+
+    fake = None
+    if args.fake_ollama:
+        fake = FakeOllamaServer(("127.0.0.1", 0), latency=args.fake_ollama,
+                                tokens_per_sec=args.fake_tokens_per_sec).start()
+        args.endpoint = [f"{fake.url}/api/generate"]
+        print(f"🧪 Using fake Ollama at {fake.url} (latency {args.fake_ollama}, {args.fake_tokens_per_sec} tok/s)")
+
+    cache = None
+    if not args.no_cache:
+        cache = ResponseCache(
+            args.cache_dir or os.path.join(target_path, ".llm_cache"),
+            max_bytes=args.cache_max_mb * 1024 * 1024,
+            read_only=args.cache_read_only
+        )
+    configure_client(
+        pool_size=args.pool_size,
+        connect_timeout=args.connect_timeout,
+        read_timeout=args.read_timeout,
+        cache=cache,
+        concurrency=args.concurrency or DEFAULT_CONCURRENCY,
+        streaming=args.stream,
+        endpoints=args.endpoint,
+        keep_alive=args.keep_alive,
+        telemetry=Telemetry(args.telemetry or os.path.join(target_path, "llm_telemetry.jsonl")),
+        max_retries=args.max_retries
+    )
+
+    models = args.model or [DEFAULT_MODEL]
+    warm_models = None if args.no_warmup else models
+    run_full_migration(
+        target_path, force_optimize=args.force, warm_models=warm_models,
+        prometheus_path=args.prometheus_textfile,
+        llm_workers=args.llm_workers, r_workers=args.r_workers, rebuild=args.rebuild,
+        resume=args.resume,
+        manifest_backend=args.manifest_backend,
+        scan_workers=args.scan_workers,
+        model=models[0]
+    )
+
+    if fake is not None:
+        print(f"🧪 Fake Ollama: {fake.stats()}")
+        fake.stop()
\ No newline at end of file
@@ -1,7 +1,7 @@
 import json
 import os
 import logging
-from src.utils.ollama_client import get_ollama_response
+from src.utils.async_ollama_client import request_all
 from src.converter.prompts import (
     SYSTEM_PROMPT,
     VALUE_LABEL_TEMPLATE,
@@ -82,19 +82,29 @@ def process_conversion(input_file, output_file):
     tasks = generate_translation_tasks(r_data)
     logger.info(f"Generated {len(tasks)} tasks from {len(r_data)} functions.")
 
-    # 4. Run LLM & Stream Output
-    # We write line-by-line (jsonl) so we don't lose progress if it crashes.
+    # 4. Run LLM (one batch; lines are written in completion order)
+    for i, task in enumerate(tasks):
+        logger.info(f"Queueing {i+1}/{len(tasks)}: {task['id']} [{task['type']}]")
+
+    requests = [
+        {
+            "prompt": task['prompt'],
+            "json_mode": task.get('json_mode', False),
+            # Translations are a single code block; stop streaming once it closes
+            "stop_at_code": not task.get('json_mode', False),
+            "tag": {"function": task['id'], "task": task['type']}
+        }
+        for task in tasks
+    ]
+
+    # 5. Write Output
+    # Each JSONL line is written and flushed as its result arrives, so a crash
+    # mid-batch keeps everything that had already finished.
     os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    
-    with open(output_file, 'w') as outfile:
-        for i, task in enumerate(tasks):
-            logger.info(f"Processing {i+1}/{len(tasks)}: {task['id']} [{task['type']}]")
-
-            response = get_ollama_response(
-                prompt=task['prompt'], 
-                json_mode=task.get('json_mode', False)
-            )
 
+    with open(output_file, 'w') as outfile:
+        def write_result(index, response):
+            task = tasks[index]
             if response:
                 result = {
                     "function_name": task['id'],
@@ -104,9 +114,12 @@ def process_conversion(input_file, output_file):
                 }
                 json.dump(result, outfile)
                 outfile.write('\n')
+                outfile.flush()
             else:
                 logger.warning(f"Skipping {task['id']} due to LLM error.")
 
+        request_all(requests, stage="converter", on_result=write_result)
+
     logger.info(f"Processing complete. Results saved to {output_file}")
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 import os
 import pandas as pd
 from src.utils.ollama_client import get_ollama_response
+from src.utils.spss_compactor import compact_spss
 
 SYSTEM_PROMPT = """
 You are an Expert R Developer migrating legacy SPSS code to the Tidyverse.
@@ -26,8 +27,10 @@ class SPSSMigrationAgent:
             print("[WARNING] Rosetta Stone not found. Relying on LLM knowledge.")
 
     def migrate_file(self, sps_path, output_dir):
+        # Comments and blank lines only: the generated R needs every data row and label
         with open(sps_path, 'r') as f:
-            spss_code = f.read()
+            compacted = compact_spss(f.read(), data_preview=None, max_label_lines=None)
+        spss_code = compacted.text
 
         filename = os.path.basename(sps_path).replace('.sps', '.R')
         
@@ -39,8 +42,11 @@ class SPSSMigrationAgent:
             f"OUTPUT:\nProvide ONLY the R code. Do not include markdown ticks."
         )
 
-        print(f"Migrating {filename}...")
-        r_code = get_ollama_response(prompt)
+        print(f"Migrating {filename}... ({compacted.summary()})")
+        r_code = get_ollama_response(prompt, stage="converter", stop_at_code=True)
+        if r_code is None:
+            print(f"⚠️ Skipping {filename} (LLM request failed)")
+            return
         
         # Cleanup Markdown
         if "```r" in r_code:
@@ -1,7 +1,14 @@
 import os
 import re
-import json
-from src.utils.ollama_client import get_ollama_response
+from src.utils.ollama_client import DEFAULT_MODEL
+from src.utils.async_ollama_client import request_all
+from src.utils.spss_compactor import compact_spss
+from src.utils.spss_chunker import chunk_spss, DEFAULT_CHUNK_TOKENS
+from src.utils.llm_budget import estimate_tokens
+from src.utils.manifest_store import load_manifest
+from src.utils.spss_ir import load_ir, ir_units
+from src.utils.build_tracker import file_hash
+from src.utils.spss_macros import MacroTable, MacroExpander
 
 # --- 1. THE AGGRESSIVE PROMPT ---
 ANALYST_PROMPT = """
@@ -25,14 +32,53 @@ Your goal is to extract the **Business Intent**, NOT the Implementation Detail.
 Provide the Markdown Specification including the Mermaid block.
 """
 
+# Prepended to ANALYST_PROMPT when a file is too big for one request
+CHUNK_NOTE = """
+### NOTE: PARTIAL SOURCE
+This is part {part} of {parts} (original lines {first}-{last}) of one SPSS script.
+Describe only what this part does. Variables it uses without creating them come from earlier parts.
+"""
+
+# --- 2. THE REDUCE PROMPT (oversized files) ---
+ANALYST_MERGE_PROMPT = """
+You are a Technical Business Analyst.
+Below are partial specifications, in source order, for consecutive parts of ONE SPSS script.
+Merge them into a single specification.
+
+### INSTRUCTIONS:
+1. **Text Specification:** One Data Dictionary (each variable once) and one High-Level Logic section, in execution order.
+2. **Visual Logic (Mermaid):** ONE flowchart covering the whole script.
+   - **MANDATORY SYNTAX:** Quote all labels (e.g., `A["Parse Date"]`).
+3. Drop statements that only say a variable "comes from an earlier part".
+
+### PARTIAL SPECIFICATIONS:
+{partial_specs}
+
+### OUTPUT FORMAT:
+Provide the Markdown Specification including the Mermaid block.
+"""
+
 class SpecAnalyst:
-    def __init__(self, manifest_path="migration_manifest.json"):
-        self.manifest_path = os.path.abspath(manifest_path)
-        # Fallback logic
-        if not os.path.exists(self.manifest_path):
-             self.manifest_path = os.path.expanduser("~/git/dummy_spss_repo/migration_manifest.json")
-        
-        self.repo_root = os.path.dirname(os.path.dirname(self.manifest_path))
+    def __init__(self, manifest_path="migration_manifest.json", chunk_tokens=DEFAULT_CHUNK_TOKENS, context=None,
+                 macros=None, model=DEFAULT_MODEL):
+        self.model = model
+        self.context = context  # Shared PipelineContext: known paths, manifest read once per run
+        if context is not None:
+            self.manifest_path = context.manifest_path
+            self.repo_root = context.project_root
+        else:
+            self.manifest_path = os.path.abspath(manifest_path)
+            # Fallback logic
+            if not os.path.exists(self.manifest_path):
+                 self.manifest_path = os.path.expanduser("~/git/dummy_spss_repo/migration_manifest.json")
+
+            self.repo_root = os.path.dirname(os.path.dirname(self.manifest_path))
+        # r_function_name -> CompactedSource; its line_map traces spec details back to the .sps
+        self.compacted = {}
+        # Files whose compacted source exceeds this are analysed chunk by chunk
+        self.chunk_tokens = chunk_tokens
+        # MacroExpander: macro calls reach the model expanded (set from the manifest by analyze_entries)
+        self.macros = macros
 
     def repair_mermaid(self, text):
         """Regex brute-force to ensure Mermaid labels are quoted."""
@@ -41,24 +87,116 @@ class SpecAnalyst:
         text = re.sub(r'\{\{\s*(?!")([^\}]+?)\s*\}\}', r'{{"\1"}}', text)
         return text
 
-    def analyze_file(self, entry):
+    def build_prompt(self, entry):
+        """Returns the Analyst prompt for a manifest entry, or None if the source is missing."""
+        prompts = self.build_prompts(entry)
+        return prompts[0] if prompts else None
+
+    def build_prompts(self, entry):
+        """
+        Map step: one Analyst prompt per chunk of the entry's source (a single
+        prompt unless the file is bigger than `chunk_tokens`), or None if the
+        source is missing.
+        """
         legacy_path = entry['legacy_file']
-        spec_path = entry['spec_file']
         func_name = entry['r_function_name']
         
         # Skip if legacy file is missing
         if not os.path.exists(legacy_path):
             print(f"⚠️  Skipping {func_name}: Source file not found ({legacy_path})")
-            return
+            return None
 
-        print(f"Analyzing {entry['legacy_name']} -> {os.path.basename(spec_path)}...")
-        
         with open(legacy_path, 'r', errors='ignore') as f:
             code = f.read()
-            
-        prompt = ANALYST_PROMPT.format(spss_code=code)
-        raw_response = get_ollama_response(prompt)
-        
+
+        expanded = self.macros.expand_source(code) if self.macros is not None else None
+        if expanded is not None:
+            print(f"   🧬 {func_name}: {expanded.calls} macro calls expanded")
+            code = expanded.text
+
+        compacted = compact_spss(code)
+        if expanded is not None:
+            # Trace compacted lines through the expansion back to the .sps
+            compacted.line_map = [expanded.source_line(line) for line in compacted.line_map]
+        self.compacted[func_name] = compacted
+        print(f"   ✂️  {entry.get('legacy_name', func_name)}: {compacted.summary()}")
+        if compacted.compact_tokens <= self.chunk_tokens:
+            return [ANALYST_PROMPT.format(spss_code=compacted.text)]
+
+        # Cut along the manifest's command IR when it is current, rather than re-splitting the text
+        nodes = load_ir(entry.get('ir_file'), file_hash(legacy_path)) if entry.get('ir_file') else None
+        units = ir_units(nodes, compacted.line_map) if nodes else None
+        chunks = chunk_spss(compacted.text, self.chunk_tokens, units=units)
+        print(f"   🧩 {func_name}: {compacted.compact_tokens} tokens, analysing in {len(chunks)} chunks")
+        return [
+            CHUNK_NOTE.format(
+                part=chunk.index + 1, parts=len(chunks),
+                first=compacted.source_line(chunk.first_line),
+                last=compacted.source_line(chunk.last_line)
+            ) + ANALYST_PROMPT.format(spss_code=chunk.text)
+            for chunk in chunks
+        ]
+
+    def merge_groups(self, partials):
+        """Groups consecutive partial specs so each merge prompt fits in `chunk_tokens`."""
+        groups, current, tokens = [], [], 0
+        for spec in partials:
+            size = estimate_tokens(spec)
+            if len(current) >= 2 and tokens + size > self.chunk_tokens:
+                groups.append(current)
+                current, tokens = [], 0
+            current.append(spec)
+            tokens += size
+        groups.append(current)
+        return groups
+
+    def merge_prompt(self, partials):
+        sections = [f"#### Part {i}\n{spec.strip()}" for i, spec in enumerate(partials, start=1)]
+        return ANALYST_MERGE_PROMPT.format(partial_specs="\n\n".join(sections))
+
+    def reduce_all(self, jobs):
+        """
+        Reduce step: merges each entry's partial specs until one is left.
+
+        Merge prompts for every entry go out as one batch per round; more
+        than one round is only needed when the partials of an entry don't
+        fit in a single merge prompt.
+
+        Args:
+            jobs (list): (entry, [partial spec, ...]) pairs.
+        """
+        while any(len(partials) > 1 for _, partials in jobs):
+            plan = []
+            for n, (entry, partials) in enumerate(jobs):
+                if len(partials) > 1:
+                    plan.extend((n, group) for group in self.merge_groups(partials))
+            to_send = [(n, group) for n, group in plan if len(group) > 1]
+
+            print(f"   🔗 Merging partial specs ({len(to_send)} merge requests)...")
+            merged = iter(request_all(
+                [self.merge_prompt(group) for _, group in to_send],
+                stage="analyst",
+                model=self.model,
+                tags=[{"function": jobs[n][0]['r_function_name'], "part": "merge"} for n, _ in to_send]
+            ))
+            next_round = {}
+            for n, group in plan:
+                if len(group) == 1:
+                    result = group[0]
+                else:
+                    # A failed merge keeps the parts side by side rather than losing them
+                    result = next(merged) or "\n\n".join(group)
+                next_round.setdefault(n, []).append(result)
+            jobs = [(entry, next_round.get(n, partials)) for n, (entry, partials) in enumerate(jobs)]
+        return jobs
+
+    def save_spec(self, entry, raw_response):
+        """Writes the spec; returns False (leaving any old spec alone) if the LLM request failed."""
+        spec_path = entry['spec_file']
+        if raw_response is None:
+            print(f"   ⚠️ No spec for {entry['r_function_name']} (LLM request failed); skipping.")
+            return False
+
         # Apply the safety net
         clean_response = self.repair_mermaid(raw_response)
         
@@ -69,18 +207,76 @@ class SpecAnalyst:
             f.write(clean_response)
             
         print(f"   ✅ Spec saved to {spec_path}")
+        return True
+
+    def analyze_file(self, entry):
+        """Returns True only if a new spec was written for this entry."""
+        return self.analyze_entries([entry])[0]
+
+    def load_macros(self, entries):
+        """
+        The repository's macros, read once: from the shared context, else from
+        every file in the manifest (or `entries` if there is no manifest).
+        """
+        if self.macros is None:
+            if self.context is not None:
+                self.macros = self.context.macros
+            else:
+                if os.path.exists(self.manifest_path):
+                    entries = load_manifest(self.manifest_path)
+                paths = [e['legacy_file'] for e in entries if os.path.exists(e.get('legacy_file', ''))]
+                self.macros = MacroExpander(MacroTable.from_paths(paths))
+        return self.macros
+
+    def analyze_entries(self, entries):
+        """
+        Map (every chunk of every file in one batch), reduce, then save one spec per file.
+
+        Returns:
+            list: One bool per entry, True if its spec was written by this call.
+        """
+        self.load_macros(entries)
+        jobs = []
+        for entry in entries:
+            prompts = self.build_prompts(entry)
+            if prompts is not None:
+                jobs.append((entry, prompts))
+
+        prompts, tags = [], []
+        for entry, entry_prompts in jobs:
+            for part, prompt in enumerate(entry_prompts, start=1):
+                tag = {"function": entry['r_function_name']}
+                if len(entry_prompts) > 1:
+                    tag["part"] = part
+                prompts.append(prompt)
+                tags.append(tag)
+        responses = iter(request_all(prompts, stage="analyst", model=self.model, tags=tags))
+
+        partial_jobs = []
+        for entry, entry_prompts in jobs:
+            partials = [next(responses) for _ in entry_prompts]
+            if len(partials) > 1:
+                failed = partials.count(None)
+                if failed:
+                    print(f"   ⚠️ {failed}/{len(partials)} chunks of {entry['r_function_name']} failed; spec will be partial.")
+                partials = [p for p in partials if p is not None] or [None]
+            partial_jobs.append((entry, partials))
+
+        saved = {}
+        for entry, (raw_response,) in self.reduce_all(partial_jobs):
+            print(f"Analyzing {entry['legacy_name']} -> {os.path.basename(entry['spec_file'])}...")
+            saved[id(entry)] = self.save_spec(entry, raw_response)
+        return [saved.get(id(entry), False) for entry in entries]
 
     def run(self):
         if not os.path.exists(self.manifest_path):
             print(f"❌ Manifest not found at {self.manifest_path}. Run manifest_manager first.")
             return
 
-        with open(self.manifest_path, 'r') as f:
-            manifest = json.load(f)
+        manifest = self.context.manifest if self.context is not None else load_manifest(self.manifest_path)
 
         print(f"--- Running Analyst on {len(manifest)} files from Manifest ---")
-        for entry in manifest:
-            self.analyze_file(entry)
+        self.analyze_entries(manifest)
 
 if __name__ == "__main__":
     analyst = SpecAnalyst()
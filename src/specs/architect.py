@@ -1,90 +1,119 @@
-import json
 import os
-import csv
-from src.utils.ollama_client import get_ollama_response
+from src.utils.ollama_client import DEFAULT_MODEL
+from src.utils.async_ollama_client import request_all
 from src.specs.prompts import ARCHITECT_PROMPT  # <--- IMPORT FROM REGISTRY
+from src.utils.manifest_store import load_manifest
+from src.utils.pipeline_context import read_schema, read_glossary
 
 class RArchitect:
-    def __init__(self, manifest_path="migration_manifest.json", project_root=None):
-        self.manifest_path = os.path.abspath(manifest_path)
-        
-        if not os.path.exists(self.manifest_path):
-             self.manifest_path = os.path.expanduser("~/git/dummy_spss_repo/migration_manifest.json")
-        
-        if project_root:
-            self.repo_root = os.path.abspath(project_root)
+    def __init__(self, manifest_path="migration_manifest.json", project_root=None, context=None, model=DEFAULT_MODEL):
+        self.model = model
+        self.context = context  # Shared PipelineContext: known paths, inputs read once per run
+        if context is not None:
+            self.manifest_path = context.manifest_path
+            self.repo_root = context.project_root
         else:
-            self.repo_root = os.path.dirname(os.path.dirname(self.manifest_path))
+            self.manifest_path = os.path.abspath(manifest_path)
 
-    def get_schema(self):
-        csv_path = os.path.join(self.repo_root, "input_data.csv")
-        
-        if not os.path.exists(csv_path):
-            if os.path.exists("input_data.csv"):
-                 csv_path = "input_data.csv"
+            if not os.path.exists(self.manifest_path):
+                 self.manifest_path = os.path.expanduser("~/git/dummy_spss_repo/migration_manifest.json")
+
+            if project_root:
+                self.repo_root = os.path.abspath(project_root)
             else:
-                return f"(No input_data.csv found at {csv_path} - strictly follow spec)"
-        
-        try:
-            with open(csv_path, 'r') as f:
-                reader = csv.reader(f)
-                headers = next(reader)
-                return ", ".join([f"`{h}`" for h in headers])
-        except Exception as e:
-            return "(Error reading CSV header)"
+                self.repo_root = os.path.dirname(os.path.dirname(self.manifest_path))
+        self._prompt_inputs = None  # (schema, glossary), read once for per-file drafting
+
+    def get_schema(self):
+        if self.context is not None:
+            return self.context.schema
+        return read_schema(self.repo_root)
 
     def load_glossary(self):
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        glossary_path = os.path.join(current_dir, "..", "knowledge", "glossary.csv")
-        
-        if not os.path.exists(glossary_path):
-            return "(No glossary found)"
-        with open(glossary_path, 'r') as f:
-            return f.read()
+        if self.context is not None:
+            return self.context.glossary
+        return read_glossary()
+
+    def build_prompt(self, entry, schema_str, glossary_str):
+        """Returns the Architect prompt for a manifest entry, or None if it can't be built."""
+        spec_path = entry['spec_file']
+        if not os.path.exists(spec_path): return None
+            
+        with open(spec_path, 'r') as f: spec_content = f.read()
+
+        try:
+            # Use the imported ARCHITECT_PROMPT
+            return ARCHITECT_PROMPT.format(
+                target_name=entry['r_function_name'],
+                spec_content=spec_content,
+                columns=schema_str,
+                glossary=glossary_str
+            )
+        except KeyError:
+            return None
+
+    def save_code(self, entry, r_code):
+        if r_code is None:
+            # Leave any earlier draft in place rather than overwrite it with nothing
+            print(f"   ⚠️ No response for {entry['r_function_name']} (LLM request failed); skipping.")
+            return
+        clean_code = r_code.strip()
+        if "```r" in clean_code: 
+            clean_code = clean_code.split("```r")[1].split("```")[0]
+        elif "```" in clean_code: 
+            clean_code = clean_code.split("```")[1].split("```")[0]
+
+        target_path = entry['r_file']
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        with open(target_path, 'w') as f:
+            f.write(clean_code.strip())
+        print(f"   ✅ Saved to {target_path}")
+
+
+    def architect_file(self, entry):
+        """Drafts one entry on its own (used by the per-file pipeline scheduler)."""
+        if self._prompt_inputs is None:
+            self._prompt_inputs = (self.get_schema(), self.load_glossary())
+        prompt = self.build_prompt(entry, *self._prompt_inputs)
+        if prompt is None:
+            print(f"   ⚠️ Skipping {entry['r_function_name']} (No spec)")
+            return False
+        print(f"🏛️  Architecting {entry['r_function_name']}...")
+        r_code = request_all(
+            [prompt], model=self.model, stage="architect", stop_at_code=True,
+            tags=[{"function": entry['r_function_name']}]
+        )[0]
+        self.save_code(entry, r_code)
+        return r_code is not None
 
     def run(self):
         if not os.path.exists(self.manifest_path):
             print(f"❌ Manifest not found at {self.manifest_path}")
             return
 
-        with open(self.manifest_path, 'r') as f:
-            manifest = json.load(f)
+        manifest = self.context.manifest if self.context is not None else load_manifest(self.manifest_path)
 
         schema_str = self.get_schema()
         glossary_str = self.load_glossary()
         print(f"📊 Detected Schema: {schema_str}")
 
+        jobs = []
         for entry in manifest:
             if entry.get('role') == 'controller': continue
+            prompt = self.build_prompt(entry, schema_str, glossary_str)
+            if prompt is not None:
+                jobs.append((entry, prompt))
+
+        responses = request_all(
+            [prompt for _, prompt in jobs],
+            model=self.model,
+            stage="architect",
+            stop_at_code=True,
+            tags=[{"function": entry['r_function_name']} for entry, _ in jobs]
+        )
+        for (entry, _), r_code in zip(jobs, responses):
             print(f"🏛️  Architecting {entry['r_function_name']}...")
-            
-            spec_path = entry['spec_file']
-            if not os.path.exists(spec_path): continue
-                
-            with open(spec_path, 'r') as f: spec_content = f.read()
-
-            try:
-                # Use the imported ARCHITECT_PROMPT
-                prompt = ARCHITECT_PROMPT.format(
-                    target_name=entry['r_function_name'],
-                    spec_content=spec_content,
-                    columns=schema_str,
-                    glossary=glossary_str
-                )
-            except KeyError: continue
-            
-            r_code = get_ollama_response(prompt)
-            clean_code = r_code.strip()
-            if "```r" in clean_code: 
-                clean_code = clean_code.split("```r")[1].split("```")[0]
-            elif "```" in clean_code: 
-                clean_code = clean_code.split("```")[1].split("```")[0]
-
-            target_path = entry['r_file']
-            os.makedirs(os.path.dirname(target_path), exist_ok=True)
-            with open(target_path, 'w') as f:
-                f.write(clean_code.strip())
-            print(f"   ✅ Saved to {target_path}")
+            self.save_code(entry, r_code)
 
 if __name__ == "__main__":
     architect = RArchitect()
@@ -1,14 +1,20 @@
 import os
-import json
+from src.utils.manifest_store import load_manifest
 
 class PipelineController:
-    def __init__(self, manifest_path="migration_manifest.json"):
+    def __init__(self, manifest_path="migration_manifest.json", context=None):
+        if context is not None:
+            self.manifest_path = context.manifest_path
+            self.manifest = context.manifest
+            self.repo_root = context.project_root
+            self.output_path = os.path.join(self.repo_root, "main.R")
+            return
+
         self.manifest_path = os.path.abspath(manifest_path)
         if not os.path.exists(self.manifest_path):
             self.manifest_path = os.path.expanduser("~/git/dummy_spss_repo/migration_manifest.json")
             
-        with open(self.manifest_path, 'r') as f:
-            self.manifest = json.load(f)
+        self.manifest = load_manifest(self.manifest_path)
 
         # Derive repo root from the first file path in manifest
         first_r = self.manifest[0]['r_file']
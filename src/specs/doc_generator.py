@@ -5,29 +5,39 @@ import textwrap # <--- NEW IMPORT
 # Ensure project root is in path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
-import json
 from src.utils.ollama_client import get_ollama_response
+from src.utils.async_ollama_client import request_all
 from src.utils.mermaid import MermaidBuilder
+from src.utils.spss_compactor import compact_spss
 from src.specs.prompts import DOC_SUMMARY_PROMPT, DOC_FLOW_PROMPT
+from src.utils.manifest_store import load_manifest
 
 class DocumentationEngine:
-    def __init__(self, manifest_path="migration_manifest.json"):
-        self.manifest_path = os.path.abspath(manifest_path)
-        if not os.path.exists(self.manifest_path):
-             self.manifest_path = os.path.join(os.getcwd(), "migration_manifest.json")
-            
-        self.repo_root = os.path.dirname(self.manifest_path)
+    def __init__(self, manifest_path="migration_manifest.json", context=None):
+        self.context = context  # Shared PipelineContext: known paths, manifest read once per run
+        if context is not None:
+            self.manifest_path = context.manifest_path
+            self.repo_root = context.project_root
+        else:
+            self.manifest_path = os.path.abspath(manifest_path)
+            if not os.path.exists(self.manifest_path):
+                 self.manifest_path = os.path.join(os.getcwd(), "migration_manifest.json")
+
+            self.repo_root = os.path.dirname(self.manifest_path)
         self.docs_dir = os.path.join(self.repo_root, "docs")
         os.makedirs(self.docs_dir, exist_ok=True)
 
     def generate_text(self, spss_code):
-        prompt = DOC_SUMMARY_PROMPT.format(code=spss_code)
-        return get_ollama_response(prompt).strip()
+        prompt = DOC_SUMMARY_PROMPT.format(code=compact_spss(spss_code).text)
+        return (get_ollama_response(prompt, stage="docs") or "").strip()
 
     def generate_diagram(self, spss_code, title):
-        prompt = DOC_FLOW_PROMPT.format(code=spss_code)
-        response = get_ollama_response(prompt).strip()
-        
+        prompt = DOC_FLOW_PROMPT.format(code=compact_spss(spss_code).text)
+        response = (get_ollama_response(prompt, stage="docs") or "").strip()
+        return self.build_diagram(response, title)
+
+    def build_diagram(self, response, title):
+        """Turns the 'id | label | type' lines of a DOC_FLOW_PROMPT response into Mermaid."""
         mb = MermaidBuilder(title)
         
         lines = response.split('\n')
@@ -61,6 +71,7 @@ class DocumentationEngine:
             
         return mb.generate_script()
 
+
     def run(self):
         print(f"📚 Starting Documentation Engine...")
         print(f"   📂 Manifest: {self.manifest_path}")
@@ -70,9 +81,9 @@ class DocumentationEngine:
             print("   ❌ Manifest not found! Run migration first.")
             return
 
-        with open(self.manifest_path, 'r') as f:
-            manifest = json.load(f)
+        manifest = self.context.manifest if self.context is not None else load_manifest(self.manifest_path)
             
+        jobs = []
         for entry in manifest:
             func_name = entry.get('r_function_name', 'unnamed_function')
             
@@ -91,15 +102,32 @@ class DocumentationEngine:
             if not os.path.exists(spss_file):
                 print(f"   ⚠️ Skipping {func_name} (File not found on disk: {spss_file})")
                 continue
-                
+
+            try:
+                with open(spss_file, 'r') as f:
+                    compacted = compact_spss(f.read())
+                print(f"   ✂️  {func_name}: {compacted.summary()}")
+                jobs.append((entry, func_name, spss_file, compacted.text))
+            except Exception as e:
+                print(f"      ❌ Failed to document {func_name}: {e}")
+
+        # Both prompts for every file go out as one batch: summaries first, then flows
+        prompts = [DOC_SUMMARY_PROMPT.format(code=code) for _, _, _, code in jobs]
+        prompts += [DOC_FLOW_PROMPT.format(code=code) for _, _, _, code in jobs]
+        tags = [{"function": func_name, "part": "summary"} for _, func_name, _, _ in jobs]
+        tags += [{"function": func_name, "part": "flow"} for _, func_name, _, _ in jobs]
+        responses = request_all(prompts, stage="docs", tags=tags)
+        summaries, flows = responses[:len(jobs)], responses[len(jobs):]
+
+        for (entry, func_name, spss_file, _), summary, flow in zip(jobs, summaries, flows):
             print(f"\n   📝 Documenting {func_name}...")
+            if summary is None or flow is None:
+                print(f"      ⚠️ Skipping {func_name} (LLM request failed)")
+                continue
             
             try:
-                with open(spss_file, 'r') as f:
-                    spss_code = f.read()
-                
-                summary_text = self.generate_text(spss_code)
-                mermaid_code = self.generate_diagram(spss_code, func_name)
+                summary_text = summary.strip()
+                mermaid_code = self.build_diagram(flow.strip(), func_name)
                 
                 # FIX: Use textwrap.dedent so the file starts at column 0
                 md_content = textwrap.dedent(f"""\
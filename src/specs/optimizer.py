@@ -1,22 +1,29 @@
 import os
-import json
 import subprocess
 import shutil
 import time
 import csv
+from src.utils.ollama_client import DEFAULT_MODEL
 from src.utils.refining_agent import RefiningAgent
 from src.specs.prompts import OPTIMIZER_PROMPT_V2
+from src.utils.manifest_store import load_manifest
 
 class CodeOptimizer: 
-    def __init__(self, project_root="."): 
-        # Handle project root resolution
-        self.project_root = os.path.abspath(project_root)
-        self.manifest_path = os.path.join(self.project_root, "migration_manifest.json")
-        
-        # Fallback for testing environments
-        if not os.path.exists(self.manifest_path):
-             self.manifest_path = os.path.expanduser("~/git/dummy_spss_repo/migration_manifest.json")
-             self.project_root = os.path.dirname(self.manifest_path)
+    def __init__(self, project_root=".", context=None, model=DEFAULT_MODEL): 
+        self.model = model
+        self.context = context  # Shared PipelineContext: known paths, manifest read once per run
+        if context is not None:
+            self.project_root = context.project_root
+            self.manifest_path = context.manifest_path
+        else:
+            # Handle project root resolution
+            self.project_root = os.path.abspath(project_root)
+            self.manifest_path = os.path.join(self.project_root, "migration_manifest.json")
+
+            # Fallback for testing environments
+            if not os.path.exists(self.manifest_path):
+                 self.manifest_path = os.path.expanduser("~/git/dummy_spss_repo/migration_manifest.json")
+                 self.project_root = os.path.dirname(self.manifest_path)
 
         self.snapshot_dir = os.path.join(self.project_root, "snapshots")
         os.makedirs(self.snapshot_dir, exist_ok=True)
@@ -101,12 +108,16 @@ class CodeOptimizer:
             if os.path.exists(wrapper_path): os.remove(wrapper_path)
 
     def optimize_file(self, entry, force=False):
+        """
+        Returns True if the file needed no optimization or was optimized,
+        False if it is missing or the agent could not produce passing code.
+        """
         r_path = entry['r_file']
         func_name = entry['r_function_name']
         
         if not os.path.exists(r_path):
             print(f"   ⚠️ Skipping {func_name} (File not found)")
-            return
+            return False
 
         print(f"\n🔍 Assessing {func_name}...")
         self.save_vintage(r_path, func_name, "original")
@@ -121,7 +132,7 @@ class CodeOptimizer:
             lint_score, lint_msg = self.check_lint_status(r_path)
             if lint_score == 0 and not force:
                 print("   ✅ Draft passed logic and style. No optimization needed.")
-                return
+                return True
             print(f"   ⚠️ Logic PASS, but found {lint_score} style issues. Optimizing...")
             logic_status = "PASS"
         else:
@@ -150,7 +161,7 @@ class CodeOptimizer:
             r_code="{r_code}" # Placeholder for agent
         )
         
-        agent = RefiningAgent(prompt, max_retries=3)
+        agent = RefiningAgent(prompt, max_retries=3, chat=True, function=func_name, model=self.model)
         print("   🤖 Agent activated...")
         final_code = agent.run(current_code, check_callback)
 
@@ -159,6 +170,7 @@ class CodeOptimizer:
             # Agent says it found a valid solution
             print("   ✅ Optimization SUCCESS.")
             self.save_vintage(r_path, func_name, "optimized")
+            return True
         else:
             # Agent failed to produce valid code
             print("   ❌ Optimization FAILED (Could not pass validation).")
@@ -168,10 +180,11 @@ class CodeOptimizer:
                 with open(r_path, 'w') as f: f.write(working_draft_code)
             else:
                 print("   ⚠️ No working draft to revert to. Leaving file as is.")
+            return False
 
     def run(self, force_all=False):
         print("   Loading Manifest...")
-        with open(self.manifest_path, 'r') as f: manifest = json.load(f)
+        manifest = self.context.manifest if self.context is not None else load_manifest(self.manifest_path)
         
         for entry in manifest:
             if entry.get('role') == 'logic':
@@ -1,7 +1,9 @@
 import os
-import json
 import subprocess
-from src.utils.ollama_client import get_ollama_response
+from src.utils.ollama_client import DEFAULT_MODEL
+from src.utils.async_ollama_client import request_all
+from src.utils.manifest_store import load_manifest
+from src.utils.pipeline_context import read_package_libs
 
 QA_PROMPT = """
 You are a Lead QA Engineer.
@@ -28,7 +30,13 @@ Only the R code. Start with `library(testthat)`.
 """
 
 class QAEngineer:
-    def __init__(self, manifest_path="migration_manifest.json"):
+    def __init__(self, manifest_path="migration_manifest.json", context=None, model=DEFAULT_MODEL):
+        self.model = model
+        self.context = context  # Shared PipelineContext: known paths, inputs read once per run
+        if context is not None:
+            self.manifest_path = context.manifest_path
+            self.repo_root = context.project_root
+            return
         self.manifest_path = os.path.abspath(manifest_path)
         if not os.path.exists(self.manifest_path):
             self.manifest_path = os.path.expanduser("~/git/dummy_spss_repo/migration_manifest.json")
@@ -37,53 +45,40 @@ class QAEngineer:
 
     def get_package_libs(self):
         """Reads DESCRIPTION file to find required libraries."""
-        desc_path = os.path.join(self.repo_root, "DESCRIPTION")
-        libs = {"testthat"} # Always required for testing
-        
-        if os.path.exists(desc_path):
-            with open(desc_path, 'r') as f:
-                content = f.read()
-                # Very basic parser for "Imports:" block
-                if "Imports:" in content:
-                    block = content.split("Imports:")[1].split("Encoding:")[0]
-                    # Clean up commas, newlines, and spaces
-                    for item in block.replace("\n", "").replace(" ", "").split(","):
-                        if item: libs.add(item)
-        else:
-            # Fallback defaults
-            libs.update(["dplyr", "lubridate", "stringr", "readr"])
-            
-        return [f"library({lib})" for lib in sorted(list(libs))]
-
-
-
-
-
+        if self.context is not None:
+            return self.context.package_libs
+        return read_package_libs(self.repo_root)
 
+    def build_prompt(self, entry):
+        with open(entry['r_file'], 'r') as f: r_code = f.read()
+        with open(entry['spec_file'], 'r') as f: spec_content = f.read()
+        
+        return QA_PROMPT.format(spec=spec_content, code=r_code)
 
     def generate_tests(self, entry):
-        func_name = entry['r_function_name']
-        r_path = entry['r_file']
-        spec_path = entry['spec_file']
-        
-        # Calculate paths
+        print(f"🧪 Generating QA Suite for {entry['r_function_name']}...")
+        response = request_all(
+            [self.build_prompt(entry)], model=self.model, stage="qa", stop_at_code=True,
+            tags=[{"function": entry['r_function_name']}]
+        )[0]
+        return self.write_tests(entry, response)
+
+    def test_path(self, entry):
         # We assume r_file is in .../r_from_spec/filename.R
         # We want tests in .../tests/test_filename.R
-        r_dir = os.path.dirname(r_path)
-        base_dir = os.path.dirname(r_dir)
-        test_dir = os.path.join(base_dir, "tests")
-        
-        os.makedirs(test_dir, exist_ok=True)
-        test_path = os.path.join(test_dir, f"test_{func_name}.R")
-        
-        print(f"🧪 Generating QA Suite for {func_name}...")
-        
-        with open(r_path, 'r') as f: r_code = f.read()
-        with open(spec_path, 'r') as f: spec_content = f.read()
+        base_dir = os.path.dirname(os.path.dirname(entry['r_file']))
+        return os.path.join(base_dir, "tests", f"test_{entry['r_function_name']}.R")
+
+    def write_tests(self, entry, response):
+        """Writes the generated suite and returns its path, or None if there was no response."""
+        r_path = entry['r_file']
+        if response is None:
+            print(f"   ⚠️ No test suite for {entry['r_function_name']} (LLM request failed)")
+            return None
+
+        test_path = self.test_path(entry)
+        os.makedirs(os.path.dirname(test_path), exist_ok=True)
         
-        prompt = QA_PROMPT.format(spec=spec_content, code=r_code)
-        response = get_ollama_response(prompt)
-        # ... inside generate_tests ...
         # --- IMPROVED CLEANUP ---
         # 1. Strip Markdown Code Blocks
         if "```r" in response: 
@@ -149,12 +144,28 @@ class QAEngineer:
 
 
     def run(self):
-        with open(self.manifest_path, 'r') as f: manifest = json.load(f)
+        manifest = self.context.manifest if self.context is not None else load_manifest(self.manifest_path)
+        entries = [
+            entry for entry in manifest
+            if entry.get('role') != 'controller' and os.path.exists(entry['r_file'])
+        ]
+
+        # LLM-bound: generate every suite in one batch, then run them (R-bound)
+        for entry in entries:
+            print(f"🧪 Generating QA Suite for {entry['r_function_name']}...")
+        responses = request_all(
+            [self.build_prompt(entry) for entry in entries],
+            model=self.model,
+            stage="qa",
+            stop_at_code=True,
+            tags=[{"function": entry['r_function_name']} for entry in entries]
+        )
+
         overall_success = True
-        for entry in manifest:
-            if entry.get('role') != 'controller' and os.path.exists(entry['r_file']):
-                if not self.run_tests(self.generate_tests(entry)):
-                    overall_success = False
+        for entry, response in zip(entries, responses):
+            test_path = self.write_tests(entry, response)
+            if test_path is None or not self.run_tests(test_path):
+                overall_success = False
         return overall_success
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 import os
-import json
 from src.utils.ollama_client import get_ollama_response
+from src.utils.llm_budget import TASK_REVIEW
+from src.utils.manifest_store import load_manifest
 
 VALIDATOR_PROMPT = """
 You are a Lead R Code Reviewer. 
@@ -51,7 +52,14 @@ class CodeValidator:
             spss_code = "(Source SPSS not found)"
         
         prompt = VALIDATOR_PROMPT.format(spss_code=spss_code, r_code=r_code)
-        response = get_ollama_response(prompt).strip()
+        response = get_ollama_response(
+            prompt, stage="validator", task=TASK_REVIEW, tag={"function": entry['r_function_name']}
+        )
+        if response is None:
+            # Unreviewed is not approved
+            print(f"   ⚠️ No response for {entry['r_function_name']} (LLM request failed); skipping.")
+            return False
+        response = response.strip()
         
         if "PASS" in response:
             print(f"   ✅ Logic Approved.")
@@ -62,8 +70,7 @@ class CodeValidator:
             return False
 
     def run(self):
-        with open(self.manifest_path, 'r') as f:
-            manifest = json.load(f)
+        manifest = load_manifest(self.manifest_path)
             
         all_passed = True
         for entry in manifest:
@@ -0,0 +1,471 @@
+import json
+import time
+import asyncio
+import logging
+import threading
+import httpx
+
+from src.utils.ollama_client import (
+    DEFAULT_API_ENDPOINT,
+    DEFAULT_MODEL,
+    DEFAULT_CONCURRENCY,
+    DEFAULT_CONNECT_TIMEOUT,
+    DEFAULT_READ_TIMEOUT,
+    build_generate_payload,
+    build_continuation_payload,
+    is_truncated,
+    strip_code_fences,
+    get_client,
+    get_ollama_response,
+)
+from src.utils.llm_streaming import CompletionDetector, StreamStats
+from src.utils.endpoint_pool import EndpointPool, CircuitOpen, GENERATE_PATH
+from src.utils.llm_cache import ResponseCache
+from src.utils.single_flight import AsyncSingleFlight
+from src.utils.model_timing import ModelTimings
+from src.utils.telemetry import Telemetry
+from src.utils.cassette import Cassette, CassetteMiss
+from src.utils.llm_budget import infer_task, MAX_CONTINUATIONS
+from src.utils.retry import (
+    DEFAULT_MAX_RETRIES, DEFAULT_BACKOFF_BASE, DEFAULT_BACKOFF_CAP,
+    is_endpoint_failure, is_retryable, retry_delay, retry_limit, scaled_read_timeout,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncOllamaClient:
+    """
+    Asyncio counterpart of `OllamaClient`.
+
+    An `asyncio.Semaphore` caps the number of generations in flight so a
+    whole manifest can be submitted at once without overrunning the
+    server's OLLAMA_NUM_PARALLEL slots. Use as an async context manager:
+
+        async with AsyncOllamaClient(concurrency=4) as client:
+            results = await client.generate_batch(prompts)
+    """
+
+    def __init__(
+        self,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        cache=None,
+        streaming: bool = False,
+        stream_stats: StreamStats | None = None,
+        endpoint_pool: EndpointPool | None = None,
+        keep_alive: str | None = None,
+        timings: ModelTimings | None = None,
+        telemetry: Telemetry | None = None,
+        cassette: Cassette | None = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_base: float = DEFAULT_BACKOFF_BASE,
+        backoff_cap: float = DEFAULT_BACKOFF_CAP,
+        scale_timeouts: bool = True
+    ):
+        self.concurrency = max(1, concurrency)
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.scale_timeouts = scale_timeouts
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.cache = cache
+        self.streaming = streaming
+        self.stream_stats = stream_stats or StreamStats()
+        self.endpoint_pool = endpoint_pool or EndpointPool([DEFAULT_API_ENDPOINT])
+        self.keep_alive = keep_alive
+        self.timings = timings or ModelTimings()
+        self.telemetry = telemetry or Telemetry()
+        self.cassette = cassette
+
+        self.single_flight = AsyncSingleFlight()
+        self.continuations = 0
+        self.truncated_responses = 0
+        self.retries = 0
+
+        self._http = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._http = httpx.AsyncClient(
+            timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            limits=httpx.Limits(
+                max_connections=self.concurrency,
+                max_keepalive_connections=self.concurrency
+            )
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._http.aclose()
+
+    def timeout_for(self, payload) -> httpx.Timeout:
+        """Per-request timeout; see `OllamaClient.timeout_for`."""
+        read = scaled_read_timeout(payload, self.read_timeout) if self.scale_timeouts else self.read_timeout
+        return httpx.Timeout(read, connect=self.connect_timeout)
+
+    async def stream_generate(self, endpoint, payload, json_mode=False, stop_at_code=False, prefix="") -> tuple:
+        """Async equivalent of `OllamaClient.stream_generate`."""
+        payload = dict(payload, stream=True)
+        watch = stop_at_code or json_mode
+        detector = CompletionDetector(json_mode=json_mode)
+        detector.feed(prefix)
+
+        start = time.perf_counter()
+        ttft = None
+        received = 0
+        stopped_early = False
+        chunk = {}
+        async with self._http.stream("POST", endpoint, json=payload, timeout=self.timeout_for(payload)) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                token = chunk.get("response", "")
+                if token:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    received += 1
+                if detector.feed(token) and watch and not chunk.get("done"):
+                    stopped_early = True
+                    break
+                if chunk.get("done"):
+                    break
+
+        self.stream_stats.record(ttft, received, payload["options"].get("num_predict", 0), stopped_early)
+        return (detector.result if watch else detector.text), chunk
+
+    async def post_json(self, endpoint, payload) -> dict:
+        """Async equivalent of `OllamaClient.post_json`, including cassette record/replay."""
+        if self.cassette is not None and self.cassette.replaying:
+            return self.cassette.replay(endpoint, payload)
+        start = time.perf_counter()
+        response = await self._http.post(endpoint, json=payload, timeout=self.timeout_for(payload))
+        response.raise_for_status()
+        body = response.json()
+        if self.cassette is not None:
+            self.cassette.record(endpoint, payload, body, time.perf_counter() - start)
+        return body
+
+    async def complete(self, endpoint, payload, json_mode=False, stop_at_code=False, stage="default", tag=None) -> str:
+        """Async equivalent of `OllamaClient.complete`."""
+        text = ""
+        for attempt in range(MAX_CONTINUATIONS + 1):
+            start = time.perf_counter()
+            if self.streaming and self.cassette is None:
+                text, final = await self.stream_generate(endpoint, payload, json_mode, stop_at_code, prefix=text)
+            else:
+                final = await self.post_json(endpoint, payload)
+                text += final.get("response", "")
+            self.timings.record(stage, final)
+            self.telemetry.record(
+                dict(tag or {}, stage=stage), final, time.perf_counter() - start,
+                model=payload["model"], endpoint=endpoint
+            )
+
+            if not is_truncated(final):
+                break
+            if attempt == MAX_CONTINUATIONS:
+                logger.warning("Response still truncated after continuing; returning partial output.")
+                self.truncated_responses += 1
+                break
+            self.continuations += 1
+            payload = build_continuation_payload(payload, final["context"])
+        return text
+
+    async def generate(
+        self,
+        prompt: str,
+        model: str = DEFAULT_MODEL,
+        endpoint: str | None = None,
+        json_mode: bool = False,
+        stage: str = "default",
+        stop_at_code: bool = False,
+        task: str | None = None,
+        tag: dict | None = None
+    ) -> str | None:
+        """Async equivalent of `get_ollama_response`. Returns None on error."""
+        payload = build_generate_payload(prompt, model, json_mode, task or infer_task(json_mode, stop_at_code))
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        request_key = ResponseCache.make_key(
+            model, endpoint or GENERATE_PATH, prompt, payload["options"], json_mode, stop_at_code
+        )
+        return await self.single_flight.do(
+            request_key,
+            lambda: self._generate(payload, request_key, endpoint, stage, stop_at_code, tag)
+        )
+
+    async def _generate(self, payload, request_key, endpoint, stage, stop_at_code, tag=None):
+        """Cache lookup + upstream call for one (already de-duplicated) request."""
+        model = payload["model"]
+        json_mode = payload.get("format") == "json"
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = request_key
+            cached = self.cache.get(cache_key, stage=stage)
+            if cached is not None:
+                return cached
+
+        max_retries = retry_limit(self.max_retries, self.cassette)
+        failover = endpoint is None and len(self.endpoint_pool.endpoints) > 1
+        for attempt in range(max_retries + 1):
+            # The slot is held for one try only, so a request sleeping in
+            # backoff doesn't keep a healthy request waiting
+            async with self._semaphore:
+                logger.info(f"Sending async request to Ollama (Model: {model}, JSON Mode: {json_mode})...")
+                target = None
+                url = endpoint
+                if url is None:
+                    try:
+                        target = self.endpoint_pool.acquire(model)
+                    except CircuitOpen as e:
+                        logger.error(f"Ollama API Request Failed: {e}")
+                        return None
+                    url = target.url(GENERATE_PATH)
+
+                start = time.perf_counter()
+                latency = None
+                failed = False
+                error = None
+                try:
+                    raw_text = await self.complete(url, payload, json_mode, stop_at_code, stage=stage, tag=tag)
+                    latency = time.perf_counter() - start
+                except httpx.HTTPError as e:
+                    failed = is_endpoint_failure(e)
+                    error = e
+                except CassetteMiss as e:
+                    logger.error(f"Ollama API Request Failed: {e}")
+                    return None
+                except json.JSONDecodeError:
+                    logger.error("Failed to decode JSON response from Ollama API.")
+                    return None
+                finally:
+                    if target is not None:
+                        self.endpoint_pool.release(target, model=model, latency=latency, failed=failed)
+
+            if error is None:
+                break
+            if attempt == max_retries or not is_retryable(error, failover):
+                logger.error(f"Ollama API Request Failed: {error}")
+                return None
+            delay = retry_delay(error, attempt, self.backoff_base, self.backoff_cap)
+            logger.warning(f"Ollama request to {url} failed ({error}); retrying in {delay:.1f}s...")
+            self.retries += 1
+            await asyncio.sleep(delay)
+
+        text = strip_code_fences(raw_text.strip())
+        if cache_key is not None:
+            self.cache.put(cache_key, text, stage=stage)
+        return text
+
+    async def generate_batch(self, requests: list, on_result=None, **defaults) -> list:
+        """
+        Runs every request concurrently and returns results in input order.
+
+        Args:
+            requests (list): Each item is a prompt string or a dict of
+                             `generate` keyword arguments.
+            on_result (callable | None): Called as on_result(index, result) the
+                                         moment each request finishes, so callers
+                                         can persist work before the batch ends.
+            **defaults: Keyword arguments applied to every request unless
+                        the request dict overrides them.
+        """
+        async def run(index, kwargs):
+            result = await self.generate(**kwargs)
+            if on_result is not None:
+                on_result(index, result)
+            return result
+
+        calls = []
+        for index, item in enumerate(requests):
+            kwargs = dict(defaults)
+            kwargs.update(item if isinstance(item, dict) else {"prompt": item})
+            calls.append(run(index, kwargs))
+        return await asyncio.gather(*calls)
+
+
+def batch_client_for(shared, concurrency=None) -> AsyncOllamaClient:
+    """An AsyncOllamaClient with the shared client's timeouts, cache, endpoints, retries and stats."""
+    return AsyncOllamaClient(
+        concurrency=concurrency or shared.concurrency,
+        connect_timeout=shared.connect_timeout,
+        read_timeout=shared.read_timeout,
+        cache=shared.cache,
+        streaming=shared.streaming,
+        stream_stats=shared.stream_stats,
+        endpoint_pool=shared.endpoint_pool,
+        keep_alive=shared.keep_alive,
+        timings=shared.timings,
+        telemetry=shared.telemetry,
+        cassette=shared.cassette,
+        max_retries=shared.max_retries,
+        backoff_base=shared.backoff_base,
+        backoff_cap=shared.backoff_cap,
+        scale_timeouts=shared.scale_timeouts
+    )
+
+
+class BackgroundClient:
+    """
+    One long-lived AsyncOllamaClient on its own event loop thread.
+
+    Every batch of a run (including the per-file calls of the pipeline
+    scheduler's workers) is submitted to this loop, so they all share one
+    HTTP connection pool, one concurrency limit and one single-flight table:
+    the same prompt sent by several workers at once is generated once.
+    """
+
+    def __init__(self, client: AsyncOllamaClient, shared):
+        self.client = client
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._reported = (0, 0, 0, 0)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True, name="ollama-batches")
+        self.thread.start()
+        self.run(client.__aenter__())
+
+    def run(self, coro):
+        """Runs `coro` on the client's loop and blocks until it is done."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def report(self):
+        """Adds what the client coalesced, continued and retried since the last report to the shared totals."""
+        c = self.client
+        with self._lock:
+            now = (c.single_flight.coalesced, c.continuations, c.truncated_responses, c.retries)
+            coalesced, continuations, truncated, retries = (n - r for n, r in zip(now, self._reported))
+            self._reported = now
+        self.shared.single_flight.record(coalesced)
+        self.shared.record_continuations(continuations, truncated)
+        self.shared.record_retries(retries)
+
+    def close(self):
+        self.run(self.client.__aexit__(None, None, None))
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+
+_background_lock = threading.Lock()
+
+
+def background_client(shared) -> BackgroundClient:
+    """The shared client's BackgroundClient, started on first use and closed with it."""
+    with _background_lock:
+        if shared.batch_client is None:
+            shared.batch_client = BackgroundClient(batch_client_for(shared), shared)
+        return shared.batch_client
+
+
+def get_ollama_responses(
+    requests: list,
+    model: str = DEFAULT_MODEL,
+    endpoint: str | None = None,
+    json_mode: bool = False,
+    stage: str = "default",
+    concurrency: int | None = None,
+    stop_at_code: bool = False,
+    task: str | None = None,
+    tags: list | None = None,
+    on_result=None
+) -> list:
+    """
+    Synchronous entry point for stages: submits a whole batch of prompts and
+    blocks until all have answered.
+
+    Timeouts, retries, streaming, endpoint routing, keep_alive, timing stats and the
+    response cache are taken from the shared client, so a batch behaves like
+    the same prompts sent through `get_ollama_response`. Batches run on the
+    shared client's BackgroundClient, so concurrent callers share its
+    connections and coalesce identical prompts.
+
+    Args:
+        requests (list): Prompt strings, or dicts of `generate` keyword
+                         arguments for per-request overrides (e.g. json_mode).
+        concurrency (int | None): Max generations in flight. Defaults to the
+                                  shared client's `concurrency`; any other value
+                                  runs the batch on a one-off client.
+        tags (list | None): Telemetry tag per request (see `get_ollama_response`),
+                            aligned with `requests`.
+        on_result (callable | None): on_result(index, result) as each request
+                                     finishes (see `generate_batch`).
+
+    Returns:
+        list: One `str | None` per request, in the order submitted.
+    """
+    shared = get_client()
+    if tags is not None:
+        requests = [
+            dict(item if isinstance(item, dict) else {"prompt": item}, tag=tag)
+            for item, tag in zip(requests, tags)
+        ]
+    defaults = dict(
+        model=model, endpoint=endpoint, json_mode=json_mode, stage=stage, stop_at_code=stop_at_code, task=task
+    )
+
+    if concurrency is not None and concurrency != shared.concurrency:
+        # A different limit than the shared client's: a one-off client for this batch
+        client = batch_client_for(shared, concurrency)
+
+        async def _run():
+            async with client:
+                return await client.generate_batch(requests, on_result=on_result, **defaults)
+
+        results = asyncio.run(_run())
+        shared.single_flight.record(client.single_flight.coalesced)
+        shared.record_continuations(client.continuations, client.truncated_responses)
+        shared.record_retries(client.retries)
+        return results
+
+    runner = background_client(shared)
+    try:
+        return runner.run(runner.client.generate_batch(requests, on_result=on_result, **defaults))
+    finally:
+        runner.report()
+
+
+def request_all(
+    requests: list,
+    stage: str = "default",
+    tags: list | None = None,
+    on_result=None,
+    **kwargs
+) -> list:
+    """
+    The one way a stage sends its prompts: as a single batch when the shared
+    client allows parallel calls, otherwise one `get_ollama_response` at a time.
+
+    Args:
+        requests (list): Prompt strings, or dicts of per-request keyword
+                         arguments (see `get_ollama_responses`).
+        stage (str): Stage name for config, telemetry and the cache.
+        tags (list | None): Telemetry tag per request, aligned with `requests`.
+        on_result (callable | None): on_result(index, result) as each request
+                                     finishes, in both modes.
+        **kwargs: Defaults for every request (stop_at_code, json_mode, task...).
+
+    Returns:
+        list: One `str | None` per request, in the order submitted.
+    """
+    tags = tags or [None] * len(requests)
+    if get_client().concurrency > 1:
+        return get_ollama_responses(requests, stage=stage, tags=tags, on_result=on_result, **kwargs)
+
+    results = []
+    for index, (item, tag) in enumerate(zip(requests, tags)):
+        request = dict(kwargs, **(item if isinstance(item, dict) else {"prompt": item}))
+        if tag is not None:
+            request["tag"] = tag
+        result = get_ollama_response(request.pop("prompt"), stage=stage, **request)
+        if on_result:
+            on_result(index, result)
+        results.append(result)
+    return results
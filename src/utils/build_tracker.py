@@ -0,0 +1,138 @@
+import os
+import hashlib
+import threading
+
+
+def text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(path):
+    """sha256 of a file's bytes, or None if it doesn't exist."""
+    if not path or not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_hashes(file_map, includes, own=None):
+    """
+    Hash of every .sps file together with everything it INSERTs/INCLUDEs,
+    directly or transitively, so a change to an included file invalidates
+    the files that pull it in.
+
+    Args:
+        file_map (dict): lower-case file name -> path (DependencyResolver.file_map).
+        includes (dict): file name -> names it includes (DependencyResolver.includes).
+        own (dict | None): file name -> hash of that file alone, if already
+                           known (ScanCache); otherwise each file is hashed here.
+
+    Returns:
+        dict: file name -> hex digest.
+    """
+    if own is None:
+        own = {name: file_hash(path) for name, path in file_map.items()}
+    result = {}
+
+    def visit(name, stack):
+        if name in result:
+            return result[name]
+        if name in stack:  # Cycle: count the file once
+            return own.get(name) or ""
+        stack.add(name)
+        parts = [own.get(name) or ""]
+        parts += [visit(child, stack) for child in sorted(set(includes.get(name, ()))) if child in own]
+        stack.discard(name)
+        result[name] = text_hash("\n".join(parts)) if len(parts) > 1 else parts[0]
+        return result[name]
+
+    for name in file_map:
+        visit(name, set())
+    return result
+
+
+class BuildTracker:
+    """
+    Incremental builds and crash-safe progress on top of the manifest.
+
+    Each stage that finishes records, under the entry's "build" key, the
+    hashes of the inputs it consumed (source, upstream files, prompt
+    template, model tag) and of the file it produced. On the next run a
+    stage is skipped when its inputs hash the same and its output still
+    exists. Downstream stages list upstream outputs among their inputs, so
+    a changed .sps file re-runs only that file's chain, and the chain stops
+    early if a stage reproduces an identical output.
+
+    Every finished stage is also appended to the entry's "progress" list and
+    its status becomes "<stage>:done", journalled through the ManifestStore
+    as it happens. With resume=True a stage already in "progress" is
+    trusted as is, so an interrupted run picks up at the next step.
+    """
+
+    def __init__(self, store, manifest, rebuild=False, resume=False):
+        self.store = store
+        self.manifest = manifest
+        self.rebuild = rebuild  # Run everything, but still record hashes for next time
+        self.resume = resume
+        self._lock = threading.Lock()
+        self.skipped = {}  # stage -> count
+        self.built = {}
+        if not resume:
+            for entry in manifest:
+                entry.pop("progress", None)
+            store.save(manifest)
+
+    def record_of(self, entry, stage):
+        return entry.get("build", {}).get(stage)
+
+    def output_of(self, entry, stage):
+        """Hash of the file `stage` last produced for this entry (None if never run)."""
+        record = self.record_of(entry, stage)
+        return record.get("output") if record else None
+
+    def is_fresh(self, stage, entry, inputs=None, output_path=None):
+        """True if `stage` can be skipped: done earlier in a resumed run, or its inputs are unchanged."""
+        if output_path is not None and not os.path.exists(output_path):
+            return False
+        if self.resume and stage in entry.get("progress", ()):
+            return True
+        record = self.record_of(entry, stage)
+        return not self.rebuild and inputs is not None and record is not None and record.get("inputs") == inputs
+
+    def skip(self, stage, entry):
+        with self._lock:
+            self.skipped[stage] = self.skipped.get(stage, 0) + 1
+        self._commit(stage, entry, {})
+
+    def stage_done(self, stage, entry, inputs=None, output_path=None):
+        """Commits a finished stage; with `inputs`, also records its hashes for incremental builds."""
+        fields = {}
+        if inputs is not None:
+            build = dict(entry.get("build", {}))
+            build[stage] = {"inputs": inputs, "output": file_hash(output_path)}
+            fields["build"] = build
+        with self._lock:
+            self.built[stage] = self.built.get(stage, 0) + 1
+        self._commit(stage, entry, fields)
+
+    def _commit(self, stage, entry, fields):
+        progress = list(entry.get("progress", []))
+        if stage not in progress:
+            progress.append(stage)
+        self.store.update(entry, status=f"{stage}:done", progress=progress, **fields)
+
+    def set_status(self, entry, status):
+        self.store.update(entry, status=status)
+
+    def save(self):
+        """Folds the journal back into the manifest file."""
+        self.store.save(self.manifest)
+
+    def stats(self):
+        """stage -> {"built": n, "skipped": n}"""
+        with self._lock:
+            stages = set(self.built) | set(self.skipped)
+            return {s: {"built": self.built.get(s, 0), "skipped": self.skipped.get(s, 0)} for s in stages}
@@ -0,0 +1,177 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from urllib.parse import urlparse
+import requests
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_ENV = "LLM_CASSETTE"            # Path of the cassette file
+CASSETTE_MODE_ENV = "LLM_CASSETTE_MODE"  # "record" or "replay"
+MODES = ("record", "replay")
+
+# Request fields that don't change the answer and would make keys host- or run-specific
+IGNORED_FIELDS = ("keep_alive", "stream")
+# Options set from the environment (OLLAMA_NUM_CTX) rather than by the request itself
+IGNORED_OPTIONS = ("num_ctx",)
+# Reply fields worth keeping; `context` is only needed to continue a truncated answer
+REPLY_FIELDS = (
+    "response", "message", "done", "done_reason", "load_duration",
+    "prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration",
+)
+
+
+class CassetteMiss(requests.exceptions.RequestException):
+    """Replay mode was asked for a request that was never recorded."""
+
+
+class Cassette:
+    """
+    Record/replay store for Ollama HTTP exchanges.
+
+    In `record` mode every request/response pair that goes over the wire is
+    appended to a JSON Lines file, keyed by a hash of the API path and
+    payload; `close()` rewrites it once, sorted and without duplicates. In
+    `replay` mode requests are answered from that file with no network
+    access; unknown requests raise `CassetteMiss`. The recorded wall time of
+    each call is kept, so a replayed run can report how much LLM time it
+    *would* have spent and timing regressions (extra calls, bigger prompts,
+    more retries) still show up.
+    """
+
+    def __init__(self, path, mode="replay"):
+        if mode not in MODES:
+            raise ValueError(f"Cassette mode must be one of {MODES}")
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self.replayed_seconds = 0.0
+        # Old single-document layout or a truncated last line: rewrite before appending
+        self._needs_rewrite = False
+
+        if os.path.exists(path):
+            self._load()
+        elif mode == "replay":
+            logger.warning(f"Cassette {path} does not exist; every request will miss.")
+
+    @classmethod
+    def from_env(cls):
+        """Builds a cassette from LLM_CASSETTE / LLM_CASSETTE_MODE, or returns None."""
+        path = os.environ.get(CASSETTE_ENV)
+        if not path:
+            return None
+        return cls(path, mode=os.environ.get(CASSETTE_MODE_ENV, "replay"))
+
+    def _load(self):
+        with open(self.path, "r") as f:
+            text = f.read()
+        try:
+            document = json.loads(text)
+        except json.JSONDecodeError:
+            document = None
+        if isinstance(document, dict) and "entries" in document:
+            # Cassettes recorded before entries were appended line by line
+            self.entries = document["entries"]
+            self._needs_rewrite = True
+            return
+
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write leaves at most one partial line
+                logger.warning(f"Skipping a truncated line in cassette {self.path}.")
+                self._needs_rewrite = True
+                continue
+            self.entries[entry.pop("key")] = entry  # A later recording of a request wins
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    @staticmethod
+    def make_key(url, payload):
+        material = {k: v for k, v in payload.items() if k not in IGNORED_FIELDS}
+        if "options" in material:
+            material["options"] = {k: v for k, v in material["options"].items() if k not in IGNORED_OPTIONS}
+        material["path"] = urlparse(url).path
+        encoded = json.dumps(material, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    def replay(self, url, payload):
+        """Returns the recorded reply body for this request."""
+        key = self.make_key(url, payload)
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.replayed_seconds += entry.get("latency", 0.0)
+        if entry is None:
+            raise CassetteMiss(f"No cassette entry for {urlparse(url).path} request {key[:12]} in {self.path}")
+        return dict(entry["reply"])
+
+    def record(self, url, payload, reply, latency):
+        """Saves one exchange, appending it to the cassette file."""
+        kept = {k: reply[k] for k in REPLY_FIELDS if k in reply}
+        if reply.get("done_reason") == "length" and "context" in reply:
+            kept["context"] = reply["context"]
+        prompt = payload.get("prompt")
+        if prompt is None and payload.get("messages"):
+            prompt = payload["messages"][-1].get("content", "")
+        entry = {
+            "path": urlparse(url).path,
+            "model": payload.get("model"),
+            "prompt_preview": (prompt or "")[:80],  # For humans reading the diff
+            "latency": round(latency, 4),
+            "reply": kept,
+        }
+        key = self.make_key(url, payload)
+        with self._lock:
+            if self._needs_rewrite:
+                self._save()
+            self.entries[key] = entry
+            self.recorded += 1
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(self._line(key, entry))
+
+    def close(self):
+        """Rewrites the file sorted and without duplicates if this run recorded anything."""
+        with self._lock:
+            if self.recorded:
+                self._save()
+
+    @staticmethod
+    def _line(key, entry):
+        return json.dumps({"key": key, **entry}, sort_keys=True, ensure_ascii=False) + "\n"
+
+    def _save(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.writelines(self._line(key, self.entries[key]) for key in sorted(self.entries))
+        os.replace(tmp_path, self.path)
+        self._needs_rewrite = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "recorded": self.recorded,
+                "replayed_seconds": self.replayed_seconds,
+            }
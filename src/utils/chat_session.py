@@ -0,0 +1,61 @@
+import logging
+from src.utils.ollama_client import get_ollama_chat, DEFAULT_MODEL
+from src.utils.llm_budget import size_chat_options, context_window, TASK_CODE
+from src.utils.model_timing import NS_PER_SECOND
+
+logger = logging.getLogger(__name__)
+
+
+class ChatSession:
+    """
+    One conversation on /api/chat.
+
+    Keeps the message list, sizes the reply budget once on the first turn,
+    and sends every later turn to the server that answered the first one so
+    its prompt cache for the earlier turns can be reused.
+    """
+
+    def __init__(self, system_prompt, model=DEFAULT_MODEL, stage="default", task=TASK_CODE, turns=4):
+        self.model = model
+        self.stage = stage
+        self.task = task
+        self.turns = turns
+        self.messages = [{"role": "system", "content": system_prompt}]
+        self.endpoint = None
+        self.options = None
+
+    def send(self, content, tag=None):
+        """
+        Adds a user turn and returns the reply body (see `get_ollama_chat`),
+        or None if the request failed. The assistant turn is appended to the
+        history automatically; a failed turn is dropped from it. `tag` is
+        passed through to the telemetry record.
+        """
+        self.messages.append({"role": "user", "content": content})
+        if self.options is None:
+            text = "\n".join(m["content"] for m in self.messages)
+            self.options = size_chat_options(text, self.task, self.turns, context_window(self.model))
+
+        reply = get_ollama_chat(
+            self.messages, model=self.model, endpoint=self.endpoint, stage=self.stage,
+            options=self.options, tag=tag
+        )
+        if reply is None:
+            self.messages.pop()
+            # The pinned server may be gone; let the pool choose next time
+            self.endpoint = None
+            return None
+
+        self.endpoint = self.endpoint or reply.get("endpoint")
+        self.messages.append(reply["message"])
+        return reply
+
+
+def reply_timings(reply):
+    """Prompt-eval vs generation figures from a chat reply, in seconds."""
+    reply = reply or {}
+    return {
+        "prompt_eval_count": reply.get("prompt_eval_count", 0),
+        "prompt_eval_seconds": reply.get("prompt_eval_duration", 0) / NS_PER_SECOND,
+        "eval_seconds": reply.get("eval_duration", 0) / NS_PER_SECOND,
+    }
@@ -1,34 +1,38 @@
 import os
-import re
 from collections import defaultdict, deque
+from src.utils.spss_lexer import get_command_cache
+from src.utils.scan_engine import ScanEngine, walk_sps
 
 class DependencyResolver:
-    def __init__(self, repo_path):
+    def __init__(self, repo_path, cache=None, scan_cache=None, workers=1):
         self.repo_path = os.path.abspath(repo_path)
+        self.cache = cache or get_command_cache()  # Shared lexed command streams
+        self.scan_cache = scan_cache  # Optional ScanCache: unchanged files aren't parsed again
+        self.workers = workers  # Parallel readers / parsers (see ScanEngine)
+        self.scans = {}  # name -> per-file scan result (includes, role, commands, ...)
         self.graph = defaultdict(list)
         self.in_degree = defaultdict(int)
         self.files = set()
         self.file_map = {} 
+        self.includes = defaultdict(list)  # Master -> files it INSERTs/INCLUDEs (no sibling edges)
 
     def scan(self):
         print(f"🕵️  Scanning dependencies in {self.repo_path}...")
         
-        # 1. Map all files
-        for root, dirs, files in os.walk(self.repo_path):
-            for file in files:
-                if file.lower().endswith('.sps'):
-                    name = file.lower()
-                    self.files.add(name)
-                    self.file_map[name] = os.path.join(root, file)
-                    if name not in self.in_degree: self.in_degree[name] = 0
+        # 1. Map all files (sorted, so the graph is the same whatever the filesystem order)
+        for path in walk_sps(self.repo_path):
+            name = os.path.basename(path).lower()
+            self.files.add(name)
+            self.file_map[name] = path
+            if name not in self.in_degree: self.in_degree[name] = 0
 
-        # 2. Parse content
+        # 2. Parse content (in parallel), then merge in file_map order
+        engine = ScanEngine(self.workers, scan_cache=self.scan_cache, lexer_cache=self.cache)
+        results = engine.scan_paths(self.file_map.values())
         for name, path in self.file_map.items():
-            with open(path, 'r', errors='ignore') as f:
-                content = f.read().upper() # SPSS is case insensitive
-            
-            # Robust Regex: Handles "INSERT FILE = 'path'" (spaces, optional quotes)
-            matches = re.findall(r"(?:INSERT|INCLUDE)\s+FILE\s*=\s*['\"]?([^'\"]+\.SPS)['\"]?", content)
+            # INSERT / INCLUDE commands only: a commented-out INSERT is not a dependency
+            self.scans[name] = results[path]
+            matches = [t for t in self.scans[name]["includes"] if t.lower().endswith(".sps")]
             
             previous_sibling = None
             
@@ -40,6 +44,7 @@ class DependencyResolver:
                     # In Execution Order (Logic first), this means Target -> Master
                     self.graph[target].append(name) 
                     self.in_degree[name] += 1
+                    self.includes[name].append(target)
                     print(f"   🔗 Parent-Child: {name} calls {target}")
 
                     # --- NEW: Sequential Sibling Dependency ---
@@ -51,9 +56,13 @@ class DependencyResolver:
                     
                     previous_sibling = target
 
+        if self.scan_cache is not None:
+            stats = self.scan_cache.stats()
+            print(f"   ♻️  Scan cache: {stats['hits'] + stats['rehashed']} unchanged, {stats['parsed']} parsed")
+
     def get_execution_order(self):
         # Topological Sort (Kahn's Algorithm)
-        queue = deque([node for node in self.files if self.in_degree[node] == 0])
+        queue = deque([node for node in sorted(self.files) if self.in_degree[node] == 0])
         sorted_files = []
         
         while queue:
@@ -0,0 +1,242 @@
+import re
+import time
+import logging
+import threading
+import requests
+
+from src.utils.retry import is_endpoint_failure
+
+logger = logging.getLogger(__name__)
+
+GENERATE_PATH = "/api/generate"
+CHAT_PATH = "/api/chat"
+PS_PATH = "/api/ps"  # Lists the models currently loaded in memory
+
+DEFAULT_PROBE_INTERVAL = 15.0   # Seconds between background health checks
+DEFAULT_PROBE_TIMEOUT = 2.0
+DEFAULT_LATENCY_ALPHA = 0.3     # Weight of the newest sample in the latency EWMA
+DEFAULT_COLD_LOAD_PENALTY = 10.0  # Seconds we expect a model load to cost
+DEFAULT_FAILURE_THRESHOLD = 1   # Consecutive failures that open an endpoint's circuit breaker
+DEFAULT_OPEN_SECONDS = 30.0     # How long an open breaker rejects traffic before a trial request
+
+
+class CircuitOpen(requests.exceptions.RequestException):
+    """Every endpoint's circuit breaker is open (or busy with its trial request): fail fast."""
+
+
+def base_url(url: str) -> str:
+    """'http://box:11434/api/generate' -> 'http://box:11434'"""
+    return re.sub(r"/api(/.*)?$", "", url.rstrip("/"))
+
+
+class Endpoint:
+    """Routing state for one Ollama server."""
+
+    def __init__(self, url):
+        self.base_url = base_url(url)
+        self.in_flight = 0
+        self.latency = None          # EWMA of request wall time (seconds)
+        self.healthy = True
+        self.loaded_models = set()
+        self.requests = 0
+        self.failures = 0
+        self.last_failure = 0.0
+
+        # Circuit breaker: closed (healthy) -> open after repeated failures ->
+        # half-open once `open_until` passes, admitting a single trial request
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trial_in_flight = False
+
+    @property
+    def state(self):
+        if self.healthy:
+            return "closed"
+        if time.monotonic() >= self.open_until:
+            return "half-open"
+        return "open"
+
+    def url(self, path=GENERATE_PATH):
+        return f"{self.base_url}{path}"
+
+    def score(self, model, cold_load_penalty):
+        """Expected seconds until a new request here would finish."""
+        per_request = self.latency if self.latency is not None else 1.0
+        score = (self.in_flight + 1) * per_request
+        if model not in self.loaded_models:
+            score += cold_load_penalty
+        return score
+
+
+class EndpointPool:
+    """
+    Routes each request to the least-loaded healthy Ollama endpoint.
+
+    Load is the in-flight count multiplied by the recent latency, plus a
+    penalty for endpoints that would have to load the model first.
+
+    Each endpoint has a circuit breaker. After `failure_threshold`
+    consecutive failures (timeouts, refused connections, 5xx) it opens and
+    the endpoint leaves rotation for `open_seconds`. It then goes half-open
+    and admits one trial request (once its earlier requests have finished):
+    success closes it, failure re-opens it. While no endpoint is healthy
+    or free for a trial, `acquire` raises CircuitOpen instead of sending
+    the request to a host known to be down.
+    `start()` also launches a background thread that probes /api/ps to
+    re-admit endpoints early and to learn which models each box has resident.
+    """
+
+    def __init__(
+        self,
+        urls,
+        probe_interval=DEFAULT_PROBE_INTERVAL,
+        probe_timeout=DEFAULT_PROBE_TIMEOUT,
+        latency_alpha=DEFAULT_LATENCY_ALPHA,
+        cold_load_penalty=DEFAULT_COLD_LOAD_PENALTY,
+        failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+        open_seconds=DEFAULT_OPEN_SECONDS
+    ):
+        if not urls:
+            raise ValueError("EndpointPool needs at least one endpoint URL.")
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.latency_alpha = latency_alpha
+        self.cold_load_penalty = cold_load_penalty
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._probe_session = requests.Session()
+
+    def acquire(self, model) -> Endpoint:
+        """
+        Picks an endpoint for `model` and counts the request as in flight.
+
+        Raises:
+            CircuitOpen: If every endpoint is out of rotation and none can
+                         take a trial request yet.
+        """
+        with self._lock:
+            # A half-open endpoint gets its single trial request first. Waiting for
+            # in_flight to drain means the next release on it is the trial's own.
+            candidates = [
+                e for e in self.endpoints
+                if not e.healthy and not e.trial_in_flight and e.in_flight == 0 and e.state == "half-open"
+            ][:1]
+            if not candidates:
+                candidates = [e for e in self.endpoints if e.healthy]
+            if not candidates:
+                retry_in = max(min(e.open_until for e in self.endpoints) - time.monotonic(), 0.0)
+                raise CircuitOpen(
+                    f"No Ollama endpoint in rotation (circuit open; next trial in {retry_in:.0f}s)."
+                )
+            chosen = min(candidates, key=lambda e: e.score(model, self.cold_load_penalty))
+            if not chosen.healthy:
+                chosen.trial_in_flight = True
+            chosen.in_flight += 1
+            chosen.requests += 1
+            return chosen
+
+    def release(self, endpoint, model=None, latency=None, failed=False):
+        """
+        Finishes a request started with `acquire`.
+
+        Args:
+            latency (float | None): Wall time of a successful request.
+            failed (bool): True if the endpoint timed out, was unreachable or
+                           returned a 5xx; counts toward its circuit breaker.
+        """
+        with self._lock:
+            endpoint.in_flight = max(endpoint.in_flight - 1, 0)
+            if endpoint.trial_in_flight:
+                # Trials only start on an idle endpoint and block other requests: this is the trial
+                endpoint.trial_in_flight = False
+            if failed:
+                endpoint.failures += 1
+                endpoint.consecutive_failures += 1
+                endpoint.last_failure = time.monotonic()
+                if not endpoint.healthy or endpoint.consecutive_failures >= self.failure_threshold:
+                    if endpoint.healthy:
+                        logger.warning(f"Removing {endpoint.base_url} from rotation.")
+                    endpoint.healthy = False
+                    endpoint.open_until = endpoint.last_failure + self.open_seconds
+                return
+
+            endpoint.consecutive_failures = 0
+            if not endpoint.healthy:
+                logger.info(f"Re-admitting {endpoint.base_url} to rotation.")
+                endpoint.healthy = True
+            if latency is not None:
+                if endpoint.latency is None:
+                    endpoint.latency = latency
+                else:
+                    a = self.latency_alpha
+                    endpoint.latency = a * latency + (1 - a) * endpoint.latency
+            if model:
+                endpoint.loaded_models.add(model)
+
+    def note_loaded(self, endpoint, model):
+        """Records that `model` is resident on `endpoint` (e.g. after a preload)."""
+        with self._lock:
+            endpoint.loaded_models.add(model)
+
+    def probe(self):
+        """Checks every endpoint once, updating health and resident models."""
+        for endpoint in self.endpoints:
+            try:
+                response = self._probe_session.get(endpoint.url(PS_PATH), timeout=self.probe_timeout)
+                response.raise_for_status()
+                models = {m.get("name") for m in response.json().get("models", [])}
+            except (requests.exceptions.RequestException, ValueError) as e:
+                if isinstance(e, requests.exceptions.HTTPError) and not is_endpoint_failure(e):
+                    continue  # It answered, just not /api/ps: leave its health to real requests
+                with self._lock:
+                    if endpoint.healthy or endpoint.state == "half-open":
+                        endpoint.open_until = time.monotonic() + self.open_seconds
+                    endpoint.healthy = False
+                continue
+
+            with self._lock:
+                if not endpoint.healthy:
+                    logger.info(f"Re-admitting {endpoint.base_url} to rotation.")
+                endpoint.healthy = True
+                endpoint.consecutive_failures = 0
+                endpoint.loaded_models = models
+
+    def _probe_loop(self):
+        while not self._stop.wait(self.probe_interval):
+            self.probe()
+
+    def start(self):
+        """Runs one probe now, then keeps probing in a daemon thread."""
+        self.probe()
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._probe_loop, name="ollama-probe", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.probe_timeout + 1)
+            self._thread = None
+        self._probe_session.close()
+
+    def stats(self):
+        with self._lock:
+            return [
+                {
+                    "endpoint": e.base_url,
+                    "healthy": e.healthy,
+                    "state": e.state,
+                    "in_flight": e.in_flight,
+                    "latency": e.latency,
+                    "requests": e.requests,
+                    "failures": e.failures,
+                    "loaded_models": sorted(m for m in e.loaded_models if m),
+                }
+                for e in self.endpoints
+            ]
@@ -0,0 +1,385 @@
+"""
+Deterministic stand-in for an Ollama server, for offline benchmarking.
+
+Implements the parts of the API the pipeline uses (/api/generate, /api/chat,
+/api/ps, /api/tags) with configurable latency, tokens/sec, failure injection
+and scripted responses, so `run_full_migration` throughput and concurrency can
+be measured without a model:
+
+    python -m src.utils.fake_ollama_server --port 11435 --latency lognormal:0.3:0.5 \\
+        --tokens-per-sec 40 --failure-rate 0.05 --script responses.json
+    python run_migration.py --endpoint http://127.0.0.1:11435/api/generate
+
+Every random draw is seeded from (seed, prompt hash, how many times that
+prompt has been seen), so a run is reproducible regardless of the order in
+which concurrent requests arrive.
+"""
+import re
+import sys
+import math
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 11435  # Next to Ollama's 11434 so both can run at once
+DEFAULT_MODELS = ["qwen2.5-coder:latest"]
+FAILURE_MODES = ("error", "timeout", "reset")
+TOKEN = re.compile(r"\s*\S+|\s+")
+
+
+def prompt_hash(text: str) -> str:
+    """Key used for scripted responses: sha256 of the prompt (or last chat message)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def parse_latency(spec: str):
+    """
+    Turns a latency spec into a sampler `f(rng) -> seconds`.
+
+    Specs: "fixed:S", "uniform:LO:HI", "normal:MEAN:SD", "lognormal:MEDIAN:SIGMA".
+    """
+    kind, *args = spec.split(":")
+    try:
+        values = [float(a) for a in args]
+    except ValueError:
+        raise ValueError(f"Bad latency spec '{spec}'")
+
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(*values)
+    if kind == "normal" and len(values) == 2:
+        return lambda rng: max(rng.gauss(*values), 0.0)
+    if kind == "lognormal" and len(values) == 2:
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"Bad latency spec '{spec}'")
+
+
+def default_response(prompt: str, json_mode: bool) -> str:
+    """Canned answer for unscripted prompts: a JSON object or a small R block."""
+    digest = prompt_hash(prompt)[:8]
+    if json_mode:
+        return json.dumps({"status": "ok", "id": digest})
+    return f"```r\n# fake response {digest}\nresult <- NULL\n```"
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """
+    HTTP server holding the fake's configuration and counters.
+
+    Args:
+        latency (str): Time-to-first-token distribution (see `parse_latency`).
+        tokens_per_sec (float): Generation speed; 0 means instant.
+        failure_rate (float): Probability a request fails.
+        failure_mode (str): "error" (HTTP 500), "timeout" (hang for
+                            `hang_seconds`) or "reset" (drop the connection).
+        script (dict | None): prompt hash -> response text. A "default" key
+                              replaces the canned answer for everything else.
+        load_seconds (float): Simulated cold load for a model's first request.
+        seed (int): Base seed for every random draw.
+    """
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", DEFAULT_PORT),
+        latency="fixed:0",
+        tokens_per_sec=0.0,
+        failure_rate=0.0,
+        failure_mode="error",
+        script=None,
+        models=None,
+        load_seconds=0.0,
+        hang_seconds=600.0,
+        seed=0
+    ):
+        if failure_mode not in FAILURE_MODES:
+            raise ValueError(f"failure_mode must be one of {FAILURE_MODES}")
+        super().__init__(address, FakeOllamaHandler)
+        self.latency = parse_latency(latency)
+        self.tokens_per_sec = tokens_per_sec
+        self.failure_rate = failure_rate
+        self.failure_mode = failure_mode
+        self.script = script or {}
+        self.models = list(models or DEFAULT_MODELS)
+        self.load_seconds = load_seconds
+        self.hang_seconds = hang_seconds
+        self.seed = seed
+
+        self._lock = threading.Lock()
+        self._seen = {}          # prompt hash -> times requested
+        self._loaded = set()
+        self._continuations = {} # context id -> (tokens, offset) for truncated answers
+        self.requests = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.connections = 0  # TCP connections accepted, to check client-side pooling
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def rng_for(self, key):
+        with self._lock:
+            n = self._seen.get(key, 0)
+            self._seen[key] = n + 1
+        return random.Random(f"{self.seed}:{key}:{n}")
+
+    def process_request(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+    def start(self):
+        """Serves in a daemon thread; returns self for chaining."""
+        threading.Thread(target=self.serve_forever, name="fake-ollama", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "failures": self.failures,
+                "peak_in_flight": self.peak_in_flight,
+                "connections": self.connections,
+            }
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/ps":
+            with self.server._lock:
+                loaded = sorted(self.server._loaded)
+            self.send_json(200, {"models": [{"name": m, "model": m} for m in loaded]})
+        elif self.path == "/api/tags":
+            self.send_json(200, {"models": [{"name": m, "model": m} for m in self.server.models]})
+        elif self.path in ("/", "/api/version"):
+            self.send_json(200, {"version": "fake"})
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self.send_json(400, {"error": "invalid JSON"})
+            return
+
+        if self.path == "/api/generate":
+            self.handle_generation(payload, chat=False)
+        elif self.path == "/api/chat":
+            self.handle_generation(payload, chat=True)
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def handle_generation(self, payload, chat):
+        server = self.server
+        model = payload.get("model", "")
+        if model not in server.models:
+            self.send_json(404, {"error": f"model '{model}' not found"})
+            return
+
+        if chat:
+            messages = payload.get("messages", [])
+            user_turns = [m.get("content", "") for m in messages if m.get("role") == "user"]
+            prompt = user_turns[-1] if user_turns else ""
+            prompt_text = "".join(m.get("content", "") for m in messages)
+        else:
+            prompt = prompt_text = payload.get("prompt")
+            if prompt is None:
+                # No prompt: a load / keep_alive request
+                load = self.load(model)
+                self.send_json(200, {"model": model, "response": "", "done": True,
+                                     "done_reason": "load", "load_duration": int(load * 1e9)})
+                return
+
+        key = prompt_hash(prompt)
+        rng = server.rng_for(key)
+        with server._lock:
+            server.requests += 1
+            server.in_flight += 1
+            server.peak_in_flight = max(server.peak_in_flight, server.in_flight)
+        try:
+            if rng.random() < server.failure_rate:
+                with server._lock:
+                    server.failures += 1
+                self.fail()
+                return
+            load = self.load(model)
+            tokens, offset = self.tokens_for(payload, prompt, key, chat)
+            self.answer(payload, chat, model, prompt_text, tokens, offset, load, server.latency(rng))
+        finally:
+            with server._lock:
+                server.in_flight -= 1
+
+    def load(self, model):
+        """Simulates a cold load the first time a model is used."""
+        with self.server._lock:
+            cold = model not in self.server._loaded
+            self.server._loaded.add(model)
+        if cold and self.server.load_seconds:
+            time.sleep(self.server.load_seconds)
+            return self.server.load_seconds
+        return 0.0
+
+    def fail(self):
+        mode = self.server.failure_mode
+        if mode == "error":
+            self.send_json(500, {"error": "injected failure"})
+        elif mode == "timeout":
+            time.sleep(self.server.hang_seconds)
+        else:
+            self.close_connection = True
+            self.connection.close()
+
+    def tokens_for(self, payload, prompt, key, chat):
+        """Response tokens and the offset to start from (non-zero when continuing)."""
+        context = payload.get("context")
+        if context:
+            with self.server._lock:
+                saved = self.server._continuations.get(context[-1])
+            if saved:
+                return saved
+        if chat:
+            # A chat continuation asks to carry on with the previous assistant turn
+            messages = payload.get("messages", [])
+            if len(messages) >= 2 and messages[-2].get("role") == "assistant":
+                with self.server._lock:
+                    saved = self.server._continuations.get(prompt_hash(messages[-2].get("content", "")))
+                if saved:
+                    return saved
+
+        script = self.server.script
+        json_mode = payload.get("format") == "json"
+        text = script.get(key, script.get("default")) or default_response(prompt, json_mode)
+        return TOKEN.findall(text), 0
+
+    def answer(self, payload, chat, model, prompt_text, tokens, offset, load, ttft):
+        server = self.server
+        num_predict = (payload.get("options") or {}).get("num_predict", -1)
+        end = len(tokens) if num_predict is None or num_predict < 0 else min(len(tokens), offset + num_predict)
+        emitted = tokens[offset:end]
+        truncated = end < len(tokens)
+
+        final = {
+            "model": model,
+            "done": True,
+            "done_reason": "length" if truncated else "stop",
+            "load_duration": int(load * 1e9),
+            "prompt_eval_count": len(TOKEN.findall(prompt_text)),
+            "prompt_eval_duration": int(ttft * 1e9),
+            "eval_count": len(emitted),
+        }
+        if truncated:
+            with server._lock:
+                context_id = len(server._continuations) + 1
+                server._continuations[context_id] = (tokens, end)
+                if chat:
+                    server._continuations[prompt_hash("".join(emitted))] = (tokens, end)
+            final["context"] = [context_id]
+        elif not chat:
+            final["context"] = [0]
+
+        def wrap(piece):
+            if chat:
+                return {"model": model, "message": {"role": "assistant", "content": piece}}
+            return {"model": model, "response": piece}
+
+        per_token = 1.0 / server.tokens_per_sec if server.tokens_per_sec else 0.0
+        time.sleep(ttft)
+        start = time.perf_counter()
+
+        if payload.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for token in emitted:
+                    time.sleep(per_token)
+                    self.write_chunk(dict(wrap(token), done=False))
+                final["eval_duration"] = int((time.perf_counter() - start) * 1e9)
+                self.write_chunk(dict(wrap(""), **final))
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # Client stopped reading early (streaming early stop)
+                self.close_connection = True
+            return
+
+        time.sleep(per_token * len(emitted))
+        final["eval_duration"] = int((time.perf_counter() - start) * 1e9)
+        self.send_json(200, dict(wrap("".join(emitted)), **final))
+
+    def write_chunk(self, data):
+        line = (json.dumps(data) + "\n").encode()
+        self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Deterministic fake Ollama server for offline benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", default="fixed:0",
+                        help="Time to first token: fixed:S | uniform:LO:HI | normal:MEAN:SD | lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0, help="Generation speed (0 = instant)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of requests to fail")
+    parser.add_argument("--failure-mode", choices=FAILURE_MODES, default="error")
+    parser.add_argument("--script", default=None, help="JSON file mapping sha256(prompt) -> response text")
+    parser.add_argument("--model", action="append", default=None, help="Model tag to serve (repeatable)")
+    parser.add_argument("--load-seconds", type=float, default=0.0, help="Simulated cold load per model")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    script = None
+    if args.script:
+        with open(args.script, "r") as f:
+            script = json.load(f)
+
+    server = FakeOllamaServer(
+        (args.host, args.port),
+        latency=args.latency,
+        tokens_per_sec=args.tokens_per_sec,
+        failure_rate=args.failure_rate,
+        failure_mode=args.failure_mode,
+        script=script,
+        models=args.model,
+        load_seconds=args.load_seconds,
+        seed=args.seed
+    )
+    print(f"🧪 Fake Ollama listening on {server.url} (models: {', '.join(server.models)})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"\n📊 {server.stats()}")
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import os
+import math
+import threading
+
+# Task types: how much the model is expected to write relative to what it reads
+TASK_CODE = "code"      # SPSS -> R translation, test generation, refinement
+TASK_JSON = "json"      # Structured extraction (json_mode)
+TASK_REVIEW = "review"  # PASS / FAIL verdicts
+TASK_PROSE = "prose"    # Specs and stakeholder docs
+
+# (output tokens per prompt token, floor, ceiling) for num_predict
+TASK_PROFILES = {
+    TASK_CODE: (1.5, 512, 4096),
+    TASK_JSON: (0.5, 128, 1024),
+    TASK_REVIEW: (0.0, 64, 256),
+    TASK_PROSE: (1.0, 512, 2048),
+}
+
+CHARS_PER_TOKEN = 3.5   # Conservative for code, which tokenises worse than prose
+CTX_STEP = 2048         # num_ctx is a multiple of this
+MIN_CTX = 2048          # Ollama's own default window
+MAX_CTX = int(os.environ.get("OLLAMA_MAX_CTX", "32768"))
+# The one num_ctx a run uses: Ollama reloads the model whenever num_ctx changes, so it is
+# never sized per prompt. Half of MAX_CTX holds the largest chunk (MAX_CTX // 4) plus a reply.
+RUN_CTX = min(max(int(os.environ.get("OLLAMA_NUM_CTX", MAX_CTX // 2)) // CTX_STEP * CTX_STEP, MIN_CTX), MAX_CTX)
+
+MAX_CONTINUATIONS = 2   # Follow-up requests allowed after a length-truncated answer
+CONTINUE_PROMPT = "Continue exactly where you stopped. Do not repeat anything you already wrote."
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count; avoids shipping a tokenizer for every model."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def infer_task(json_mode: bool = False, stop_at_code: bool = False) -> str:
+    """Task type for callers that don't name one."""
+    if json_mode:
+        return TASK_JSON
+    if stop_at_code:
+        return TASK_CODE
+    return TASK_PROSE
+
+
+_pinned_ctx = {}  # model -> num_ctx for this run
+_pin_lock = threading.Lock()
+
+
+def pin_context(model: str, num_ctx: int) -> int:
+    """Fixes the context window `model` is loaded and called with for the rest of the run."""
+    with _pin_lock:
+        _pinned_ctx[model] = num_ctx
+    return num_ctx
+
+
+def context_window(model: str | None = None) -> int:
+    """The run's num_ctx for `model` (RUN_CTX unless pinned otherwise); the same for every call."""
+    with _pin_lock:
+        return _pinned_ctx.setdefault(model, RUN_CTX)
+
+
+def size_options(prompt: str, task: str, num_ctx: int | None = None) -> dict:
+    """
+    Picks `num_predict` for a prompt, inside the run's fixed context window.
+
+    The output budget scales with the prompt (a 600-line SPSS file needs a
+    longer translation than a 10-line one) within the task's floor and
+    ceiling. `num_ctx` is not sized per prompt: a different value makes
+    Ollama reload the model and drop its prompt cache, so every call for a
+    model uses the same window (see `context_window`), and the reply budget
+    is capped so prompt plus reply still fit in it.
+
+    Args:
+        prompt (str): The full prompt text.
+        task (str): One of TASK_CODE, TASK_JSON, TASK_REVIEW, TASK_PROSE.
+        num_ctx (int | None): The model's pinned window (default: RUN_CTX).
+
+    Returns:
+        dict: {"num_predict": int, "num_ctx": int}
+    """
+    num_ctx = num_ctx or RUN_CTX
+    ratio, floor, ceiling = TASK_PROFILES.get(task, TASK_PROFILES[TASK_PROSE])
+    prompt_tokens = estimate_tokens(prompt)
+    num_predict = min(max(int(prompt_tokens * ratio), floor), ceiling)
+    # A huge prompt can't grow the window; keep the reply inside it
+    num_predict = min(num_predict, max(num_ctx - prompt_tokens, floor))
+    return {"num_predict": num_predict, "num_ctx": num_ctx}
+
+
+def size_chat_options(text: str, task: str, turns: int, num_ctx: int | None = None) -> dict:
+    """
+    Like `size_options`, but for a conversation expected to last `turns`
+    more exchanges: the reply budget per turn is cut so the whole
+    conversation fits in the same pinned window.
+    """
+    opts = size_options(text, task, num_ctx)
+    _, floor, _ = TASK_PROFILES.get(task, TASK_PROFILES[TASK_PROSE])
+    per_turn = (opts["num_ctx"] - estimate_tokens(text)) // (2 * max(turns, 1))
+    opts["num_predict"] = min(opts["num_predict"], max(per_turn, floor))
+    return opts
@@ -0,0 +1,154 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import defaultdict, OrderedDict
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 512 MB
+EVICT_LOW_WATER = 0.9  # An over-budget put evicts down to this share of max_bytes
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of LLM responses.
+
+    Every prompt runs at temperature 0.0, so (model, endpoint, prompt, options,
+    json_mode, stop_at_code) fully determines the answer. Each response is stored as
+    `<cache_dir>/<key[:2]>/<key>.json`; the file mtime doubles as the LRU
+    clock across runs. The directory is scanned once, into an in-memory
+    index of sizes in LRU order; once `max_bytes` is exceeded the oldest
+    entries are evicted down to EVICT_LOW_WATER of the budget, so puts near
+    the limit don't evict (or touch the disk index) every time.
+
+    In `read_only` mode (CI) the cache serves hits but never writes,
+    touches or evicts anything.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_MAX_BYTES, read_only=False):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+
+        self._lock = threading.Lock()
+        self.counters = defaultdict(lambda: {"hits": 0, "misses": 0})
+
+        if not read_only:
+            os.makedirs(self.cache_dir, exist_ok=True)
+        self._index = self._scan()  # key -> size, least recently used first
+        self.total_bytes = sum(self._index.values())
+
+    @staticmethod
+    def make_key(model, endpoint, prompt, options, json_mode, stop_at_code=False):
+        """
+        SHA-256 over a canonical JSON encoding of everything that shapes the response.
+
+        `stop_at_code` cuts a streamed answer short after its first code
+        block, so the stored text differs from a full answer to the same prompt.
+        """
+        material = {
+            "model": model,
+            "endpoint": endpoint,
+            "prompt": prompt,
+            "options": options,
+            "json_mode": bool(json_mode),
+        }
+        if stop_at_code:
+            material["stop_at_code"] = True  # Only when set, so full answers keep their existing keys
+        material = json.dumps(material, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _entry_paths(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        paths = []
+        for shard in os.listdir(self.cache_dir):
+            shard_dir = os.path.join(self.cache_dir, shard)
+            if not os.path.isdir(shard_dir):
+                continue
+            for name in os.listdir(shard_dir):
+                if name.endswith(".json"):
+                    paths.append(os.path.join(shard_dir, name))
+        return paths
+
+    def _scan(self):
+        entries = []
+        for path in self._entry_paths():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, os.path.basename(path)[:-len(".json")], st.st_size))
+        entries.sort()
+        return OrderedDict((key, size) for _, key, size in entries)
+
+    def get(self, key, stage="default"):
+        """Returns the cached response text, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                response = json.load(f)["response"]
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.counters[stage]["misses"] += 1
+            return None
+
+        if not self.read_only:
+            try:
+                os.utime(path)  # Mark as most recently used
+            except OSError:
+                pass
+        with self._lock:
+            self.counters[stage]["hits"] += 1
+            if not self.read_only and key in self._index:
+                self._index.move_to_end(key)
+        return response
+
+    def put(self, key, response, stage="default"):
+        """Stores a response atomically (temp file + rename)."""
+        if self.read_only or response is None:
+            return
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps({"stage": stage, "response": response}, ensure_ascii=False)
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        size = len(data.encode("utf-8"))
+        with self._lock:
+            self.total_bytes += size - self._index.pop(key, 0)
+            self._index[key] = size
+            over_budget = self.total_bytes > self.max_bytes
+        if over_budget:
+            self.evict(int(self.max_bytes * EVICT_LOW_WATER))
+
+    def evict(self, target_bytes=None):
+        """
+        Deletes least recently used entries until the cache fits in
+        `target_bytes` (default: max_bytes), using the in-memory index.
+        """
+        target = self.max_bytes if target_bytes is None else target_bytes
+        with self._lock:
+            while self._index and self.total_bytes > target:
+                key, size = self._index.popitem(last=False)
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+                self.total_bytes -= size
+            logger.info(f"LLM cache evicted down to {self.total_bytes} bytes.")
+
+    def stats(self):
+        """Returns {stage: {"hits": n, "misses": n}}."""
+        with self._lock:
+            return {stage: dict(c) for stage, c in self.counters.items()}
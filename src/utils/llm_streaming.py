@@ -0,0 +1,113 @@
+import re
+import threading
+
+# A fenced block: opening ``` line, body, then a ``` at the start of a line
+FENCED_BLOCK = re.compile(r"```[^\n]*\n.*?\n[ \t]*```", re.DOTALL)
+
+
+class CompletionDetector:
+    """
+    Watches streamed text for the point where the useful answer is complete.
+
+    * Code mode: the first fenced code block has been closed.
+    * JSON mode: the first top-level JSON object has balanced braces
+      (braces inside string literals are ignored).
+
+    Feed each chunk with `feed`; once it returns True the caller can stop
+    reading and `result` holds the text up to the end of the block/object.
+    """
+
+    def __init__(self, json_mode=False):
+        self.json_mode = json_mode
+        self.text = ""
+        self.end = None
+
+        # JSON scanner state
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk):
+        offset = len(self.text)
+        self.text += chunk
+        if self.end is not None:
+            return True
+
+        if self.json_mode:
+            self._scan_json(chunk, offset)
+        elif "`" in chunk:
+            match = FENCED_BLOCK.search(self.text)
+            if match:
+                self.end = match.end()
+        return self.end is not None
+
+    def _scan_json(self, chunk, offset):
+        for i, ch in enumerate(chunk):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = self._started
+            elif ch == "{":
+                self._depth += 1
+                self._started = True
+            elif ch == "}" and self._started:
+                self._depth -= 1
+                if self._depth == 0:
+                    self.end = offset + i + 1
+                    return
+
+    @property
+    def complete(self):
+        return self.end is not None
+
+    @property
+    def result(self):
+        return self.text[:self.end] if self.end is not None else self.text
+
+
+class StreamStats:
+    """Thread-safe accumulator for streaming metrics (shared by sync and async clients)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.streams = 0
+        self.early_stops = 0
+        self.tokens_received = 0
+        self.tokens_saved = 0
+        self.ttft_total = 0.0
+        self.ttft_count = 0
+
+    def record(self, ttft, tokens_received, num_predict, stopped_early):
+        """
+        Args:
+            ttft (float | None): Seconds until the first token arrived.
+            tokens_received (int): Chunks read (Ollama streams ~1 token per chunk).
+            num_predict (int): The generation budget for the request.
+            stopped_early (bool): Whether we closed the stream before `done`.
+        """
+        with self._lock:
+            self.streams += 1
+            self.tokens_received += tokens_received
+            if ttft is not None:
+                self.ttft_total += ttft
+                self.ttft_count += 1
+            if stopped_early:
+                self.early_stops += 1
+                # Upper bound: the model could have used the rest of its budget
+                self.tokens_saved += max(num_predict - tokens_received, 0)
+
+    def summary(self):
+        with self._lock:
+            return {
+                "streams": self.streams,
+                "early_stops": self.early_stops,
+                "tokens_received": self.tokens_received,
+                "tokens_saved": self.tokens_saved,
+                "avg_ttft": (self.ttft_total / self.ttft_count) if self.ttft_count else 0.0,
+            }
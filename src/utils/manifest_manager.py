@@ -1,15 +1,25 @@
 import os
-import json
 import re
 from src.utils.dependency_resolver import DependencyResolver
+from src.utils.spss_lexer import get_command_cache
+from src.utils.scan_cache import ScanCache, SCAN_CACHE_FILE, scan_file
+from src.utils.build_tracker import source_hashes
+from src.utils.manifest_store import open_manifest_store
+from src.utils.spss_ir import build_file_ir, save_ir, ir_path
 
 class ManifestManager:
-    def __init__(self, spss_dir, manifest_path="migration_manifest.json"):
+    def __init__(self, spss_dir, manifest_path="migration_manifest.json", backend=None, cache=None, scan_cache=None,
+                 workers=1):
         self.spss_dir = os.path.abspath(spss_dir)
         self.manifest_path = os.path.abspath(manifest_path)
+        self.store = open_manifest_store(self.manifest_path, backend)  # "json", "sqlite" or None (auto)
+        self.cache = cache or get_command_cache()  # Each .sps is lexed once for resolver and roles
         self.repo_root = os.path.dirname(self.spss_dir)
         self.specs_dir = os.path.join(self.repo_root, "specs")
         self.r_dir = os.path.join(self.repo_root, "r_from_spec")
+        # Per-file scan results survive between runs, so an unchanged tree isn't parsed again
+        self.scan_cache = scan_cache or ScanCache(os.path.join(self.repo_root, SCAN_CACHE_FILE), lexer_cache=self.cache)
+        self.workers = workers  # Parallel scan readers / parsers (see ScanEngine)
 
     def sanitize_function_name(self, filename):
         """
@@ -26,12 +36,8 @@ class ManifestManager:
         Rule: If it contains INSERT or INCLUDE commands, it's a Controller.
         """
         try:
-            with open(file_path, 'r', errors='ignore') as f:
-                content = f.read()
-            
-            # Regex to look for INSERT or INCLUDE command (case insensitive)
-            # Matches: INSERT FILE=... or INCLUDE FILE=...
-            is_controller = re.search(r'^\s*(INSERT|INCLUDE)\s+FILE=', content, re.MULTILINE | re.IGNORECASE)
+            # Same scan result DependencyResolver.scan used, so no second read
+            is_controller = scan_file(file_path, self.scan_cache, self.cache)["role"] == "controller"
             
             if is_controller:
                 return "controller"
@@ -42,17 +48,44 @@ class ManifestManager:
             print(f"⚠️ Could not read {file_path}: {e}")
             return "logic" # Default assumption
 
+    def load_previous(self):
+        """Entries of an existing manifest keyed by legacy_name, so build records survive a rescan."""
+        try:
+            return {e['legacy_name']: e for e in self.store.load() if 'legacy_name' in e}
+        except (ValueError, OSError) as e:
+            print(f"⚠️ Could not read previous manifest ({e}); starting fresh.")
+            return {}
+
+    def write_ir(self, entry, file_path, content_hash, old=None):
+        """
+        Saves the file's typed command IR (see spss_ir) as ir/<r_function_name>.json
+        next to the manifest, so later stages reuse it instead of re-parsing
+        the text. Skipped if the previous entry's IR was built from the same bytes.
+        """
+        path = ir_path(self.manifest_path, entry)
+        if not (old and old.get("ir_file") == path and old.get("ir_hash") == content_hash and os.path.exists(path)):
+            try:
+                save_ir(path, build_file_ir(file_path, self.cache), content_hash)
+            except OSError as e:
+                print(f"⚠️ Could not write IR for {file_path}: {e}")
+                return
+        entry["ir_file"] = path
+        entry["ir_hash"] = content_hash  # sha256 of this file alone (source_hash also covers its INSERTs)
+
     def generate_manifest(self):
         print("--- Initializing Smart Manifest ---")
+        previous = self.load_previous()
         
         # 1. Resolve Dependencies (Still needed for execution order)
-        resolver = DependencyResolver(self.spss_dir)
+        resolver = DependencyResolver(self.spss_dir, cache=self.cache, scan_cache=self.scan_cache, workers=self.workers)
         resolver.scan()
         ordered_files = resolver.get_execution_order()
         
         # Save architecture doc
         resolver.generate_architecture_doc(os.path.join(self.repo_root, "architecture.md"))
         
+        own = {name: self.scan_cache.content_hash(path) for name, path in resolver.file_map.items()}
+        hashes = source_hashes(resolver.file_map, resolver.includes, own=own)
         manifest = []
         
         for filename in ordered_files:
@@ -71,13 +104,20 @@ class ManifestManager:
                 "role": role,
                 "spec_file": os.path.join(self.specs_dir, f"{r_func_name}.md"),
                 "r_file": os.path.join(self.r_dir, f"{r_func_name}.R"),
+                # Covers files this one INSERTs, so changing them re-runs this entry too
+                "source_hash": hashes.get(filename),
                 "status": "pending"
             }
+            old = previous.get(filename)
+            if old is not None and old.get('r_function_name') == r_func_name:
+                entry["build"] = old.get("build", {})
+                if old.get("source_hash") == entry["source_hash"]:
+                    entry["status"] = old.get("status", "pending")
+            self.write_ir(entry, full_path, own[filename], old)
             manifest.append(entry)
             print(f"   Mapped {filename} -> {r_func_name} ({role})")
         
-        with open(self.manifest_path, 'w') as f:
-            json.dump(manifest, f, indent=4)
+        self.store.save(manifest)
         
         print(f"✅ Manifest generated. Check {self.manifest_path}")
 
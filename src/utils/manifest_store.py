@@ -0,0 +1,286 @@
+import os
+import json
+import logging
+import sqlite3
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_SUFFIX = ".journal"
+
+
+def atomic_write_json(path, data, compact=False):
+    """
+    Writes JSON to a temp file in the same directory, fsyncs it, then renames it over `path`.
+    `compact` drops the indentation and spaces (for machine-only artifacts).
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            if compact:
+                json.dump(data, f, separators=(",", ":"))
+            else:
+                json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ManifestStore:
+    """
+    Crash-safe persistence for migration_manifest.json.
+
+    The manifest itself is only ever replaced atomically (temp file +
+    rename), so a crash leaves either the old or the new file, never half
+    of one. Progress during a run goes to an append-only journal next to it
+    (`migration_manifest.json.journal`): one fsync'd JSON line per update,
+    naming the entry and the fields that changed. `load` replays the
+    journal on top of the manifest (ignoring a torn last line) and `save`
+    folds everything back into the manifest and clears the journal.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.journal_path = self.path + JOURNAL_SUFFIX
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(entry):
+        return entry.get("legacy_name") or entry.get("r_function_name")
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        """Returns the manifest entries with any journalled updates applied."""
+        with self._lock:
+            manifest = []
+            if os.path.exists(self.path):
+                with open(self.path, "r") as f:
+                    manifest = json.load(f)
+            by_key = {self.key(e): e for e in manifest}
+
+            replayed = 0
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, "r") as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            logger.warning("Ignoring torn journal line (crash during write).")
+                            continue
+                        entry = by_key.get(record.get("key"))
+                        if entry is not None:
+                            entry.update(record.get("fields", {}))
+                            replayed += 1
+            if replayed:
+                logger.info(f"Replayed {replayed} journalled manifest updates.")
+            return manifest
+
+    def save(self, manifest):
+        """Atomically rewrites the manifest and drops the journal it now contains."""
+        with self._lock:
+            atomic_write_json(self.path, manifest)
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+
+    def update(self, entry, **fields):
+        """Applies `fields` to `entry` and durably journals the change."""
+        line = json.dumps({"key": self.key(entry), "fields": fields})
+        with self._lock:
+            entry.update(fields)
+            with open(self.journal_path, "a") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+
+class SQLiteManifestStore:
+    """
+    Manifest backend on SQLite in WAL mode, for many concurrent workers.
+
+    One row per entry, with role, status and source_hash in their own
+    indexed columns and the full entry as JSON. `update` changes only the
+    named fields of one row in a single statement, so workers finishing
+    different files (or different stages of the same file) never overwrite
+    each other, and `claim` hands out pending entries one at a time. WAL
+    lets readers keep going while a worker writes. `save` also exports
+    migration_manifest.json so stages that read the JSON keep working.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            role TEXT,
+            status TEXT,
+            source_hash TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_entries_role ON entries(role);
+        CREATE INDEX IF NOT EXISTS idx_entries_status ON entries(status);
+        CREATE INDEX IF NOT EXISTS idx_entries_hash ON entries(source_hash);
+    """
+    COLUMNS = ("role", "status", "source_hash")
+
+    def __init__(self, path, json_path=None):
+        self.path = os.path.abspath(path)
+        self.json_path = os.path.abspath(json_path or os.path.splitext(self.path)[0] + ".json")
+        self._local = threading.local()
+        self._conn().executescript(self.SCHEMA)
+
+    key = staticmethod(ManifestStore.key)
+
+    def _conn(self):
+        # sqlite3 connections can't be shared across threads: one per worker
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")  # Durable across process crashes; fsync at checkpoints
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def exists(self):
+        return self._conn().execute("SELECT 1 FROM entries LIMIT 1").fetchone() is not None
+
+    def _rows(self, where="", params=()):
+        rows = self._conn().execute(f"SELECT data FROM entries {where} ORDER BY position", params)
+        return [json.loads(data) for (data,) in rows]
+
+    def load(self):
+        """
+        Returns every entry in manifest order. An empty database is seeded
+        from migration_manifest.json (and its journal), so switching
+        backend keeps the build records of earlier runs.
+        """
+        if not self.exists() and os.path.exists(self.json_path):
+            manifest = ManifestStore(self.json_path).load()
+            self._replace(manifest)
+            return manifest
+        return self._rows()
+
+    def query(self, role=None, status=None, source_hash=None):
+        """Entries matching every given column, through the indexes."""
+        clauses, params = [], []
+        for column, value in zip(self.COLUMNS, (role, status, source_hash)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        return self._rows("WHERE " + " AND ".join(clauses) if clauses else "", params)
+
+    def _replace(self, manifest):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM entries")
+            conn.executemany(
+                "INSERT INTO entries (key, position, role, status, source_hash, data) VALUES (?, ?, ?, ?, ?, ?)",
+                [(self.key(e), n, e.get("role"), e.get("status"), e.get("source_hash"), json.dumps(e))
+                 for n, e in enumerate(manifest)]
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def save(self, manifest):
+        """Replaces every row in one transaction, then exports the JSON manifest."""
+        self._replace(manifest)
+        self.export_json()
+
+    def export_json(self, path=None):
+        atomic_write_json(path or self.json_path, self._rows())
+
+    def update(self, entry, **fields):
+        """Applies `fields` to `entry` and writes just those fields of its row."""
+        entry.update(fields)
+        assignments = [f"{column} = ?" for column in self.COLUMNS if column in fields]
+        params = [fields[column] for column in self.COLUMNS if column in fields]
+        paths = []
+        for name, value in fields.items():
+            paths.append("?, json(?)")
+            params += [f"$.{name}", json.dumps(value)]
+        assignments.append(f"data = json_set(data, {', '.join(paths)})")
+        self._conn().execute(f"UPDATE entries SET {', '.join(assignments)} WHERE key = ?",
+                             params + [self.key(entry)])
+
+    def claim(self, worker, status="pending", role=None):
+        """
+        Atomically takes the first entry with `status` (and `role`) and marks
+        it "claimed:<worker>", so parallel workers never pick the same one.
+
+        Returns:
+            dict | None: The claimed entry, or None when nothing is left.
+        """
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            where, params = "WHERE status = ?", [status]
+            if role is not None:
+                where += " AND role = ?"
+                params.append(role)
+            row = conn.execute(f"SELECT data FROM entries {where} ORDER BY position LIMIT 1", params).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            entry = json.loads(row[0])
+            claimed = f"claimed:{worker}"
+            conn.execute("UPDATE entries SET status = ?, data = json_set(data, '$.status', ?) WHERE key = ?",
+                         (claimed, claimed, self.key(entry)))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        entry["status"] = claimed
+        return entry
+
+    def complete(self, entry, status="done"):
+        self.update(entry, status=status)
+
+
+BACKENDS = ("json", "sqlite")
+
+
+def open_manifest_store(manifest_path, backend=None):
+    """
+    Store for the manifest at `manifest_path` (the .json file).
+
+    Args:
+        manifest_path (str): Path of migration_manifest.json (or of its .db).
+        backend (str | None): "json" or "sqlite". None picks SQLite when the
+                              database already exists next to the JSON file.
+    """
+    path = os.path.abspath(manifest_path)
+    stem, ext = os.path.splitext(path)
+    json_path = stem + ".json" if ext == ".db" else path
+    db_path = stem + ".db"
+    if backend is None:
+        backend = "sqlite" if os.path.exists(db_path) else "json"
+    if backend == "sqlite":
+        return SQLiteManifestStore(db_path, json_path=json_path)
+    return ManifestStore(json_path)
+
+
+def load_manifest(manifest_path):
+    """The manifest entries from whichever backend is in use, journalled updates included."""
+    store = open_manifest_store(manifest_path)
+    try:
+        return store.load()
+    finally:
+        if isinstance(store, SQLiteManifestStore):
+            store.close()
@@ -0,0 +1,44 @@
+import threading
+
+NS_PER_SECOND = 1e9
+COLD_LOAD_THRESHOLD = 0.5  # load_duration (s) above which a call counts as a cold load
+
+
+class ModelTimings:
+    """
+    Thread-safe per-stage split of Ollama's server-side timings.
+
+    Every /api/generate reply reports `load_duration` (time spent getting the
+    model into memory) separately from `prompt_eval_duration` and
+    `eval_duration` (the actual generation), all in nanoseconds. Summing them
+    per stage shows how much of a stage is spent waiting for model loads.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def record(self, stage, reply):
+        """
+        Args:
+            stage (str): Pipeline stage that made the call.
+            reply (dict): Final /api/generate body (or final stream chunk).
+                          Replies without timing fields are ignored.
+        """
+        if "load_duration" not in reply and "eval_duration" not in reply:
+            return
+        load = reply.get("load_duration", 0) / NS_PER_SECOND
+        generate = (reply.get("prompt_eval_duration", 0) + reply.get("eval_duration", 0)) / NS_PER_SECOND
+        with self._lock:
+            counts = self._stages.setdefault(
+                stage, {"calls": 0, "cold_loads": 0, "load_seconds": 0.0, "generate_seconds": 0.0}
+            )
+            counts["calls"] += 1
+            counts["load_seconds"] += load
+            counts["generate_seconds"] += generate
+            if load > COLD_LOAD_THRESHOLD:
+                counts["cold_loads"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {stage: dict(counts) for stage, counts in self._stages.items()}
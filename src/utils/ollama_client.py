@@ -1,6 +1,22 @@
+import os
 import json
+import time
+import threading
 import requests
 import logging
+from requests.adapters import HTTPAdapter
+from src.utils.llm_streaming import CompletionDetector, StreamStats
+from src.utils.endpoint_pool import EndpointPool, GENERATE_PATH, CHAT_PATH
+from src.utils.llm_cache import ResponseCache
+from src.utils.single_flight import SingleFlight
+from src.utils.model_timing import ModelTimings, NS_PER_SECOND
+from src.utils.telemetry import Telemetry
+from src.utils.cassette import Cassette
+from src.utils.llm_budget import infer_task, size_options, context_window, MAX_CONTINUATIONS, CONTINUE_PROMPT
+from src.utils.retry import (
+    DEFAULT_MAX_RETRIES, DEFAULT_BACKOFF_BASE, DEFAULT_BACKOFF_CAP,
+    is_endpoint_failure, is_retryable, retry_delay, retry_limit, scaled_read_timeout,
+)
 
 # Configure logger for this module
 logger = logging.getLogger(__name__)
@@ -8,13 +24,602 @@ logger = logging.getLogger(__name__)
 # Default Constants
 DEFAULT_API_ENDPOINT = "http://localhost:11434/api/generate"
 # You mentioned testing Qwen2.5-coder, but switch to "llama3.2:3b" if preferred
-DEFAULT_MODEL = "qwen2.5-coder:latest" 
+DEFAULT_MODEL = "qwen2.5-coder:latest"
+
+# Transport Defaults
+DEFAULT_POOL_SIZE = 10       # Max keep-alive connections held per endpoint
+DEFAULT_CONNECT_TIMEOUT = 5  # Seconds to establish the TCP connection
+DEFAULT_READ_TIMEOUT = 120   # Minimum; grows with prompt and output size (see src/utils/retry.py)
+# How long Ollama keeps a model resident after each request. Ollama resets the
+# timer to its own 5m default on any request that omits keep_alive, so the
+# client sends this on every call to keep models pinned for the whole run.
+DEFAULT_KEEP_ALIVE = "30m"
+# Parallel generations the server accepts (mirror the server's OLLAMA_NUM_PARALLEL)
+DEFAULT_CONCURRENCY = int(os.environ.get("OLLAMA_NUM_PARALLEL", "1"))
+
+
+def strip_code_fences(raw_text: str) -> str:
+    """Removes a leading/trailing markdown code fence (e.g. ```spss ... ```)."""
+    if raw_text.startswith("```"):
+        lines = raw_text.splitlines()
+        # Remove first line if it's a backtick fence (e.g., ```spss)
+        if lines[0].startswith("```"):
+            lines = lines[1:]
+        # Remove last line if it's a backtick fence
+        if lines and lines[-1].strip().startswith("```"):
+            lines = lines[:-1]
+        raw_text = "\n".join(lines).strip()
+    return raw_text
+
+
+def build_generate_payload(prompt: str, model: str, json_mode: bool, task: str | None = None) -> dict:
+    """
+    Builds the /api/generate request body shared by the sync and async clients.
+
+    `num_predict` is sized from the prompt length and the task type (see
+    src/utils/llm_budget.py); `num_ctx` is the model's window for the run,
+    so the model is never reloaded between calls. `task` defaults to JSON
+    extraction in json_mode and prose otherwise.
+    """
+    options = {"temperature": 0.0}  # <--- CRITICAL FOR DETERMINISTIC CODE
+    options.update(size_options(prompt, task or infer_task(json_mode), context_window(model)))
+    payload = {
+        "model": model,
+        "prompt": prompt,
+        "stream": False,
+        "options": options
+    }
+
+    if json_mode:
+        payload["format"] = "json"
+    return payload
+
+
+def build_continuation_payload(payload: dict, context: list) -> dict:
+    """
+    Follow-up request that resumes a generation cut off by `num_predict`.
+
+    Ollama's `context` carries the original prompt and the partial answer, so
+    the model picks up mid-sentence instead of starting over.
+    """
+    follow = dict(payload, prompt=CONTINUE_PROMPT, context=context)
+    # The partial answer is already mid-object; forcing JSON would start a new one
+    follow.pop("format", None)
+    return follow
+
+
+def merge_chat_replies(first: dict, more: dict) -> dict:
+    """Joins a /api/chat reply with its continuation, summing the timing counters."""
+    merged = dict(more)
+    merged["message"] = {
+        "role": "assistant",
+        "content": first["message"]["content"] + more.get("message", {}).get("content", "")
+    }
+    for field in ("prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration"):
+        merged[field] = first.get(field, 0) + more.get(field, 0)
+    return merged
+
+
+def is_truncated(final_chunk: dict) -> bool:
+    """True if Ollama stopped because the output budget ran out."""
+    return final_chunk.get("done_reason") == "length" and bool(final_chunk.get("context"))
+
+
+class OllamaClient:
+    """
+    Owns a pooled keep-alive HTTP session to the Ollama API.
+
+    A single module-level instance (see `get_client`) is shared by every
+    pipeline stage, so the Analyst, Architect, Optimizer, QA and Doc prompts
+    all reuse the same TCP connections instead of opening one per call.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        read_timeout: float = DEFAULT_READ_TIMEOUT,
+        cache=None,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        streaming: bool = False,
+        endpoints: list | None = None,
+        keep_alive: str | None = None,
+        telemetry: Telemetry | None = None,
+        cassette: Cassette | None = None,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_base: float = DEFAULT_BACKOFF_BASE,
+        backoff_cap: float = DEFAULT_BACKOFF_CAP,
+        scale_timeouts: bool = True
+    ):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.scale_timeouts = scale_timeouts  # Grow the read timeout with prompt + num_predict
+        # Transient failures (timeouts, resets, 5xx, 429) are retried with jittered backoff
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.concurrency = concurrency  # Used by batch callers (see async_ollama_client)
+        self.cache = cache  # Optional ResponseCache (see src/utils/llm_cache.py)
+        self.streaming = streaming  # Read NDJSON chunks and stop once the answer is complete
+        self.stream_stats = StreamStats()
+        self.keep_alive = keep_alive  # e.g. "30m"; None leaves the server default
+        self.timings = ModelTimings()  # Model load vs generation time per stage
+        self.telemetry = telemetry or Telemetry()  # Per-call metrics (in memory unless given a file)
+        # Record/replay of HTTP exchanges (see src/utils/cassette.py); forces non-streaming
+        self.cassette = cassette
+
+        # Requests without an explicit endpoint are routed across this pool
+        self.endpoint_pool = EndpointPool(endpoints or [DEFAULT_API_ENDPOINT])
+        if len(self.endpoint_pool.endpoints) > 1:
+            self.endpoint_pool.start()
+
+        self.adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            pool_block=True  # Wait for a free connection rather than opening extras
+        )
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        self._lock = threading.Lock()
+        self.failed_requests = 0
+        self.retries = 0              # Extra attempts made after a transient failure
+        self.continuations = 0        # Follow-up requests sent for truncated answers
+        self.truncated_responses = 0  # Answers still truncated after MAX_CONTINUATIONS
+        # Concurrent identical requests share one upstream generation
+        self.single_flight = SingleFlight()
+        # Long-lived async client for batch callers, started on first use (see async_ollama_client)
+        self.batch_client = None
+
+    @property
+    def timeout(self) -> tuple:
+        """(connect, read) tuple as accepted by requests."""
+        return (self.connect_timeout, self.read_timeout)
+
+    def timeout_for(self, payload: dict) -> tuple:
+        """(connect, read) timeout for one request, scaled to its expected size."""
+        if not self.scale_timeouts:
+            return self.timeout
+        return (self.connect_timeout, scaled_read_timeout(payload, self.read_timeout))
+
+    def call_with_retries(self, model: str, endpoint: str | None, path: str, attempt):
+        """
+        Runs `attempt(url)` until it succeeds or fails for good.
+
+        Each try picks an endpoint from the pool (unless `endpoint` is fixed)
+        and reports the outcome to that endpoint's circuit breaker, so a retry
+        after a timeout usually lands on a different, healthy server.
+        Transient errors are retried up to `max_retries` times (none while
+        replaying a cassette) with full-jitter exponential backoff; a refused
+        connection is only retried, at once, when another endpoint can take it.
+
+        Returns:
+            (result of `attempt`, url that served it)
+
+        Raises:
+            The last error once retries are exhausted, or at once if the
+            error is not transient (e.g. a 404 or invalid JSON).
+        """
+        max_retries = retry_limit(self.max_retries, self.cassette)
+        failover = endpoint is None and len(self.endpoint_pool.endpoints) > 1
+        for attempt_no in range(max_retries + 1):
+            target = None
+            url = endpoint
+            if url is None:
+                target = self.endpoint_pool.acquire(model)
+                url = target.url(path)
+
+            start = time.perf_counter()
+            latency = None
+            failed = False
+            try:
+                result = attempt(url)
+                latency = time.perf_counter() - start
+                return result, url
+            except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+                failed = is_endpoint_failure(e)
+                if attempt_no == max_retries or not is_retryable(e, failover):
+                    raise
+                error = e
+            finally:
+                if target is not None:
+                    self.endpoint_pool.release(target, model=model, latency=latency, failed=failed)
+
+            delay = retry_delay(error, attempt_no, self.backoff_base, self.backoff_cap)
+            logger.warning(
+                f"Ollama request to {url} failed ({error}); retrying in {delay:.1f}s "
+                f"({attempt_no + 1}/{max_retries})..."
+            )
+            with self._lock:
+                self.retries += 1
+            time.sleep(delay)
+
+    def post_json(self, endpoint: str, payload: dict) -> dict:
+        """
+        POSTs a JSON payload over the pooled session and returns the decoded body.
+
+        With a cassette in replay mode the body comes from the cassette and
+        nothing is sent; in record mode every successful exchange is saved.
+
+        Raises:
+            requests.exceptions.RequestException: On transport or HTTP errors
+                                                  (CassetteMiss in replay mode).
+            json.JSONDecodeError: If the body is not valid JSON.
+        """
+        if self.cassette is not None and self.cassette.replaying:
+            return self.cassette.replay(endpoint, payload)
+        try:
+            start = time.perf_counter()
+            response = self.session.post(endpoint, json=payload, timeout=self.timeout_for(payload))
+            response.raise_for_status()
+            body = response.json()
+            if self.cassette is not None:
+                self.cassette.record(endpoint, payload, body, time.perf_counter() - start)
+            return body
+        except (requests.exceptions.RequestException, json.JSONDecodeError):
+            with self._lock:
+                self.failed_requests += 1
+            raise
+
+    def stream_generate(
+        self,
+        endpoint: str,
+        payload: dict,
+        json_mode: bool = False,
+        stop_at_code: bool = False,
+        prefix: str = ""
+    ) -> tuple:
+        """
+        Streams /api/generate and returns the raw text.
+
+        When `stop_at_code` (or `json_mode`) is set the connection is closed as
+        soon as the first fenced code block (or JSON object) is complete, which
+        makes Ollama abandon the generation instead of writing trailing
+        commentary we would throw away.
+
+        Args:
+            prefix (str): Text already generated by an earlier, truncated
+                          request; completion is judged on prefix + stream.
+
+        Returns:
+            tuple: (text including `prefix`, last chunk read). The last chunk
+                   holds `done_reason` / `context` when the stream finished.
+
+        Raises:
+            requests.exceptions.RequestException: On transport or HTTP errors.
+            json.JSONDecodeError: If a chunk is not valid JSON.
+        """
+        payload = dict(payload, stream=True)
+        watch = stop_at_code or json_mode
+        detector = CompletionDetector(json_mode=json_mode)
+        detector.feed(prefix)
+
+        start = time.perf_counter()
+        ttft = None
+        received = 0
+        stopped_early = False
+        chunk = {}
+        try:
+            with self.session.post(endpoint, json=payload, timeout=self.timeout_for(payload), stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    token = chunk.get("response", "")
+                    if token:
+                        if ttft is None:
+                            ttft = time.perf_counter() - start
+                        received += 1
+                    if detector.feed(token) and watch and not chunk.get("done"):
+                        stopped_early = True
+                        break
+                    if chunk.get("done"):
+                        break
+        except (requests.exceptions.RequestException, json.JSONDecodeError):
+            with self._lock:
+                self.failed_requests += 1
+            raise
+
+        num_predict = payload["options"].get("num_predict", 0)
+        self.stream_stats.record(ttft, received, num_predict, stopped_early)
+        if ttft is not None:
+            logger.info(
+                f"Stream: first token after {ttft:.2f}s, {received} tokens"
+                + (f", stopped early (saved up to {num_predict - received})" if stopped_early else "")
+            )
+        return (detector.result if watch else detector.text), chunk
+
+    def complete(
+        self,
+        endpoint: str,
+        payload: dict,
+        json_mode: bool = False,
+        stop_at_code: bool = False,
+        stage: str = "default",
+        tag: dict | None = None
+    ) -> str:
+        """
+        Runs one generation and returns its raw text, continuing it (up to
+        MAX_CONTINUATIONS times) while Ollama reports it was cut off by
+        `num_predict`, rather than retrying from scratch.
+
+        Raises:
+            requests.exceptions.RequestException: On transport or HTTP errors.
+            json.JSONDecodeError: If the body is not valid JSON.
+        """
+        text = ""
+        for attempt in range(MAX_CONTINUATIONS + 1):
+            start = time.perf_counter()
+            if self.streaming and self.cassette is None:
+                text, final = self.stream_generate(endpoint, payload, json_mode, stop_at_code, prefix=text)
+            else:
+                final = self.post_json(endpoint, payload)
+                text += final.get("response", "")
+            self.observe(final, time.perf_counter() - start, payload["model"], endpoint, stage, tag)
+
+            if not is_truncated(final):
+                break
+            if attempt == MAX_CONTINUATIONS:
+                logger.warning("Response still truncated after continuing; returning partial output.")
+                with self._lock:
+                    self.truncated_responses += 1
+                break
+
+            logger.info(
+                f"Response hit num_predict={payload['options'].get('num_predict')}; "
+                f"continuing ({attempt + 1}/{MAX_CONTINUATIONS})..."
+            )
+            with self._lock:
+                self.continuations += 1
+            payload = build_continuation_payload(payload, final["context"])
+        return text
+
+    def observe(self, reply: dict, latency: float, model: str, endpoint: str, stage: str, tag: dict | None = None):
+        """Feeds one Ollama reply to the per-stage timings and the telemetry sink."""
+        self.timings.record(stage, reply)
+        self.telemetry.record(dict(tag or {}, stage=stage), reply, latency, model=model, endpoint=endpoint)
+
+    def generate(
+        self,
+        prompt: str,
+        model: str = DEFAULT_MODEL,
+        endpoint: str | None = None,
+        json_mode: bool = False,
+        stage: str = "default",
+        stop_at_code: bool = False,
+        task: str | None = None,
+        tag: dict | None = None
+    ) -> str | None:
+        """Sends a prompt to /api/generate. See `get_ollama_response`."""
+        payload = build_generate_payload(prompt, model, json_mode, task or infer_task(json_mode, stop_at_code))
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+        request_key = ResponseCache.make_key(
+            model, endpoint or GENERATE_PATH, prompt, payload["options"], json_mode, stop_at_code
+        )
+        return self.single_flight.do(
+            request_key,
+            lambda: self._generate(payload, request_key, endpoint, stage, stop_at_code, tag)
+        )
+
+    def _generate(self, payload, request_key, endpoint, stage, stop_at_code, tag=None):
+        """Cache lookup + upstream call for one (already de-duplicated) request."""
+        model = payload["model"]
+        json_mode = payload.get("format") == "json"
+        logger.info(f"Sending request to Ollama (Model: {model}, JSON Mode: {json_mode})...")
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = request_key
+            cached = self.cache.get(cache_key, stage=stage)
+            if cached is not None:
+                logger.info(f"LLM cache hit ({stage}).")
+                return cached
+
+        try:
+            raw_text, _ = self.call_with_retries(
+                model, endpoint, GENERATE_PATH,
+                lambda url: self.complete(url, payload, json_mode, stop_at_code, stage=stage, tag=tag)
+            )
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Ollama API Request Failed: {e}")
+            return None
+        except json.JSONDecodeError:
+            logger.error("Failed to decode JSON response from Ollama API.")
+            return None
+
+        text = strip_code_fences(raw_text.strip())
+        if cache_key is not None:
+            self.cache.put(cache_key, text, stage=stage)
+        return text
+
+    def chat(
+        self,
+        messages: list,
+        model: str = DEFAULT_MODEL,
+        endpoint: str | None = None,
+        stage: str = "default",
+        options: dict | None = None,
+        tag: dict | None = None
+    ) -> dict | None:
+        """Sends a conversation to /api/chat. See `get_ollama_chat`."""
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": False,
+            "options": dict({"temperature": 0.0}, **(options or {}))
+        }
+        if self.keep_alive is not None:
+            payload["keep_alive"] = self.keep_alive
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(model, CHAT_PATH, messages, payload["options"], False)
+            cached = self.cache.get(cache_key, stage=stage)
+            if cached is not None:
+                logger.info(f"LLM cache hit ({stage}).")
+                return {"message": {"role": "assistant", "content": cached}, "done": True, "endpoint": endpoint}
+
+        def converse(url):
+            start = time.perf_counter()
+            reply = self.post_json(url, payload)
+            self.observe(reply, time.perf_counter() - start, model, url, stage, tag)
+            turn = list(messages)
+            for attempt in range(MAX_CONTINUATIONS):
+                if reply.get("done_reason") != "length":
+                    break
+                # No `context` on /api/chat: hand the partial answer back as a turn
+                with self._lock:
+                    self.continuations += 1
+                turn += [reply["message"], {"role": "user", "content": CONTINUE_PROMPT}]
+                part_start = time.perf_counter()
+                more = self.post_json(url, dict(payload, messages=turn))
+                self.observe(more, time.perf_counter() - part_start, model, url, stage, tag)
+                reply = merge_chat_replies(reply, more)
+            return reply
+
+        try:
+            reply, endpoint = self.call_with_retries(model, endpoint, CHAT_PATH, converse)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Ollama API Request Failed: {e}")
+            return None
+        except json.JSONDecodeError:
+            logger.error("Failed to decode JSON response from Ollama API.")
+            return None
+
+        reply["endpoint"] = endpoint
+        if cache_key is not None:
+            self.cache.put(cache_key, reply["message"]["content"], stage=stage)
+        return reply
+
+    def preload(self, models: list, keep_alive: str | None = None) -> dict:
+        """
+        Loads each model on every endpoint in the pool before the run starts.
+
+        Ollama treats a /api/generate call without a prompt as a load request,
+        so this pays the cold-load cost up front instead of in the first call
+        of whichever stage happens to need the model. It loads with the same
+        num_ctx every later call uses, or the first call would reload it.
+
+        Args:
+            models (list): Model tags to load.
+            keep_alive (str | None): Residency to request; defaults to the
+                                     client's `keep_alive`.
+
+        Returns:
+            dict: {"<endpoint> <model>": load seconds, or None if it failed}
+        """
+        keep_alive = keep_alive if keep_alive is not None else self.keep_alive
+        loaded = {}
+        for target in self.endpoint_pool.endpoints:
+            for model in models:
+                payload = {"model": model, "options": {"num_ctx": context_window(model)}}
+                if keep_alive is not None:
+                    payload["keep_alive"] = keep_alive
+                label = f"{target.base_url} {model}"
+                url = target.url(GENERATE_PATH)
+                start = time.perf_counter()
+                try:
+                    reply = self.post_json(url, payload)
+                except (requests.exceptions.RequestException, json.JSONDecodeError) as e:
+                    logger.warning(f"Could not preload {label}: {e}")
+                    loaded[label] = None
+                    continue
+                self.observe(reply, time.perf_counter() - start, model, url, "warmup")
+                self.endpoint_pool.note_loaded(target, model)
+                loaded[label] = reply.get("load_duration", 0) / NS_PER_SECOND
+        return loaded
+
+    def record_continuations(self, continuations: int, truncated: int):
+        """Adds counts from a batch client (see async_ollama_client) to this client's totals."""
+        with self._lock:
+            self.continuations += continuations
+            self.truncated_responses += truncated
+
+    def record_retries(self, retries: int):
+        """Adds retries made by a batch client to this client's total."""
+        with self._lock:
+            self.retries += retries
+
+    def pool_stats(self) -> dict:
+        """
+        Summarises connection reuse across every host in the pool.
+
+        Returns:
+            dict: requests sent, connections opened, requests served on a
+                  reused connection, and the resulting reuse rate.
+        """
+        total_requests = 0
+        total_connections = 0
+        pools = self.adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            total_requests += pool.num_requests
+            total_connections += pool.num_connections
+
+        reused = max(total_requests - total_connections, 0)
+        return {
+            "pool_size": self.pool_size,
+            "requests": total_requests,
+            "connections_opened": total_connections,
+            "reused": reused,
+            "reuse_rate": (reused / total_requests) if total_requests else 0.0,
+            "failed_requests": self.failed_requests,
+            "retries": self.retries,
+        }
+
+    def close(self):
+        if self.batch_client is not None:
+            self.batch_client.close()
+            self.batch_client = None
+        self.endpoint_pool.stop()
+        self.session.close()
+        if self.cassette is not None:
+            self.cassette.close()
+
+
+# --- Module-level shared client ---
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> OllamaClient:
+    """Returns the process-wide client, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = OllamaClient(cassette=Cassette.from_env())
+        return _client
+
+def configure_client(**kwargs) -> OllamaClient:
+    """
+    Replaces the shared client (e.g. to change pool size or timeouts).
+    Keyword arguments are passed straight to `OllamaClient`; the cassette
+    defaults to the one named by $LLM_CASSETTE, as for `get_client`.
+    """
+    global _client
+    kwargs.setdefault("cassette", Cassette.from_env())
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = OllamaClient(**kwargs)
+        return _client
+
 
 def get_ollama_response(
-    prompt: str, 
-    model: str = DEFAULT_MODEL, 
-    endpoint: str = DEFAULT_API_ENDPOINT, 
-    json_mode: bool = False
+    prompt: str,
+    model: str = DEFAULT_MODEL,
+    endpoint: str | None = None,
+    json_mode: bool = False,
+    stage: str = "default",
+    stop_at_code: bool = False,
+    task: str | None = None,
+    tag: dict | None = None
 ) -> str | None:
     """
     Sends a prompt to the Ollama API and returns the generated text response.
@@ -22,64 +627,64 @@ def get_ollama_response(
     Args:
         prompt (str): The input prompt for the LLM.
         model (str): The model tag to use (e.g., 'qwen2.5-coder:latest').
-        endpoint (str): The URL of the Ollama API.
+        endpoint (str | None): The URL of the Ollama API. When omitted the request
+                               goes to the least-loaded healthy endpoint of the
+                               client's pool (DEFAULT_API_ENDPOINT unless configured).
         json_mode (bool): If True, forces the model to respond in JSON format.
                           WARNING: Do NOT use this for generating SPSS code blocks,
                           as it forces the code into a string with escaped quotes.
+        stage (str): Pipeline stage making the call (e.g. 'analyst'). Used to
+                     attribute response-cache hits and misses.
+        stop_at_code (bool): In streaming mode, stop reading once the first
+                             fenced code block is closed. Only set this for
+                             prompts whose answer is a single code block.
+        task (str | None): Task type used to size num_predict
+                           (see src/utils/llm_budget.py). Inferred from
+                           json_mode / stop_at_code when omitted.
+        tag (dict | None): Extra caller fields for the telemetry record,
+                           e.g. {"function": "calc_delays", "attempt": 2}.
 
     Returns:
-        str | None: The text content of the response, or None if an error occurred.
+        str | None: The text content of the response, or None if the request
+                    still failed after the client's retries.
     """
-    logger.info(f"Sending request to Ollama (Model: {model}, JSON Mode: {json_mode})...")
+    return get_client().generate(
+        prompt, model=model, endpoint=endpoint, json_mode=json_mode, stage=stage,
+        stop_at_code=stop_at_code, task=task, tag=tag
+    )
 
-    headers = {"Content-Type": "application/json"}
 
-    payload = {
-        "model": model,
-        "prompt": prompt,
-        "stream": False,
-        "options": {
-            "temperature": 0.0,  # <--- CRITICAL FOR DETERMINISTIC CODE
-            "num_predict": 1000   # Ensure we don't get cut off
-        }
-    }
-    
+def get_ollama_chat(
+    messages: list,
+    model: str = DEFAULT_MODEL,
+    endpoint: str | None = None,
+    stage: str = "default",
+    options: dict | None = None,
+    tag: dict | None = None
+) -> dict | None:
+    """
+    Sends a conversation to the Ollama chat API and returns the reply.
 
-    if json_mode:
-        payload["format"] = "json"
+    Callers keep the message list and append each reply's `message`. As long
+    as earlier turns are unchanged and the same server answers, Ollama reuses
+    its cached evaluation of that prefix and only processes the new messages.
+    Chat requests are never streamed.
 
-    try:
-        response = requests.post(
-            endpoint,
-            headers=headers,
-            json=payload,
-            # Long timeout because code generation on local CPU can be slow
-            timeout=120 
-        )
-        response.raise_for_status()
-
-        response_data = response.json()
-        
-        raw_text = response_data.get("response", "").strip()
-
-        # --- NEW CLEANING LOGIC ---
-        # Remove markdown code fences if present
-        if raw_text.startswith("```"):
-            lines = raw_text.splitlines()
-            # Remove first line if it's a backtick fence (e.g., ```spss)
-            if lines[0].startswith("```"):
-                lines = lines[1:]
-            # Remove last line if it's a backtick fence
-            if lines and lines[-1].strip().startswith("```"):
-                lines = lines[:-1]
-            raw_text = "\n".join(lines).strip()
-        # --------------------------
-
-        return raw_text
-
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Ollama API Request Failed: {e}")
-        return None
-    except json.JSONDecodeError:
-        logger.error("Failed to decode JSON response from Ollama API.")
-        return None
\ No newline at end of file
+    Args:
+        messages (list): {"role": ..., "content": ...} dicts, oldest first.
+        model (str): The model tag to use.
+        endpoint (str | None): Full /api/chat URL. Pass back the `endpoint` of
+                               the previous reply to keep a conversation on one
+                               server; when omitted the pool picks one.
+        stage (str): Pipeline stage making the call.
+        options (dict | None): Generation options (num_predict, num_ctx).
+                               Keep num_ctx constant across a conversation or
+                               the server reloads the model.
+        tag (dict | None): Extra caller fields for the telemetry record.
+
+    Returns:
+        dict | None: Ollama's reply body, or None if an error occurred. Its
+                     `message` is the assistant turn and `endpoint` the URL
+                     that served it; prompt_eval_* / eval_* carry timings.
+    """
+    return get_client().chat(messages, model=model, endpoint=endpoint, stage=stage, options=options, tag=tag)
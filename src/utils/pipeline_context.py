@@ -0,0 +1,116 @@
+import os
+import csv
+import threading
+from src.utils.manifest_store import load_manifest
+from src.utils.spss_macros import MacroTable, MacroExpander
+
+GLOSSARY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "knowledge", "glossary.csv")
+DEFAULT_R_LIBS = ("dplyr", "lubridate", "stringr", "readr")
+
+
+def read_schema(repo_root):
+    """Backtick-quoted column names from input_data.csv, for the Architect prompt."""
+    csv_path = os.path.join(repo_root, "input_data.csv")
+
+    if not os.path.exists(csv_path):
+        if os.path.exists("input_data.csv"):
+            csv_path = "input_data.csv"
+        else:
+            return f"(No input_data.csv found at {csv_path} - strictly follow spec)"
+
+    try:
+        with open(csv_path, 'r') as f:
+            reader = csv.reader(f)
+            headers = next(reader)
+            return ", ".join([f"`{h}`" for h in headers])
+    except Exception:
+        return "(Error reading CSV header)"
+
+
+def read_glossary(glossary_path=GLOSSARY_PATH):
+    if not os.path.exists(glossary_path):
+        return "(No glossary found)"
+    with open(glossary_path, 'r') as f:
+        return f.read()
+
+
+def read_package_libs(repo_root):
+    """library() calls for the packages in DESCRIPTION's Imports (plus testthat)."""
+    desc_path = os.path.join(repo_root, "DESCRIPTION")
+    libs = {"testthat"}  # Always required for testing
+
+    if os.path.exists(desc_path):
+        with open(desc_path, 'r') as f:
+            content = f.read()
+            # Very basic parser for "Imports:" block
+            if "Imports:" in content:
+                block = content.split("Imports:")[1].split("Encoding:")[0]
+                # Clean up commas, newlines, and spaces
+                for item in block.replace("\n", "").replace(" ", "").split(","):
+                    if item: libs.add(item)
+    else:
+        # Fallback defaults
+        libs.update(DEFAULT_R_LIBS)
+
+    return [f"library({lib})" for lib in sorted(libs)]
+
+
+class PipelineContext:
+    """
+    Paths and shared inputs of one migration run.
+
+    Created once in run_full_migration and passed to every stage, so no
+    stage has to guess the project root or probe fallback locations, and
+    the manifest, input_data.csv header, glossary, DESCRIPTION imports and
+    the repository's macro table are each read once, on first use, rather
+    than by every stage or for every file.
+
+    Args:
+        project_root (str): The target repository.
+        manifest_path (str | None): migration_manifest.json (default: in project_root).
+        store: ManifestStore / SQLiteManifestStore to load the manifest from
+               (default: whichever backend `manifest_path` uses).
+    """
+
+    def __init__(self, project_root, manifest_path=None, store=None):
+        self.project_root = os.path.abspath(project_root)
+        self.manifest_path = os.path.abspath(manifest_path or os.path.join(self.project_root, "migration_manifest.json"))
+        self.store = store
+        self._lock = threading.RLock()  # A memoized value may be built from another (macros from manifest)
+        self._values = {}
+
+    def _memo(self, name, load):
+        with self._lock:
+            if name not in self._values:
+                self._values[name] = load()
+            return self._values[name]
+
+    def invalidate(self, *names):
+        """Forgets memoized values (all of them if no names), e.g. after DESCRIPTION is rewritten."""
+        with self._lock:
+            for name in names or list(self._values):
+                self._values.pop(name, None)
+
+    @property
+    def manifest(self):
+        """The manifest entries; every stage shares (and updates) this one list."""
+        return self._memo("manifest", lambda: self.store.load() if self.store else load_manifest(self.manifest_path))
+
+    @property
+    def schema(self):
+        return self._memo("schema", lambda: read_schema(self.project_root))
+
+    @property
+    def glossary(self):
+        return self._memo("glossary", read_glossary)
+
+    @property
+    def package_libs(self):
+        return self._memo("package_libs", lambda: read_package_libs(self.project_root))
+
+    @property
+    def macros(self):
+        """MacroExpander over every DEFINE in the manifest's files, in execution order."""
+        return self._memo("macros", lambda: MacroExpander(MacroTable.from_paths(
+            [e['legacy_file'] for e in self.manifest if os.path.exists(e.get('legacy_file', ''))]
+        )))
@@ -0,0 +1,164 @@
+import os
+import time
+import queue
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Worker pool a stage runs in
+LLM = "llm"  # Waits on the model server: as many workers as the server has parallel slots
+R = "r"      # Runs Rscript locally: bounded by CPU cores
+
+DEFAULT_R_WORKERS = max(1, min(4, (os.cpu_count() or 2) // 2))
+
+_STOP = float("inf")
+
+
+class Stage:
+    """
+    One step of the per-file pipeline.
+
+    Args:
+        name (str): Label used in progress output and timing stats.
+        fn (callable): fn(entry) -> result. Returning False (or raising)
+                       stops that entry; any other result moves it on.
+        kind (str): LLM or R, i.e. which worker pool runs it.
+        applies (callable | None): applies(entry) -> bool; entries it rejects
+                                   skip this stage and go straight to the next.
+        inputs (callable | None): inputs(entry) -> dict of hashes the stage
+                                  depends on. With a BuildTracker, the stage is
+                                  skipped when these are unchanged since its
+                                  last successful run (or, when resuming, when
+                                  the interrupted run already finished it).
+        output (callable | None): output(entry) -> path the stage writes.
+    """
+
+    def __init__(self, name, fn, kind=LLM, applies=None, inputs=None, output=None):
+        self.name = name
+        self.fn = fn
+        self.kind = kind
+        self.applies = applies or (lambda entry: True)
+        self.inputs = inputs
+        self.output = output or (lambda entry: None)
+
+
+class PipelineScheduler:
+    """
+    Moves every manifest entry through the stages independently.
+
+    Instead of a barrier after each stage, a file starts its next stage as
+    soon as its own previous stage is done and a worker of the right kind is
+    free. Within a pool, later stages go first, so files already in flight
+    finish before new ones start and the first results arrive early. Wall
+    time then tends to the slowest single file (the critical path) rather
+    than the sum of every stage's slowest file.
+    """
+
+    def __init__(self, stages, workers=None, tracker=None):
+        self.stages = list(stages)
+        self.tracker = tracker  # Optional BuildTracker for incremental and resumable runs
+        self.workers = {LLM: 1, R: DEFAULT_R_WORKERS}
+        self.workers.update(workers or {})
+        self.timings = {}  # (entry index, stage name) -> seconds
+        self.outcomes = {}  # entry index -> "done" or the name of the stage that stopped it
+        self.wall_seconds = 0.0
+
+    def _worker(self, jobs, results):
+        while True:
+            _, _, index, stage_no, entry = jobs.get()
+            if index < 0:
+                return
+            stage = self.stages[stage_no]
+            start = time.perf_counter()
+            try:
+                inputs = None
+                if self.tracker is not None:
+                    inputs = stage.inputs(entry) if stage.inputs is not None else None
+                    if self.tracker.is_fresh(stage.name, entry, inputs, stage.output(entry)):
+                        self.tracker.skip(stage.name, entry)
+                        results.put((index, stage_no, True, None))
+                        continue
+                ok = stage.fn(entry) is not False
+                if ok and self.tracker is not None:
+                    self.tracker.stage_done(stage.name, entry, inputs, stage.output(entry))
+            except Exception as e:
+                logger.exception(f"Stage {stage.name} failed")
+                print(f"   ❌ {stage.name} failed for {entry.get('r_function_name')}: {e}")
+                ok = False
+            results.put((index, stage_no, ok, time.perf_counter() - start))
+
+    def run(self, entries):
+        """
+        Runs every entry through the stages.
+
+        Returns:
+            dict: entry index -> "done", or the name of the stage that stopped it.
+        """
+        start = time.perf_counter()
+        jobs = {kind: queue.PriorityQueue() for kind in self.workers}
+        results = queue.Queue()
+        threads = [
+            threading.Thread(target=self._worker, args=(jobs[kind], results), daemon=True,
+                             name=f"pipeline-{kind}-{n}")
+            for kind, count in self.workers.items() for n in range(max(1, count))
+        ]
+        for thread in threads:
+            thread.start()
+
+        in_flight = 0
+
+        def submit(index, stage_no):
+            entry = entries[index]
+            while stage_no < len(self.stages) and not self.stages[stage_no].applies(entry):
+                stage_no += 1
+            if stage_no == len(self.stages):
+                self.outcomes[index] = "done"
+                return 0
+            # Lower sorts first: later stages, then manifest order
+            jobs[self.stages[stage_no].kind].put((-stage_no, index, index, stage_no, entry))
+            return 1
+
+        for index in range(len(entries)):
+            in_flight += submit(index, 0)
+
+        while in_flight:
+            index, stage_no, ok, seconds = results.get()
+            in_flight -= 1
+            if seconds is not None:  # None: skipped as up to date
+                self.timings[(index, self.stages[stage_no].name)] = seconds
+            if ok:
+                in_flight += submit(index, stage_no + 1)
+            else:
+                self.outcomes[index] = self.stages[stage_no].name
+
+        for kind, count in self.workers.items():
+            for _ in range(max(1, count)):
+                jobs[kind].put((_STOP, 0, -1, -1, None))
+        for thread in threads:
+            thread.join()
+
+        self.wall_seconds = time.perf_counter() - start
+        return self.outcomes
+
+    def stats(self):
+        """
+        Returns:
+            dict: wall time, the critical path (slowest single file end to
+                  end), what stage barriers would cost (sum over stages of
+                  the slowest file in that stage), and per-stage totals.
+        """
+        per_entry = {}
+        stage_max = {}
+        stage_total = {}
+        for (index, name), seconds in self.timings.items():
+            per_entry[index] = per_entry.get(index, 0.0) + seconds
+            stage_max[name] = max(stage_max.get(name, 0.0), seconds)
+            stage_total[name] = stage_total.get(name, 0.0) + seconds
+        return {
+            "wall_seconds": self.wall_seconds,
+            "critical_path_seconds": max(per_entry.values(), default=0.0),
+            "barrier_seconds": sum(stage_max.values()),
+            "stage_seconds": stage_total,
+            "stopped": {i: s for i, s in self.outcomes.items() if s != "done"},
+        }
@@ -1,10 +1,20 @@
 import re
-from src.utils.ollama_client import get_ollama_response
+from src.utils.ollama_client import get_ollama_response, DEFAULT_MODEL
+from src.utils.chat_session import ChatSession, reply_timings
+
+FIX_TASK = "### TASK:\nFix the code to resolve the error. Return the FULL corrected R code."
 
 class RefiningAgent:
-    def __init__(self, system_prompt, max_retries=3):
+    def __init__(self, system_prompt, max_retries=3, stage="optimizer", chat=False, function=None,
+                 model=DEFAULT_MODEL):
         self.system_prompt = system_prompt
+        self.model = model
         self.max_retries = max_retries
+        self.stage = stage
+        self.function = function  # Name of the R function being refined (telemetry tag)
+        # chat=True keeps one /api/chat conversation across retries, so each
+        # retry sends only the new error and the server reuses its prompt cache
+        self.chat = chat
         self.trace = []  # <--- NEW: Stores the conversation history
 
     def extract_code(self, response):
@@ -49,21 +59,43 @@ class RefiningAgent:
 
         # Start the Retry Loop
         error_history = f"Attempt 1 Failed: {error}"
+        session = ChatSession(self.system_prompt, model=self.model, stage=self.stage, turns=self.max_retries) if self.chat else None
         
         for attempt in range(1, self.max_retries + 1):
             print(f"   [Agent] Asking LLM to fix (History: {attempt} failures)...")
+            tag = {"function": self.function, "attempt": attempt}
             
-            # Construct the Prompt
-            prompt = (
-                f"{self.system_prompt}\n\n"
-                f"### CURRENT CODE:\n```r\n{current_code}\n```\n\n"
-                f"### ERROR HISTORY:\n{error_history}\n\n"
-                f"### TASK:\n"
-                f"Fix the code to resolve the error. Return the FULL corrected R code."
-            )
+            if session is not None:
+                # Only the first turn carries the code; later turns add just the new error
+                if attempt == 1:
+                    prompt = f"### CURRENT CODE:\n```r\n{current_code}\n```\n\n### ERROR:\n{error_history}\n\n{FIX_TASK}"
+                else:
+                    prompt = f"### ERROR:\nAttempt {attempt} Failed: {error}\n\n{FIX_TASK}"
+                reply = session.send(prompt, tag=tag)
+                response = reply["message"]["content"] if reply else None
+                timings = reply_timings(reply)
+            else:
+                # Construct the Prompt
+                prompt = (
+                    f"{self.system_prompt}\n\n"
+                    f"### CURRENT CODE:\n```r\n{current_code}\n```\n\n"
+                    f"### ERROR HISTORY:\n{error_history}\n\n"
+                    f"{FIX_TASK}"
+                )
+                # Call LLM
+                response = get_ollama_response(
+                    prompt, model=self.model, stage=self.stage, stop_at_code=True, tag=tag
+                )
+                timings = {}
+
+            if response is None:
+                # The client already retried the transport; validating "" would burn
+                # the remaining attempts and throw away the current draft
+                print("   ❌ [Agent] LLM unavailable after retries; stopping.")
+                self.trace.append({"step": attempt, "prompt": prompt, "response": None,
+                                   "success": False, "error": "LLM request failed"})
+                return None
 
-            # Call LLM
-            response = get_ollama_response(prompt)
             new_code = self.extract_code(response)
 
             # Validate
@@ -76,7 +108,8 @@ class RefiningAgent:
                 "response": response,
                 "code_attempt": new_code,
                 "success": success,
-                "error": new_error
+                "error": new_error,
+                **timings
             })
 
             if success:
@@ -84,6 +117,7 @@ class RefiningAgent:
             
             # Update History
             error_history += f"\n\nAttempt {attempt+1} Failed: {new_error}"
+            error = new_error
             current_code = new_code # Iterate on the new draft
 
         print(f"   ❌ [Agent] Exhausted {self.max_retries} retries.")
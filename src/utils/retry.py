@@ -0,0 +1,94 @@
+import os
+import random
+import requests
+import httpx
+
+from src.utils.llm_budget import estimate_tokens
+
+DEFAULT_MAX_RETRIES = int(os.environ.get("OLLAMA_MAX_RETRIES", "3"))  # The test suite sets 0
+DEFAULT_BACKOFF_BASE = 1.0   # Seconds; the cap doubles with every attempt
+DEFAULT_BACKOFF_CAP = 30.0
+
+# 429 means "busy", not "broken": retry it, but don't hold it against the endpoint
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+ENDPOINT_FAILURE_STATUS = {500, 502, 503, 504}
+
+
+def backoff_delay(attempt, base=DEFAULT_BACKOFF_BASE, cap=DEFAULT_BACKOFF_CAP):
+    """
+    "Full jitter" exponential backoff: a uniform draw from
+    [0, min(cap, base * 2**attempt)], so parallel callers that failed
+    together don't all come back at the same moment.
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def _status(exc):
+    response = getattr(exc, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def is_endpoint_failure(exc) -> bool:
+    """True if the error says the endpoint itself is unwell (counts toward its circuit breaker)."""
+    if isinstance(exc, (requests.exceptions.Timeout, requests.exceptions.ConnectionError, httpx.TransportError)):
+        return True
+    return _status(exc) in ENDPOINT_FAILURE_STATUS
+
+
+def is_connection_refused(exc) -> bool:
+    """True if nothing is listening at the endpoint: the server is down, not busy."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        if isinstance(exc, ConnectionRefusedError):
+            return True
+        # requests / urllib3 wrap the socket error in `reason`, httpx in __cause__
+        exc = getattr(exc, "reason", None) or exc.__cause__ or exc.__context__ or next(
+            (arg for arg in getattr(exc, "args", ()) if isinstance(arg, BaseException)), None
+        )
+    return False
+
+
+def is_retryable(exc, failover=False) -> bool:
+    """
+    True for transient errors worth another attempt (timeouts, resets, 5xx, 429).
+
+    A refused connection won't go away by waiting, so it is only worth
+    another attempt with `failover` (another endpoint can take the request),
+    and then without backoff (see `retry_delay`).
+    """
+    if is_connection_refused(exc):
+        return failover
+    return is_endpoint_failure(exc) or _status(exc) in RETRYABLE_STATUS
+
+
+def retry_delay(exc, attempt, base=DEFAULT_BACKOFF_BASE, cap=DEFAULT_BACKOFF_CAP):
+    """Seconds to wait before retrying after `exc`: none after a refused connection, else `backoff_delay`."""
+    return 0.0 if is_connection_refused(exc) else backoff_delay(attempt, base, cap)
+
+
+def retry_limit(max_retries, cassette=None):
+    """`max_retries`, or 0 while a cassette is replaying: a replayed answer never fails transiently."""
+    return 0 if cassette is not None and cassette.replaying else max_retries
+
+
+# Expected throughput of a slow (CPU-only) server, used to size read timeouts
+PROMPT_TOKENS_PER_SEC = 100.0
+OUTPUT_TOKENS_PER_SEC = 8.0
+MAX_READ_TIMEOUT = 900.0
+
+
+def scaled_read_timeout(payload, minimum, ceiling=MAX_READ_TIMEOUT):
+    """
+    Read timeout for one request: `minimum` plus the time a slow server needs
+    to read the prompt and write `num_predict` tokens, capped at `ceiling`.
+
+    A flat timeout either kills long translations of big SPSS files or
+    leaves a hung server holding a short PASS/FAIL review for minutes.
+    """
+    text = payload.get("prompt") or ""
+    for message in payload.get("messages") or []:
+        text += message.get("content", "")
+    num_predict = (payload.get("options") or {}).get("num_predict", 0)
+    expected = estimate_tokens(text) / PROMPT_TOKENS_PER_SEC + num_predict / OUTPUT_TOKENS_PER_SEC
+    return min(max(ceiling, minimum), minimum + expected)
@@ -6,7 +6,7 @@ import json
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 
-from src.utils.ollama_client import get_ollama_response
+from src.utils.async_ollama_client import request_all
 from src.utils.spss_scanner import SPSSCommandScanner
 
 ROSETTA_PROMPT_SPSS_TO_R = """
@@ -52,10 +52,11 @@ def build_reverse_rosetta(repo_path):
     results = []
     print(f"--- Building Reverse Rosetta Stone for {len(commands)} commands ---")
     
-    for cmd in commands:
+    prompts = [ROSETTA_PROMPT_SPSS_TO_R.format(spss_cmd=cmd) for cmd in commands]
+    responses = request_all(prompts, stage="rosetta")
+
+    for cmd, response in zip(commands, responses):
         print(f"Mapping: {cmd}...")
-        prompt = ROSETTA_PROMPT_SPSS_TO_R.format(spss_cmd=cmd)
-        response = get_ollama_response(prompt)
         
         data = extract_json(response)
         
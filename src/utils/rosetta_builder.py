@@ -1,5 +1,5 @@
 import pandas as pd
-from src.utils.ollama_client import get_ollama_response
+from src.utils.async_ollama_client import request_all
 from src.utils.function_scanner import RFunctionScanner
 
 ROSETTA_PROMPT = """
@@ -28,10 +28,11 @@ def build_rosetta_stone(r_file_path):
     results = []
     print(f"--- Building Rosetta Stone for {len(funcs)} functions ---")
     
-    for func in funcs:
+    prompts = [ROSETTA_PROMPT.format(r_func=func) for func in funcs]
+    responses = request_all(prompts, stage="rosetta")
+
+    for func, response in zip(funcs, responses):
         print(f"Mapping: {func}...")
-        prompt = ROSETTA_PROMPT.format(r_func=func)
-        response = get_ollama_response(prompt)
         
         # Simple parsing (assuming LLM returns clean JSON or we clean it)
         try:
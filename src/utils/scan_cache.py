@@ -0,0 +1,202 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+from collections import Counter
+from src.utils.spss_lexer import get_command_cache
+from src.utils.build_tracker import file_hash
+
+SCAN_CACHE_FILE = ".scan_cache.db"
+# Bump when summarize_commands changes, so stale results are re-parsed
+SCAN_CACHE_VERSION = 2
+
+INCLUDE_COMMANDS = ("INSERT", "INCLUDE")
+EXTERNAL_SOURCE = re.compile(r"TYPE\s*=\s*(XLS|ODBC)|\.XLS", re.IGNORECASE)
+TIME_SERIES = re.compile(r"\b(LAG|LEAD)\s*\(", re.IGNORECASE)
+
+
+def summarize_commands(commands):
+    """
+    Everything the scanners want to know about one file, from its command stream.
+
+    Returns:
+        dict: includes (INSERT/INCLUDE targets), role ("controller" if it
+              includes anything, else "logic"), commands (keyword -> count,
+              comments excluded), macros (DEFINE names), external_inputs
+              (lines reading Excel/ODBC) and time_logic ("<line> uses ..." notes).
+    """
+    includes, macros, external, time_logic = [], [], [], []
+    counts = Counter()
+    last_command = ""
+    for cmd in commands:
+        if cmd.is_comment:
+            continue
+        counts[cmd.keyword] += 1
+        if cmd.is_data:
+            continue
+        line = cmd.first_line
+
+        # Drivers (Excel/ODBC inputs)
+        if cmd.keyword in ("GET DATA", "GET TRANSLATE") and EXTERNAL_SOURCE.search(cmd.args):
+            external.append(line)
+
+        # Control flow (chaining)
+        if cmd.keyword in INCLUDE_COMMANDS:
+            target = cmd.file_arg()
+            if target:
+                includes.append(target)
+
+        # Macros (the logic engine)
+        if cmd.keyword == "DEFINE" and cmd.args:
+            macros.append(cmd.args.split()[0].split("(")[0].upper())
+
+        # Time series / lag logic
+        if TIME_SERIES.search(cmd.text):
+            risk = "High" if last_command != "SORT CASES" else "Low"
+            time_logic.append(f"{line} uses LAG/LEAD (Risk: {risk})")
+        if cmd.keyword == "CREATE":
+            # CREATE is used in SPSS to make moving averages / lags
+            time_logic.append(f"{line} uses CREATE (Explicit Time Series gen)")
+        if cmd.keyword in ("TSMODEL", "EXSMOOTH"):
+            time_logic.append(f"{line} uses FORECASTING MODELS")
+
+        last_command = cmd.keyword
+
+    return {
+        "includes": includes,
+        "role": "controller" if includes else "logic",
+        "commands": dict(counts),
+        "macros": macros,
+        "external_inputs": external,
+        "time_logic": time_logic,
+    }
+
+
+def scan_file(path, scan_cache=None, lexer_cache=None):
+    """summarize_commands for one file, through the persistent cache if there is one."""
+    if scan_cache is not None:
+        return scan_cache.scan(path)
+    return summarize_commands((lexer_cache or get_command_cache()).commands(path))
+
+
+class ScanCache:
+    """
+    On-disk cache of per-file scan results (see summarize_commands).
+
+    A file whose mtime and size match its row is a hit without being
+    opened. If the stat changed (a touch, a checkout) the content hash is
+    compared before re-parsing, so only files whose bytes changed are lexed
+    again. Results live in one SQLite file (default `.scan_cache.db` in
+    the target repo), loaded in a single query and written back in one
+    transaction by `flush`.
+    """
+
+    def __init__(self, path, lexer_cache=None):
+        self.path = os.path.abspath(path)
+        self.lexer_cache = lexer_cache or get_command_cache()
+        self._lock = threading.Lock()
+        self._rows = None      # abspath -> [mtime_ns, size, content_hash, result]
+        self._dirty = {}       # abspath -> row to write
+        self.hits = 0
+        self.rehashed = 0      # Stat changed, content didn't
+        self.parsed = 0
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER,
+                size INTEGER,
+                content_hash TEXT,
+                result TEXT
+            )
+        """)
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCAN_CACHE_VERSION:
+            conn.execute("DELETE FROM files")
+            conn.execute(f"PRAGMA user_version = {SCAN_CACHE_VERSION}")
+            conn.commit()
+        return conn
+
+    def _load(self):
+        if self._rows is None:
+            try:
+                conn = self._connect()
+                try:
+                    self._rows = {
+                        path: [mtime, size, digest, json.loads(result)]
+                        for path, mtime, size, digest, result in conn.execute("SELECT * FROM files")
+                    }
+                finally:
+                    conn.close()
+            except sqlite3.Error as e:
+                print(f"⚠️ Scan cache unreadable ({e}); rescanning everything.")
+                self._rows = {}
+        return self._rows
+
+    def check(self, path, st):
+        """
+        Returns:
+            tuple: (result, row). `result` is the cached scan if `st` still
+                   matches (a hit); otherwise None, with the stale row (or
+                   None) for `resolve` to compare hashes against.
+        """
+        with self._lock:
+            row = self._load().get(path)
+            if row is not None and (row[0], row[1]) == (st.st_mtime_ns, st.st_size):
+                self.hits += 1
+                return row[3], row
+        return None, row
+
+    def resolve(self, path, st, digest, row, parse):
+        """Reuses the stale row's result if the content hash is unchanged, else calls parse()."""
+        if row is not None and row[2] == digest:
+            result, counter = row[3], "rehashed"
+        else:
+            result, counter = parse(), "parsed"
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+            self._rows[path] = self._dirty[path] = [st.st_mtime_ns, st.st_size, digest, result]
+        return result
+
+    def scan(self, path):
+        """Scan result for one .sps file, from the cache when it is still valid."""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        result, row = self.check(path, st)
+        if result is not None:
+            return result
+        return self.resolve(path, st, file_hash(path), row,
+                            lambda: summarize_commands(self.lexer_cache.commands(path)))
+
+    def content_hash(self, path):
+        """sha256 of the file's bytes as of its last scan."""
+        path = os.path.abspath(path)
+        self.scan(path)
+        with self._lock:
+            return self._rows[path][2]
+
+    def flush(self):
+        """Writes new and changed rows back in one transaction."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+        try:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO files (path, mtime_ns, size, content_hash, result) VALUES (?, ?, ?, ?, ?)",
+                        [(p, r[0], r[1], r[2], json.dumps(r[3])) for p, r in dirty.items()]
+                    )
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"⚠️ Could not write scan cache ({e}).")
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "rehashed": self.rehashed, "parsed": self.parsed}
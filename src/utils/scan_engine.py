@@ -0,0 +1,132 @@
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from src.utils.spss_lexer import iter_commands, get_command_cache
+from src.utils.scan_cache import summarize_commands, scan_file
+
+# Reads are latency-bound on network shares, so more threads than cores pay off
+DEFAULT_SCAN_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+# Below this many files to parse, a process pool costs more to start than it saves
+PROCESS_POOL_MIN_FILES = 64
+
+
+def walk_sps(root):
+    """
+    Every .sps file under `root`, found with os.scandir (one directory
+    read per folder, no per-file stat) and returned in sorted order so
+    scans are deterministic whatever order the filesystem lists them in.
+    """
+    found = []
+    pending = [root]
+    while pending:
+        directory = pending.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.name.lower().endswith('.sps'):
+                        found.append(entry.path)
+        except OSError as e:
+            print(f"⚠️ Could not list {directory}: {e}")
+    return sorted(found)
+
+
+def parse_bytes(data):
+    """summarize_commands for raw file bytes (runs in a worker process)."""
+    text = data.decode('utf-8', errors='ignore')
+    return summarize_commands(iter_commands(text.splitlines()))
+
+
+class ScanEngine:
+    """
+    Scans many .sps files at once.
+
+    A thread pool stats each file, checks the ScanCache and reads the bytes
+    of anything that changed, so network latency overlaps instead of adding
+    up. Once enough files need parsing, each read is handed straight to a
+    process pool for lexing while other reads are still in flight; a
+    touched-but-unchanged file is matched by hash and never parsed. Results
+    come back in the order the paths were given, whichever worker finished
+    first, so merging them is deterministic.
+
+    Args:
+        workers (int): Reader threads and parser processes. 1 scans in the
+                       calling thread, as before.
+        scan_cache (ScanCache | None): Persistent per-file results.
+        lexer_cache (CommandCache | None): Used when scanning in-thread.
+        process_min_files (int): Parse in processes only when at least this
+                                 many files need parsing.
+    """
+
+    def __init__(self, workers=1, scan_cache=None, lexer_cache=None, process_min_files=PROCESS_POOL_MIN_FILES):
+        self.workers = max(1, workers or 1)
+        self.scan_cache = scan_cache
+        self.lexer_cache = lexer_cache or get_command_cache()
+        self.process_min_files = process_min_files
+
+    def _read(self, path):
+        """(result, None) if the cache answers, else (None, (stat, digest, data, stale row))."""
+        st = os.stat(path)
+        row = None
+        if self.scan_cache is not None:
+            result, row = self.scan_cache.check(os.path.abspath(path), st)
+            if result is not None:
+                return result, None
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if row is not None and row[2] == digest:  # Touched but unchanged: no parse needed
+            return self._store(path, (st, digest, data, row), None), None
+        return None, (st, digest, data, row)
+
+    def _store(self, path, pending, parse):
+        st, digest, data, row = pending
+        if self.scan_cache is None:
+            return parse()
+        return self.scan_cache.resolve(os.path.abspath(path), st, digest, row, parse)
+
+    def scan_paths(self, paths):
+        """
+        Returns:
+            dict: path -> scan result (see summarize_commands), for every path.
+        """
+        paths = list(paths)
+        if self.workers == 1:
+            results = {path: scan_file(path, self.scan_cache, self.lexer_cache) for path in paths}
+        else:
+            results = self._scan_parallel(paths)
+        if self.scan_cache is not None:
+            self.scan_cache.flush()
+        return results
+
+    def _scan_parallel(self, paths):
+        results = {}
+        queued = []   # Misses seen before it's worth starting processes
+        parsing = []  # (path, pending, future)
+        parsers = None
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="scan-read") as readers:
+                reads = {readers.submit(self._read, path): path for path in paths}
+                for done in as_completed(reads):
+                    path = reads[done]
+                    result, pending = done.result()
+                    if result is not None:
+                        results[path] = result
+                        continue
+                    queued.append((path, pending))
+                    if parsers is None and len(queued) >= self.process_min_files:
+                        parsers = ProcessPoolExecutor(max_workers=min(self.workers, os.cpu_count() or 1))
+                    if parsers is not None:
+                        # Parse while the remaining reads are still in flight
+                        parsing += [(p, pend, parsers.submit(parse_bytes, pend[2])) for p, pend in queued]
+                        queued = []
+
+            for path, pending in queued:  # Too few to be worth a process pool
+                results[path] = self._store(path, pending, lambda data=pending[2]: parse_bytes(data))
+            for path, pending, future in parsing:
+                results[path] = self._store(path, pending, future.result)
+        finally:
+            if parsers is not None:
+                parsers.shutdown()
+        return {path: results[path] for path in paths}
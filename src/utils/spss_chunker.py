@@ -0,0 +1,135 @@
+import re
+from src.utils.llm_budget import estimate_tokens, MAX_CTX
+from src.utils.spss_lexer import BEGIN_DATA, END_DATA
+
+# Leaves room in the window for the prompt template, the reply and a merge step
+DEFAULT_CHUNK_TOKENS = MAX_CTX // 4
+
+# Commands that open / close a block which must stay in one chunk
+BLOCK_OPEN = re.compile(r"^\s*(DO\s+IF|LOOP|DO\s+REPEAT|INPUT\s+PROGRAM)\b", re.IGNORECASE)
+BLOCK_CLOSE = re.compile(r"^\s*END\s+(IF|LOOP|REPEAT|INPUT\s+PROGRAM)\b", re.IGNORECASE)
+
+
+class Chunk:
+    """A run of whole commands from one file; line numbers are 1-based and inclusive."""
+
+    def __init__(self, index, lines, first_line):
+        self.index = index
+        self.text = "\n".join(lines)
+        self.first_line = first_line
+        self.last_line = first_line + len(lines) - 1
+
+    @property
+    def tokens(self):
+        return estimate_tokens(self.text)
+
+
+def split_commands(source):
+    """
+    Splits SPSS syntax into commands.
+
+    A command ends at a line whose last non-blank character is a period, or
+    at a blank line. BEGIN DATA ... END DATA is one command, since data rows
+    don't end with periods.
+
+    Returns:
+        list: (first line index, line count) per command, 0-based.
+    """
+    lines = source.splitlines()
+    commands = []
+    start = None
+    in_data = False
+    for i, line in enumerate(lines):
+        if start is None:
+            if not line.strip():
+                continue
+            start = i
+            in_data = bool(BEGIN_DATA.match(line))
+        if in_data:
+            if END_DATA.match(line):
+                in_data = False
+                commands.append((start, i - start + 1))
+                start = None
+            continue
+        if not line.strip() or line.rstrip().endswith("."):
+            end = i if line.strip() else i - 1
+            commands.append((start, end - start + 1))
+            start = None
+    if start is not None:
+        commands.append((start, len(lines) - start))
+    return commands
+
+
+def split_units(source):
+    """
+    Groups commands into units that may not be split: a top-level command,
+    or a whole DO IF / LOOP / DO REPEAT / INPUT PROGRAM block including
+    anything nested inside it.
+
+    Returns:
+        list: (first line index, line count) per unit, 0-based.
+    """
+    lines = source.splitlines()
+    units = []
+    depth = 0
+    unit_start = None
+    for start, count in split_commands(source):
+        head = lines[start]
+        if unit_start is None:
+            unit_start = start
+        if BLOCK_OPEN.match(head):
+            depth += 1
+        elif BLOCK_CLOSE.match(head):
+            depth = max(depth - 1, 0)
+        if depth == 0:
+            units.append((unit_start, start + count - unit_start))
+            unit_start = None
+    if unit_start is not None:
+        # Unclosed block: keep whatever is left as the last unit
+        units.append((unit_start, len(lines) - unit_start))
+    return units
+
+
+def chunk_spss(source, max_tokens=DEFAULT_CHUNK_TOKENS, units=None):
+    """
+    Packs whole commands and blocks into chunks of at most `max_tokens`.
+
+    A single block bigger than `max_tokens` (e.g. a 5,000-line DO IF) is
+    split at command boundaries as a last resort, so every chunk still
+    starts and ends on a complete command.
+
+    Args:
+        source (str): SPSS syntax (ideally already compacted).
+        max_tokens (int): Token budget per chunk.
+        units (list | None): (first line index, line count) units to pack, e.g.
+                             from spss_ir.ir_units; default: split_units(source).
+
+    Returns:
+        list: Chunk objects, in file order.
+    """
+    lines = source.splitlines()
+    pieces = []
+    for start, count in (units if units is not None else split_units(source)):
+        if estimate_tokens("\n".join(lines[start:start + count])) <= max_tokens:
+            pieces.append((start, count))
+            continue
+        end = start + count
+        pieces.extend(
+            (s, min(c, end - s)) for s, c in split_commands("\n".join([""] * start + lines[start:end]))
+        )
+
+    chunks = []
+    current, current_start = [], None
+    for start, count in pieces:
+        if current:
+            # Lines between pieces (blank, or outside any command) keep the numbering intact
+            candidate = current + lines[current_start + len(current):start + count]
+            if estimate_tokens("\n".join(candidate)) > max_tokens:
+                chunks.append(Chunk(len(chunks), current, current_start + 1))
+                current, current_start = [], None
+        if current_start is None:
+            current_start = start
+        current.extend(lines[current_start + len(current):start + count])
+    if current:
+        chunks.append(Chunk(len(chunks), current, current_start + 1))
+    return chunks
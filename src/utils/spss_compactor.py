@@ -0,0 +1,146 @@
+import re
+from src.utils.llm_budget import estimate_tokens
+from src.utils.spss_lexer import COMMENT_START, BEGIN_DATA, END_DATA, strip_inline_comment, ends_command
+
+DEFAULT_DATA_PREVIEW = 3          # Inline data rows kept so the model still sees the layout
+DEFAULT_MAX_LABEL_LINES = 8       # Lines of a VALUE LABELS command kept before summarising
+
+VALUE_LABELS = re.compile(r"^\s*(ADD\s+)?VALUE\s+LABELS\b", re.IGNORECASE)
+
+
+class CompactedSource:
+    """
+    An SPSS file with the parts a model doesn't need removed or summarised.
+
+    `line_map[i]` is the 1-based line in the original file that line `i + 1`
+    of `text` came from, so anything the model says about a line of the
+    compacted prompt can be traced back to the legacy source.
+    """
+
+    def __init__(self, original, lines, line_map, removed):
+        self.original = original
+        self.text = "\n".join(lines)
+        self.line_map = line_map
+        self.removed = removed  # {"comment": n, "data": n, "blank": n, "value_label": n} source lines
+
+    def source_line(self, compact_line):
+        """Original line number for a (1-based) line of the compacted text."""
+        return self.line_map[compact_line - 1]
+
+    @property
+    def original_tokens(self):
+        return estimate_tokens(self.original)
+
+    @property
+    def compact_tokens(self):
+        return estimate_tokens(self.text)
+
+    @property
+    def tokens_saved(self):
+        return max(self.original_tokens - self.compact_tokens, 0)
+
+    def summary(self):
+        """One-line report, e.g. '1200 -> 300 tokens (-75%; 40 data, 12 comment lines removed)'."""
+        pct = self.tokens_saved / self.original_tokens if self.original_tokens else 0.0
+        parts = [f"{n} {kind}" for kind, n in self.removed.items() if n]
+        detail = f"; {', '.join(parts)} lines removed" if parts else ""
+        return f"{self.original_tokens} -> {self.compact_tokens} tokens (-{pct:.0%}{detail})"
+
+
+def compact_spss(source, data_preview=DEFAULT_DATA_PREVIEW, max_label_lines=DEFAULT_MAX_LABEL_LINES):
+    """
+    Shrinks SPSS syntax before it is put into a prompt.
+
+    * `*` / COMMENT commands and `/* */` comments are dropped.
+    * BEGIN DATA ... END DATA keeps its first `data_preview` rows; the rest
+      become a one-line note with the row count.
+    * VALUE LABELS / ADD VALUE LABELS longer than `max_label_lines` lines
+      keep their head and final line, with a note for the omitted labels.
+    * Blank lines are dropped.
+
+    Args:
+        source (str): Raw .sps text.
+        data_preview (int | None): Data rows kept; None keeps them all.
+        max_label_lines (int | None): VALUE LABELS lines kept; None keeps them all.
+
+    Returns:
+        CompactedSource: Compacted text plus the line map back to `source`.
+    """
+    lines = source.splitlines()
+    out, line_map = [], []
+    removed = {"data": 0, "comment": 0, "value_label": 0, "blank": 0}
+
+    def keep(text, lineno):
+        out.append(text)
+        line_map.append(lineno)
+
+    at_command_start = True
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        lineno = i + 1
+
+        if not line.strip():
+            removed["blank"] += 1
+            at_command_start = True  # A blank line also ends a command
+            i += 1
+            continue
+
+        if at_command_start and COMMENT_START.match(line):
+            # Comment commands run to the terminating period (or a blank line)
+            while i < len(lines) and lines[i].strip():
+                removed["comment"] += 1
+                i += 1
+                if ends_command(lines[i - 1]):
+                    break
+            continue
+
+        if BEGIN_DATA.match(line):
+            keep(line.rstrip(), lineno)
+            rows = []
+            i += 1
+            while i < len(lines) and not END_DATA.match(lines[i]):
+                rows.append(i)
+                i += 1
+            shown = len(rows) if data_preview is None else data_preview
+            for r in rows[:shown]:
+                keep(lines[r].rstrip(), r + 1)
+            omitted = rows[shown:]
+            if omitted:
+                keep(f"* ... {len(omitted)} more data rows omitted ({len(rows)} in total).", omitted[0] + 1)
+                removed["data"] += len(omitted)
+            if i < len(lines):
+                keep(lines[i].rstrip(), i + 1)
+                i += 1
+            at_command_start = True
+            continue
+
+        if VALUE_LABELS.match(line):
+            start = i
+            while i < len(lines) and lines[i].strip():
+                i += 1
+                if ends_command(lines[i - 1]):
+                    break
+            block = list(range(start, i))
+            if max_label_lines is not None and len(block) > max_label_lines:
+                head, omitted, last = block[:max_label_lines - 1], block[max_label_lines - 1:-1], block[-1]
+                for r in head:
+                    keep(strip_inline_comment(lines[r]), r + 1)
+                keep(f"  /* ... {len(omitted)} more label lines omitted */", omitted[0] + 1)
+                keep(strip_inline_comment(lines[last]), last + 1)
+                removed["value_label"] += len(omitted)
+            else:
+                for r in block:
+                    keep(strip_inline_comment(lines[r]), r + 1)
+            at_command_start = True
+            continue
+
+        stripped = strip_inline_comment(line)
+        if stripped.strip():
+            keep(stripped.rstrip(), lineno)
+        else:
+            removed["comment"] += 1
+        at_command_start = ends_command(stripped) if stripped.strip() else at_command_start
+        i += 1
+
+    return CompactedSource(source, out, line_map, removed)
@@ -0,0 +1,426 @@
+import os
+import re
+import json
+from bisect import bisect_right
+from src.utils.spss_lexer import iter_commands, lex_file, split_keyword
+from src.utils.manifest_store import atomic_write_json
+
+IR_VERSION = 2
+IR_DIR = "ir"  # Next to migration_manifest.json
+
+# Node kinds and the fields each one carries (all nodes have kind and span)
+COMPUTE = "COMPUTE"            # target, expression
+IF = "IF"                      # condition, target, expression
+RECODE = "RECODE"              # groups: [{variables, mappings: [[old, new]], into}]
+SELECT_IF = "SELECT IF"        # condition
+AGGREGATE = "AGGREGATE"        # outfile, break, aggregations: [{target, function, args}], options
+MATCH_FILES = "MATCH FILES"    # files: [{type, name, options}], by, options
+ADD_FILES = "ADD FILES"        # as MATCH FILES
+DO_IF = "DO IF"                # branches: [{condition (None for ELSE), body}]
+LOOP = "LOOP"                  # header, body
+DO_REPEAT = "DO REPEAT"        # header, body
+INPUT_PROGRAM = "INPUT PROGRAM"  # body
+VALUE_LABELS = "VALUE LABELS"  # labels: {var: [[value, label]]}, add (bool)
+INCLUDE = "INCLUDE"            # keyword (INSERT / INCLUDE), file
+DATA = "DATA"                  # rows
+MACRO = "DEFINE"               # name, text
+COMMAND = "COMMAND"            # keyword, args: anything else
+
+TOKEN = re.compile(r"""
+    '(?:[^']|'')*'                                   # single-quoted string ('' escapes a quote)
+  | "(?:[^"]|"")*"                                   # double-quoted string
+  | (?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?             # number, decimals included
+  | [A-Za-z@#$!][\w.@#$]*                            # name (SPSS names may contain periods)
+  | <=|>=|~=|<>|\*\*|[/=()+\-*<>&|~,]                # operators and punctuation
+""", re.VERBOSE)
+
+TOKEN_NUMBER = re.compile(r"^-?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?$")
+
+# A period that ends one command and starts another on the same line ('Female'. VALUE LABELS ...)
+STATEMENT_END = re.compile(r"\.\s+(?=[A-Za-z@#$!])")
+
+
+def tokenize(text):
+    """Splits command arguments into tokens without breaking quoted strings or decimals."""
+    return TOKEN.findall(text)
+
+
+def unquote(token):
+    """'It''s' -> It's; anything unquoted is returned as is."""
+    if len(token) >= 2 and token[0] in "'\"" and token[-1] == token[0]:
+        return token[1:-1].replace(token[0] * 2, token[0])
+    return token
+
+
+def is_quoted(token):
+    return token[:1] in ("'", '"')
+
+
+def number_or_string(token):
+    """Label values: 1 -> 1, 1.5 -> 1.5, 'M' -> 'M'."""
+    if is_quoted(token):
+        return unquote(token)
+    try:
+        value = float(token)
+    except ValueError:
+        return token
+    return int(value) if value.is_integer() and "." not in token and "e" not in token.lower() else value
+
+
+def split_top_level(text, separator="/"):
+    """Splits on `separator` outside quotes and parentheses."""
+    parts, depth, quote, start = [], 0, None, 0
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth = max(depth - 1, 0)
+        elif ch == separator and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+
+def split_statements(text):
+    """Splits on periods outside quotes that are followed by another command's name."""
+    parts, quote, start = [], None, 0
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch == "." and STATEMENT_END.match(text, i):
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [p.strip() for p in parts if p.strip()]
+
+
+def leading_parens(text):
+    """'(a > 1) x = 2' -> ('a > 1', 'x = 2'); text without leading parentheses -> (None, text)."""
+    text = text.strip()
+    if not text.startswith("("):
+        return None, text
+    depth, quote = 0, None
+    for i, ch in enumerate(text):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if depth == 0:
+                return text[1:i].strip(), text[i + 1:].strip()
+    return text[1:].strip(), ""
+
+
+def strip_parens(text):
+    inner, rest = leading_parens(text)
+    return inner if inner is not None and not rest else text.strip()
+
+
+def parse_value_labels(args):
+    """
+    VALUE LABELS arguments -> {var: [[value, label], ...]}.
+
+    Handles several variables sharing one label list, `/` between sets,
+    decimal and string values, and periods or escaped quotes inside labels.
+    Further commands on the same line (`... 2 'F'. VALUE LABELS reg 1 'N'.`)
+    end the list; if they are VALUE LABELS too, their labels are added.
+    """
+    statements = split_statements(args)
+    labels = {}
+    for group in split_top_level(statements[0] if statements else ""):
+        tokens = []
+        for token in tokenize(group):
+            if tokens and tokens[-1] == "-" and TOKEN_NUMBER.match(token):
+                tokens[-1] = "-" + token  # Negative value
+            else:
+                tokens.append(token)
+        variables = []
+        i = 0
+        while i < len(tokens) and not is_quoted(tokens[i]) and not TOKEN_NUMBER.match(tokens[i]):
+            variables.append(tokens[i])
+            i += 1
+        pairs = []
+        while i + 1 < len(tokens):
+            pairs.append([number_or_string(tokens[i]), unquote(tokens[i + 1])])
+            i += 2
+        for var in variables:
+            labels.setdefault(var, []).extend(pairs)
+    for statement in statements[1:]:
+        keyword, rest = split_keyword(statement)
+        if keyword in ("VALUE LABELS", "ADD VALUE LABELS"):
+            for var, pairs in parse_value_labels(rest).items():
+                labels.setdefault(var, []).extend(pairs)
+    return labels
+
+
+class Node:
+    """
+    One typed SPSS command (see the kinds above for their fields).
+
+    `span` is the (first, last) 1-based source lines. Block kinds (DO IF,
+    LOOP, DO REPEAT, INPUT PROGRAM) hold their commands in `body` /
+    `branches`, so the IR is a tree whose top level is the file's
+    execution order.
+    """
+
+    def __init__(self, kind, span, **fields):
+        self.kind = kind
+        self.span = tuple(span)
+        self.fields = fields
+
+    def __getattr__(self, name):
+        fields = self.__dict__.get("fields", {})
+        if name in fields:
+            return fields[name]
+        raise AttributeError(name)
+
+    def to_dict(self):
+        data = {"kind": self.kind, "span": list(self.span)}
+        for name, value in self.fields.items():
+            if name == "body":
+                value = [n.to_dict() for n in value]
+            elif name == "branches":
+                value = [{"condition": b["condition"], "body": [n.to_dict() for n in b["body"]]} for b in value]
+            data[name] = value
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        fields = {k: v for k, v in data.items() if k not in ("kind", "span")}
+        if "body" in fields:
+            fields["body"] = [cls.from_dict(n) for n in fields["body"]]
+        if "branches" in fields:
+            fields["branches"] = [
+                {"condition": b["condition"], "body": [cls.from_dict(n) for n in b["body"]]} for b in fields["branches"]
+            ]
+        return cls(data["kind"], data["span"], **fields)
+
+    def walk(self):
+        """This node and every node nested in it, in source order."""
+        yield self
+        for child in self.fields.get("body", ()):
+            yield from child.walk()
+        for branch in self.fields.get("branches", ()):
+            for child in branch["body"]:
+                yield from child.walk()
+
+    def __repr__(self):
+        return f"Node({self.kind!r}, lines {self.span[0]}-{self.span[1]})"
+
+
+def _assignment(text):
+    target, _, expression = text.partition("=")
+    return target.strip(), expression.strip()
+
+
+def _file_list(args):
+    files, by, options = [], [], {}
+    for sub in split_top_level(args):
+        name, _, value = sub.partition("=")
+        key = name.strip().upper()
+        if key in ("FILE", "TABLE"):
+            value, _, extra = value.strip().partition(" ")
+            files.append({"type": key, "name": unquote(value.strip()), "options": extra.strip()})
+        elif key.startswith("BY"):
+            by = tokenize(sub)[1:]
+        else:
+            options[key] = value.strip()
+    return {"files": files, "by": by, "options": options}
+
+
+AGGREGATE_OPTIONS = ("OUTFILE", "BREAK", "MODE", "OVERWRITE", "PRESORTED", "DOCUMENT", "MISSING")
+INTO = re.compile(r"\bINTO\b", re.IGNORECASE)
+
+
+def _aggregate(args):
+    fields = {"outfile": None, "break": [], "aggregations": [], "options": {}}
+    for sub in split_top_level(args):
+        name, _, value = sub.partition("=")
+        key = name.strip().upper()
+        if key == "OUTFILE":
+            target, _, rest = value.strip().partition(" ")
+            fields["outfile"] = unquote(target) if target else None
+            # OUTFILE=* MODE=ADDVARIABLES OVERWRITE=YES
+            fields["options"].update((k.upper(), v) for k, v in re.findall(r"(\w+)\s*=\s*(\S+)", rest))
+        elif key == "BREAK":
+            fields["break"] = tokenize(value)
+        elif key in AGGREGATE_OPTIONS or not value:
+            fields["options"][key] = value.strip()
+        else:
+            function, _, rest = value.strip().partition("(")
+            fields["aggregations"].append({
+                "target": name.strip(), "function": function.strip().upper(), "args": rest.rstrip(")").strip()
+            })
+    return fields
+
+
+def _recode(args):
+    groups = []
+    for sub in split_top_level(args):
+        main, into_text = (INTO.split(sub, maxsplit=1) + [None])[:2]
+        mappings = []
+        for spec in re.findall(r"\(([^()]*)\)", main):
+            old, _, new = spec.partition("=")
+            mappings.append([old.strip(), new.strip()])
+        groups.append({
+            "variables": tokenize(main.split("(", 1)[0]),
+            "mappings": mappings,
+            "into": tokenize(into_text) if into_text is not None else None,
+        })
+    return groups
+
+
+def command_node(cmd):
+    """Typed Node for one non-block command."""
+    span = (cmd.first_line, cmd.last_line)
+    keyword, args = cmd.keyword, cmd.args
+    if cmd.is_data:
+        return Node(DATA, span, rows=max(cmd.last_line - cmd.first_line - 1, 0))
+    if keyword == "COMPUTE":
+        target, expression = _assignment(args)
+        return Node(COMPUTE, span, target=target, expression=expression)
+    if keyword == "IF":
+        condition, rest = leading_parens(args)
+        target, expression = _assignment(rest)
+        return Node(IF, span, condition=condition, target=target, expression=expression)
+    if keyword == "SELECT IF":
+        return Node(SELECT_IF, span, condition=strip_parens(args))
+    if keyword == "RECODE":
+        return Node(RECODE, span, groups=_recode(args))
+    if keyword == "AGGREGATE":
+        return Node(AGGREGATE, span, **_aggregate(args))
+    if keyword in ("MATCH FILES", "ADD FILES"):
+        return Node(keyword, span, **_file_list(args))
+    if keyword in ("VALUE LABELS", "ADD VALUE LABELS"):
+        return Node(VALUE_LABELS, span, labels=parse_value_labels(args), add=keyword.startswith("ADD"))
+    if keyword in ("INSERT", "INCLUDE"):
+        return Node(INCLUDE, span, keyword=keyword, file=cmd.file_arg())
+    if keyword == "DEFINE":
+        name = args.split()[0].split("(")[0] if args else ""
+        return Node(MACRO, span, name=name, text=cmd.text)
+    return Node(COMMAND, span, keyword=keyword, args=args)
+
+
+BLOCK_ENDS = {"DO IF": "END IF", "LOOP": "END LOOP", "DO REPEAT": "END REPEAT", "INPUT PROGRAM": "END INPUT PROGRAM"}
+
+
+def build_ir(commands):
+    """
+    Typed, nested IR for a command stream (comments dropped).
+
+    Args:
+        commands (iterable): Command objects from spss_lexer.
+
+    Returns:
+        list: Top-level Nodes in source order.
+    """
+    root = []
+    stack = []  # (node, end keyword, list the next commands go into)
+
+    def close(node, last_line):
+        node.span = (node.span[0], last_line)
+
+    for cmd in commands:
+        if cmd.is_comment:
+            continue
+        target = stack[-1][2] if stack else root
+        keyword = cmd.keyword
+        if keyword in BLOCK_ENDS:
+            span = (cmd.first_line, cmd.last_line)
+            if keyword == "DO IF":
+                node = Node(DO_IF, span, branches=[{"condition": strip_parens(cmd.args), "body": []}])
+                body = node.branches[0]["body"]
+            elif keyword == "INPUT PROGRAM":
+                node = Node(INPUT_PROGRAM, span, body=[])
+                body = node.body
+            else:
+                node = Node(keyword, span, header=cmd.args, body=[])
+                body = node.body
+            target.append(node)
+            stack.append((node, BLOCK_ENDS[keyword], body))
+        elif stack and keyword in ("ELSE IF", "ELSE") and stack[-1][0].kind == DO_IF:
+            node = stack[-1][0]
+            condition = strip_parens(cmd.args) if keyword == "ELSE IF" else None
+            node.branches.append({"condition": condition, "body": []})
+            stack[-1] = (node, stack[-1][1], node.branches[-1]["body"])
+        elif stack and keyword == stack[-1][1]:
+            node = stack.pop()[0]
+            close(node, cmd.last_line)
+        else:
+            target.append(command_node(cmd))
+    return root
+
+
+def parse_ir(source):
+    """IR for an SPSS source string."""
+    return build_ir(iter_commands(source.splitlines()))
+
+
+def ir_units(nodes, line_map=None):
+    """
+    Line ranges of the top-level nodes, as (start index, line count) pairs,
+    for spss_chunker.chunk_spss: a block never straddles two chunks.
+
+    Args:
+        nodes (list): Top-level IR nodes.
+        line_map (list | None): CompactedSource.line_map, when the chunks are
+                                cut from compacted text rather than the source.
+    """
+    spans = [node.span for node in nodes]
+    if line_map is None:
+        return [(first - 1, last - first + 1) for first, last in spans]
+    starts = [first for first, _ in spans]
+    units, current, start = [], None, 0
+    for i, original in enumerate(line_map):
+        # Owner: the last node starting at or before this line (lines between nodes go with the one before)
+        owner = max(bisect_right(starts, original) - 1, 0)
+        if owner != current:
+            if current is not None:
+                units.append((start, i - start))
+            current, start = owner, i
+    if current is not None:
+        units.append((start, len(line_map) - start))
+    return units
+
+
+def ir_path(manifest_path, entry):
+    """Where an entry's IR lives: ir/<r_function_name>.json next to the manifest."""
+    return os.path.join(os.path.dirname(os.path.abspath(manifest_path)), IR_DIR, f"{entry['r_function_name']}.json")
+
+
+def save_ir(path, nodes, source_hash):
+    """Writes the IR as compact JSON with the hash of the source it came from."""
+    data = {"version": IR_VERSION, "source_hash": source_hash, "nodes": [n.to_dict() for n in nodes]}
+    atomic_write_json(path, data, compact=True)
+
+
+def load_ir(path, source_hash=None):
+    """The IR at `path`, or None if it's missing, stale (other hash) or from another version."""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+    except (ValueError, OSError):
+        return None
+    if data.get("version") != IR_VERSION or (source_hash is not None and data.get("source_hash") != source_hash):
+        return None
+    return [Node.from_dict(n) for n in data["nodes"]]
+
+
+def build_file_ir(path, lexer_cache=None):
+    """IR for an .sps file, lexed through `lexer_cache` if given."""
+    return build_ir(lexer_cache.commands(path) if lexer_cache is not None else lex_file(path))
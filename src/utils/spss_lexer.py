@@ -0,0 +1,236 @@
+import os
+import re
+import threading
+
+COMMENT_START = re.compile(r"^\s*(\*|COMMENT\b)", re.IGNORECASE)
+BEGIN_DATA = re.compile(r"^\s*BEGIN\s+DATA\b", re.IGNORECASE)
+END_DATA = re.compile(r"^\s*END\s+DATA\b", re.IGNORECASE)
+DEFINE = re.compile(r"^\s*DEFINE\b", re.IGNORECASE)
+END_DEFINE = re.compile(r"!ENDDEFINE\b", re.IGNORECASE)
+
+# Up to three leading words; a word may be a macro call (!name) or hyphenated (T-TEST)
+WORDS = re.compile(r"\s*([A-Za-z!$#@][\w$#@-]*)(?:\s+([A-Za-z][\w-]*))?(?:\s+([A-Za-z][\w-]*))?")
+
+# Commands whose name is more than one word; anything else is named by its first word
+MULTI_WORD_COMMANDS = {
+    "ADD FILES", "ADD VALUE LABELS", "ALTER TYPE", "BEGIN DATA", "DATA LIST", "DATASET ACTIVATE",
+    "DATASET CLOSE", "DATASET DECLARE", "DATASET NAME", "DELETE VARIABLES", "DO IF", "DO REPEAT",
+    "ELSE IF", "END CASE", "END DATA", "END FILE", "END IF", "END INPUT PROGRAM", "END LOOP",
+    "END REPEAT", "FILE HANDLE", "FILE LABEL", "GET DATA", "GET TRANSLATE", "INPUT PROGRAM",
+    "MATCH FILES", "MISSING VALUES", "MODIFY VARS", "N OF CASES", "NPAR TESTS", "RENAME VARIABLES",
+    "SAVE TRANSLATE", "SELECT IF", "SORT CASES", "SPLIT FILE", "VALUE LABELS", "VARIABLE LABELS",
+    "VARIABLE LEVEL",
+}
+
+# The target right after FILE=, wherever it is in the command (INSERT FILE='a.sps' /CD=YES ERROR=STOP)
+FILE_ARG = re.compile(r"\bFILE\s*=\s*(?:'([^']*)'|\"([^\"]*)\"|([^\s'\"/]+))", re.IGNORECASE)
+
+
+def strip_inline_comment(line):
+    """Drops a `/* ...` comment (to `*/` or end of line) that is not inside a quoted string."""
+    quote = None
+    for i, ch in enumerate(line):
+        if quote:
+            if ch == quote:
+                quote = None
+        elif ch in "'\"":
+            quote = ch
+        elif line.startswith("/*", i):
+            end = line.find("*/", i + 2)
+            rest = line[end + 2:] if end != -1 else ""
+            return (line[:i] + strip_inline_comment(rest)).rstrip()
+    return line
+
+
+def ends_command(line):
+    """SPSS commands end with a period as the last non-blank character."""
+    return line.rstrip().endswith(".")
+
+
+def split_keyword(text):
+    """
+    Splits a command into its upper-case name and the rest.
+
+    Returns:
+        tuple: (keyword, args), e.g. ('SORT CASES', 'BY id.') or ('DO IF', '(x > 1).').
+    """
+    match = WORDS.match(text)
+    if not match:
+        return text.strip()[:1].upper(), text.strip()[1:]
+    words = [w.upper() for w in match.groups() if w]
+    n = 1
+    for size in range(len(words), 1, -1):
+        if " ".join(words[:size]) in MULTI_WORD_COMMANDS:
+            n = size
+            break
+    return " ".join(words[:n]), text[match.end(n):]
+
+
+def command_keyword(text):
+    """Upper-case command name at the start of `text`, e.g. 'SORT CASES', 'COMPUTE', '!MYMACRO'."""
+    return split_keyword(text)[0]
+
+
+class Command:
+    """
+    One SPSS command.
+
+    `text` is the command with `/* */` comments removed (for a comment
+    command it is the comment itself; for BEGIN DATA only the opening line,
+    since nothing reads the rows). `args` is what follows the keyword, minus
+    the terminating period. Line numbers are 1-based and inclusive.
+    """
+
+    __slots__ = ("keyword", "args", "text", "first_line", "last_line", "is_comment", "is_data")
+
+    def __init__(self, keyword, args, text, first_line, last_line, is_comment=False, is_data=False):
+        self.keyword = keyword
+        self.args = args
+        self.text = text
+        self.first_line = first_line
+        self.last_line = last_line
+        self.is_comment = is_comment
+        self.is_data = is_data
+
+    def file_arg(self):
+        """Target of FILE= (INSERT, INCLUDE, GET, ...), or None."""
+        match = FILE_ARG.search(self.args)
+        if not match:
+            return None
+        target = next(g for g in match.groups() if g is not None).strip()
+        return target.rstrip(".") if match.group(3) else target
+
+    def __repr__(self):
+        return f"Command({self.keyword!r}, lines {self.first_line}-{self.last_line})"
+
+
+def _make(lines, first_line, is_comment=False, is_data=False, is_macro=False):
+    last_line = first_line + len(lines) - 1
+    if is_comment:
+        text = "\n".join(line.rstrip() for line in lines)
+        return Command("COMMENT" if text.lstrip()[:1] != "*" else "*", "", text, first_line, last_line,
+                       is_comment=True)
+    if is_data:
+        return Command("BEGIN DATA", "", lines[0].strip(), first_line, last_line, is_data=True)
+    code = [line if is_macro else strip_inline_comment(line) for line in lines]
+    text = "\n".join(line.rstrip() for line in code).strip()
+    keyword, args = split_keyword(text)
+    args = args.strip()
+    if args.endswith("."):
+        args = args[:-1].rstrip()
+    return Command(keyword, args, text, first_line, last_line)
+
+
+def iter_commands(lines):
+    """
+    Streams SPSS source lines into Commands in one pass.
+
+    A command runs to a line whose last non-blank character (outside a
+    `/* */` comment) is a period, or to a blank line. `*` / COMMENT
+    commands are flagged `is_comment`; BEGIN DATA ... END DATA is one
+    command flagged `is_data`; DEFINE ... !ENDDEFINE is one command, since
+    the periods inside a macro body don't end it.
+
+    Args:
+        lines (iterable): Source lines (a file object works).
+
+    Yields:
+        Command
+    """
+    buffer = []
+    first_line = 0
+    kind = None  # None, "comment", "data", "macro" or "command"
+    for lineno, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        if not buffer:
+            if not line.strip():
+                continue
+            first_line = lineno
+            if COMMENT_START.match(line):
+                kind = "comment"
+            elif BEGIN_DATA.match(line):
+                kind = "data"
+            elif DEFINE.match(line):
+                kind = "macro"
+            else:
+                kind = "command"
+        buffer.append(line)
+
+        if kind == "data":
+            if END_DATA.match(line):
+                yield _make(buffer, first_line, is_data=True)
+                buffer = []
+        elif kind == "macro":
+            if END_DEFINE.search(line) and ends_command(strip_inline_comment(line)):
+                yield _make(buffer, first_line, is_macro=True)
+                buffer = []
+        elif not line.strip():
+            yield _make(buffer[:-1], first_line, is_comment=kind == "comment")
+            buffer = []
+        elif ends_command(line if kind == "comment" else strip_inline_comment(line)):
+            yield _make(buffer, first_line, is_comment=kind == "comment")
+            buffer = []
+    if buffer:
+        while buffer and not buffer[-1].strip():
+            buffer.pop()
+        if kind == "data":
+            yield _make(buffer, first_line, is_data=True)
+        else:
+            yield _make(buffer, first_line, is_comment=kind == "comment", is_macro=kind == "macro")
+
+
+def lex_spss(source):
+    """All commands of an SPSS source string."""
+    return list(iter_commands(source.splitlines()))
+
+
+def lex_file(path):
+    """All commands of an .sps file, read once, line by line."""
+    with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+        return list(iter_commands(f))
+
+
+class CommandCache:
+    """
+    Command streams per .sps file, lexed once and shared by every scanner.
+
+    Entries are keyed on the file's mtime and size, so an edited file is
+    lexed again while everything else is served from memory.
+    """
+
+    def __init__(self):
+        self._entries = {}  # abspath -> ((mtime_ns, size), [Command])
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def commands(self, path):
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        key = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._entries.get(path)
+            if cached is not None and cached[0] == key:
+                self.hits += 1
+                return cached[1]
+        commands = lex_file(path)
+        with self._lock:
+            self._entries[path] = (key, commands)
+            self.misses += 1
+        return commands
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"files": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+_shared_cache = CommandCache()
+
+
+def get_command_cache():
+    """The cache the scanners share unless given their own."""
+    return _shared_cache
@@ -0,0 +1,627 @@
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from src.utils.spss_lexer import iter_commands, get_command_cache
+from src.utils.spss_ir import leading_parens, split_top_level, unquote
+
+# Distinct (macro, arguments) expansions kept; a call repeated thousands of times is expanded once
+MACRO_CACHE_SIZE = 4096
+# Macros calling macros deeper than this are left unexpanded (runaway recursion)
+MAX_EXPANSION_DEPTH = 20
+
+DEFINE_HEAD = re.compile(r"^\s*DEFINE\s+([^\s(]+)\s*", re.IGNORECASE)
+END_DEFINE = re.compile(r"!ENDDEFINE\s*\.?\s*$", re.IGNORECASE)
+
+# Macro body tokens; whitespace is a token so the body's layout survives expansion
+BODY_TOKEN = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|!\*|![\w@#$]+(?:\.[\w@#$]+)*|\s+|[^\s!'"(),=]+|[(),=!]""")
+# Call-site tokens, with positions so argument text is taken verbatim
+CALL_TOKEN = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|[^\s'"/=()]+|[/=()]""")
+
+PARAM_TOKENS = re.compile(r"!TOKENS\s*\(\s*(\d+)\s*\)", re.IGNORECASE)
+PARAM_CHAREND = re.compile(r"!CHAREND\s*\(\s*'([^']*)'\s*\)", re.IGNORECASE)
+PARAM_ENCLOSE = re.compile(r"!ENCLOSE\s*\(\s*'([^']*)'\s*,\s*'([^']*)'\s*\)", re.IGNORECASE)
+PARAM_DEFAULT = re.compile(r"!DEFAULT\s*(?=\()", re.IGNORECASE)
+# A command ends at a period closing its line
+COMMAND_END = re.compile(r"\.[ \t]*(?:\n|$)")
+
+COMPARISONS = {
+    "=": lambda a, b: a == b, "!EQ": lambda a, b: a == b,
+    "<>": lambda a, b: a != b, "~=": lambda a, b: a != b, "!NE": lambda a, b: a != b,
+    "<": lambda a, b: a < b, "!LT": lambda a, b: a < b,
+    ">": lambda a, b: a > b, "!GT": lambda a, b: a > b,
+    "<=": lambda a, b: a <= b, "!LE": lambda a, b: a <= b,
+    ">=": lambda a, b: a >= b, "!GE": lambda a, b: a >= b,
+}
+
+
+class MacroError(ValueError):
+    """A macro body or call that can't be expanded."""
+
+
+def _quote(text):
+    if text[:1] in ("'", '"') and text[-1:] == text[:1]:
+        return text
+    return "'" + text.replace("'", "''") + "'"
+
+
+def _substr(text, start, length=None):
+    start = max(int(start) - 1, 0)
+    return text[start:] if length is None else text[start:start + int(length)]
+
+
+# Macro string functions: !NAME(args...) -> str (arguments arrive expanded)
+FUNCTIONS = {
+    "!CONCAT": lambda *args: "".join(unquote(a) for a in args),
+    "!QUOTE": lambda text: _quote(text),
+    "!UNQUOTE": lambda text: unquote(text),
+    "!LENGTH": lambda text: str(len(unquote(text))),
+    "!UPCASE": lambda text: unquote(text).upper(),
+    "!HEAD": lambda text: (unquote(text).split() or [""])[0],
+    "!TAIL": lambda text: " ".join(unquote(text).split()[1:]),
+    "!SUBSTR": lambda text, *args: _substr(unquote(text), *args),
+    "!INDEX": lambda haystack, needle: str(unquote(haystack).find(unquote(needle)) + 1),
+    "!BLANKS": lambda n: " " * int(n),
+}
+
+
+class Param:
+    """
+    One macro parameter.
+
+    `kind` is how a call's argument is delimited: ("tokens", n),
+    ("charend", char), ("enclose", open, close) or ("cmdend",).
+    Positional parameters are named !1, !2, ... in the body.
+    """
+
+    def __init__(self, name, kind, default="", positional=False):
+        self.name = name
+        self.kind = kind
+        self.default = default
+        self.positional = positional
+
+
+def parse_params(text):
+    """Parameter list of a DEFINE, e.g. `!POSITIONAL !TOKENS(1) / var = !DEFAULT(x) !CHAREND('/')`."""
+    params, position = [], 0
+    for spec in split_top_level(text):
+        default = ""
+        match = PARAM_DEFAULT.search(spec)
+        if match:
+            default, _ = leading_parens(spec[match.end():])
+            default = default or ""
+        if re.match(r"\s*!POSITIONAL\b", spec, re.IGNORECASE):
+            position += 1
+            name, positional = f"!{position}", True
+        else:
+            name, positional = "!" + spec.split("=", 1)[0].strip().lstrip("!").upper(), False
+        if PARAM_TOKENS.search(spec):
+            kind = ("tokens", int(PARAM_TOKENS.search(spec).group(1)))
+        elif PARAM_CHAREND.search(spec):
+            kind = ("charend", PARAM_CHAREND.search(spec).group(1))
+        elif PARAM_ENCLOSE.search(spec):
+            kind = ("enclose",) + PARAM_ENCLOSE.search(spec).groups()
+        else:
+            kind = ("cmdend",)
+        params.append(Param(name, kind, default, positional))
+    return params
+
+
+class Macro:
+    """A DEFINE ... !ENDDEFINE block: its name, parameters and tokenized body."""
+
+    def __init__(self, name, params, body, source=None, line=None):
+        self.name = name.upper()
+        self.params = params
+        self.body = body
+        self.tokens = BODY_TOKEN.findall(body)  # Tokenized once, however often it's called
+        self.source = source
+        self.line = line
+
+    @classmethod
+    def from_command(cls, cmd, source=None):
+        """Macro for a lexer DEFINE command, or None if it isn't a well-formed definition."""
+        head = DEFINE_HEAD.match(cmd.text)
+        if not head:
+            return None
+        params, rest = leading_parens(cmd.text[head.end():])
+        if params is None:
+            return None
+        body = END_DEFINE.sub("", rest).strip()
+        return cls(head.group(1), parse_params(params), body, source, cmd.first_line)
+
+    def bind(self, text):
+        """
+        Matches a call's arguments to the parameters.
+
+        Args:
+            text (str): What follows the macro name at the call site.
+
+        Returns:
+            tuple: ({param name: argument text}, characters of `text` consumed).
+        """
+        tokens = list(CALL_TOKEN.finditer(text))
+        values, i = {}, 0
+
+        def take(param, i):
+            kind = param.kind
+            if kind[0] == "cmdend":
+                return text[tokens[i].start():].strip() if i < len(tokens) else "", len(tokens)
+            if kind[0] == "tokens":
+                end = min(i + kind[1], len(tokens))
+                span = tokens[i:end]
+                return (text[span[0].start():span[-1].end()] if span else ""), end
+            if kind[0] == "charend":
+                end = i
+                while end < len(tokens) and tokens[end].group() != kind[1]:
+                    end += 1
+                span = tokens[i:end]
+                return (text[span[0].start():span[-1].end()] if span else ""), min(end + 1, len(tokens))
+            # enclose
+            if i >= len(tokens) or tokens[i].group() != kind[1]:
+                raise MacroError(f"{self.name}: expected {kind[1]!r} for {param.name}")
+            end = i + 1
+            while end < len(tokens) and tokens[end].group() != kind[2]:
+                end += 1
+            span = tokens[i + 1:end]
+            return (text[span[0].start():span[-1].end()] if span else ""), min(end + 1, len(tokens))
+
+        for param in self.params:
+            if param.positional:
+                values[param.name], i = take(param, i)
+        keywords = {p.name[1:]: p for p in self.params if not p.positional}
+        while i + 1 < len(tokens) and tokens[i].group().upper() in keywords and tokens[i + 1].group() == "=":
+            param = keywords[tokens[i].group().upper()]
+            values[param.name], i = take(param, i + 2)
+        for param in self.params:
+            values.setdefault(param.name, param.default)
+        consumed = tokens[i - 1].end() if i else 0
+        return values, consumed
+
+    def definition(self):
+        """Canonical text of the definition (for hashing)."""
+        params = [(p.name, p.kind, p.default, p.positional) for p in self.params]
+        return f"{self.name}|{params}|{self.body}"
+
+
+class MacroTable:
+    """
+    Every macro defined across the repository, by upper-case name.
+
+    Files are read in execution order so a later DEFINE of the same name
+    wins, as it would when SPSS runs the job.
+    """
+
+    def __init__(self):
+        self.macros = {}
+        self.redefined = 0
+        self.plain_names = False  # Any macro named without a leading "!"
+        self._pattern = None
+
+    def add(self, macro):
+        if macro.name in self.macros:
+            self.redefined += 1
+        self.macros[macro.name] = macro
+        self.plain_names = self.plain_names or not macro.name.startswith("!")
+        self._pattern = None
+
+    def add_commands(self, commands, source=None):
+        for cmd in commands:
+            if cmd.keyword == "DEFINE":
+                macro = Macro.from_command(cmd, source)
+                if macro is not None:
+                    self.add(macro)
+        return self
+
+    @classmethod
+    def from_paths(cls, paths, lexer_cache=None):
+        """Table of the macros defined in `paths` (read through the shared lexer cache)."""
+        cache = lexer_cache or get_command_cache()
+        table = cls()
+        for path in paths:
+            try:
+                table.add_commands(cache.commands(path), source=path)
+            except OSError as e:
+                print(f"⚠️ Could not read macros from {path}: {e}")
+        return table
+
+    def get(self, name):
+        return self.macros.get(name.upper())
+
+    def __contains__(self, name):
+        return name.upper() in self.macros
+
+    def __len__(self):
+        return len(self.macros)
+
+    @property
+    def pattern(self):
+        """Regex for call sites: any known macro name, longest first."""
+        if self._pattern is None:
+            names = sorted(self.macros, key=len, reverse=True)
+            alternatives = "|".join(re.escape(n) for n in names) or r"(?!x)x"
+            self._pattern = re.compile(rf"(?<![\w!.@#$])({alternatives})(?![\w@#$])", re.IGNORECASE)
+        return self._pattern
+
+    def digest(self):
+        """Hash of every definition, for build inputs: editing a macro re-runs its callers."""
+        text = "\n".join(self.macros[name].definition() for name in sorted(self.macros))
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ExpandedSource:
+    """
+    SPSS source with macro calls replaced by their expansions.
+
+    `line_map[i]` is the 1-based line of the original file that line
+    `i + 1` of `text` came from; every line of an expansion maps to its
+    call site.
+    """
+
+    def __init__(self, lines, line_map, calls):
+        self.text = "\n".join(lines)
+        self.line_map = line_map
+        self.calls = calls
+
+    def source_line(self, expanded_line):
+        return self.line_map[expanded_line - 1]
+
+
+class MacroExpander:
+    """
+    Expands macro calls against a MacroTable.
+
+    Expansions are memoized per (macro, argument text), so a macro invoked
+    thousands of times with the same arguments is expanded once, and each
+    body is tokenized once when it is defined. Calls inside an expansion
+    are expanded in turn, up to MAX_EXPANSION_DEPTH.
+
+    Args:
+        table (MacroTable): The repository's macros.
+        cache_size (int): Distinct expansions to keep.
+    """
+
+    def __init__(self, table, cache_size=MACRO_CACHE_SIZE):
+        self.table = table
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.failed = 0
+
+    # --- Call sites ---
+
+    def expand_call(self, name, args, depth=0):
+        """
+        Expansion of one call of `name` with argument text `args`.
+
+        Returns:
+            tuple: (expanded text, characters of `args` consumed).
+        """
+        key = (name.upper(), args)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+        macro = self.table.get(name)
+        if macro is None:
+            raise MacroError(f"Unknown macro {name}")
+        values, consumed = macro.bind(args)
+        text = self.expand_text(self._render(macro.tokens, dict(values), depth), depth + 1)
+        result = (text, consumed)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = result
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def expand_text(self, text, depth=0):
+        """`text` with every macro call (outside quotes) expanded."""
+        if not self.table or "!" not in text and not self.table.plain_names:
+            return text
+        if depth > MAX_EXPANSION_DEPTH:
+            raise MacroError(f"Macro expansion deeper than {MAX_EXPANSION_DEPTH} levels")
+        out, pos = [], 0
+        quoted = _quoted_spans(text)
+        for match in self.table.pattern.finditer(text):
+            if match.start() < pos or any(a <= match.start() < b for a, b in quoted):
+                continue
+            if not match.group(1).startswith("!") and text[:match.start()].strip():
+                continue  # Names without "!" are only recognised as a command
+            rest = text[match.end():]
+            end = COMMAND_END.search(rest)  # Arguments stop at the end of the calling command
+            body_end = end.start() if end else len(rest.rstrip())
+            expansion, consumed = self.expand_call(match.group(1), rest[:body_end], depth)
+            out.append(text[pos:match.start()])
+            out.append(expansion)
+            pos = match.end() + consumed
+            if expansion.rstrip().endswith(".") and text[pos:].strip() == ".":
+                pos = len(text)  # The body's commands are already terminated
+        out.append(text[pos:])
+        return "".join(out)
+
+    def expand_source(self, source):
+        """
+        Expands every macro call in an SPSS source string and drops the
+        DEFINE blocks themselves, since their bodies now appear at the
+        call sites.
+
+        Returns:
+            ExpandedSource | None: None if the source calls no macros.
+        """
+        if not self.table:
+            return None
+        lines = source.splitlines()
+        replacements = {}  # first line -> (last line, new lines)
+        calls = 0
+        for cmd in iter_commands(lines):
+            if cmd.is_comment or cmd.is_data:
+                continue
+            if cmd.keyword == "DEFINE":
+                replacements[cmd.first_line] = (cmd.last_line, [])
+                continue
+            if not self.table.pattern.search(cmd.text):
+                continue
+            try:
+                expanded = self.expand_text(cmd.text)
+            except (MacroError, ValueError, IndexError) as e:
+                self.failed += 1
+                print(f"⚠️ Could not expand macro call at line {cmd.first_line}: {e}")
+                continue
+            if expanded == cmd.text:
+                continue  # The name only appeared inside quotes
+            calls += 1
+            replacements[cmd.first_line] = (cmd.last_line, [line for line in expanded.splitlines() if line.strip()])
+        if not calls:
+            return None
+
+        out, line_map = [], []
+        lineno = 1
+        while lineno <= len(lines):
+            if lineno in replacements:
+                last, new_lines = replacements[lineno]
+                out.extend(new_lines)
+                line_map.extend([lineno] * len(new_lines))
+                lineno = last + 1
+            else:
+                out.append(lines[lineno - 1])
+                line_map.append(lineno)
+                lineno += 1
+        return ExpandedSource(out, line_map, calls)
+
+    def stats(self):
+        with self._lock:
+            return {"macros": len(self.table), "hits": self.hits, "misses": self.misses, "failed": self.failed}
+
+    # --- Macro body language ---
+
+    def _render(self, tokens, env, depth):
+        out, i = [], 0
+        while i < len(tokens):
+            token = tokens[i]
+            if token[0] != "!":  # Literal text, most of any body
+                out.append(token)
+                i += 1
+                continue
+            word = token.upper()
+            if word == "!DO":
+                text, i = self._do(tokens, i, env, depth)
+                out.append(text)
+            elif word == "!IF":
+                text, i = self._if(tokens, i, env, depth)
+                out.append(text)
+            elif word == "!LET":
+                i = self._let(tokens, i, env, depth)
+            elif word == "!NULL":
+                i += 1
+            elif word in FUNCTIONS or word == "!EVAL":
+                value, i = self._value(tokens, i, env, depth)
+                out.append(value)
+            elif word == "!*":
+                positional = sorted((int(k[1:]), v) for k, v in env.items() if k[1:].isdigit())
+                out.append(" ".join(v for _, v in positional if v))
+                i += 1
+            elif word in env:
+                out.append(env[word])
+                i += 1
+            else:
+                out.append(token)
+                i += 1
+        return "".join(out)
+
+    @staticmethod
+    def _skip(tokens, i):
+        while i < len(tokens) and tokens[i].isspace():
+            i += 1
+        return i
+
+    @staticmethod
+    def _closing(tokens, i, opener="(", closer=")"):
+        """Index of the token closing the `opener` at i."""
+        depth = 0
+        for j in range(i, len(tokens)):
+            if tokens[j] == opener:
+                depth += 1
+            elif tokens[j] == closer:
+                depth -= 1
+                if depth == 0:
+                    return j
+        raise MacroError(f"Unbalanced {opener!r} in macro body")
+
+    def _value(self, tokens, i, env, depth):
+        """One operand: a function call, a parenthesised list, a variable or a literal."""
+        i = self._skip(tokens, i)
+        if i >= len(tokens):
+            raise MacroError("Missing value in macro body")
+        word = tokens[i].upper()
+        after = self._skip(tokens, i + 1)
+        if (word in FUNCTIONS or word == "!EVAL") and after < len(tokens) and tokens[after] == "(":
+            end = self._closing(tokens, after)
+            args = [self._render(arg, env, depth).strip() for arg in _split_args(tokens[after + 1:end])]
+            if word == "!EVAL":
+                return self.expand_text(args[0] if args else "", depth + 1), end + 1
+            return FUNCTIONS[word](*args), end + 1
+        if tokens[i] == "(":
+            end = self._closing(tokens, i)
+            return self._render(tokens[i + 1:end], env, depth).strip(), end + 1
+        if word in env:
+            return env[word], i + 1
+        return tokens[i], i + 1
+
+    def _block(self, tokens, i, opener, closer, separators=()):
+        """Splits tokens i.. up to the matching `closer` at the depth-0 `separators`."""
+        parts, start, depth = [], i, 0
+        for j in range(i, len(tokens)):
+            word = tokens[j].upper()
+            if word == opener:
+                depth += 1
+            elif word == closer:
+                if depth == 0:
+                    parts.append((word, tokens[start:j]))
+                    return parts, j + 1
+                depth -= 1
+            elif depth == 0 and word in separators:
+                parts.append((word, tokens[start:j]))
+                start = j + 1
+        raise MacroError(f"{opener} without {closer}")
+
+    def _do(self, tokens, i, env, depth):
+        """!DO !var = a !TO b [!BY c] ... !DOEND, or !DO !var !IN (list) ... !DOEND."""
+        i = self._skip(tokens, i + 1)
+        var = tokens[i].upper()
+        i = self._skip(tokens, i + 1)
+        if tokens[i].upper() == "!IN":
+            items, i = self._value(tokens, i + 1, env, depth)
+            values = _list_items(items)
+        else:
+            if tokens[i] != "=":
+                raise MacroError(f"!DO {var}: expected '=' or !IN")
+            start, i = self._value(tokens, i + 1, env, depth)
+            i = self._skip(tokens, i)
+            if tokens[i].upper() != "!TO":
+                raise MacroError(f"!DO {var}: expected !TO")
+            stop, i = self._value(tokens, i + 1, env, depth)
+            step = "1"
+            j = self._skip(tokens, i)
+            if j < len(tokens) and tokens[j].upper() == "!BY":
+                step, i = self._value(tokens, j + 1, env, depth)
+            start, stop, step = int(unquote(start)), int(unquote(stop)), int(unquote(step))
+            if step == 0:
+                raise MacroError(f"!DO {var}: !BY 0")
+            values = [str(v) for v in range(start, stop + (1 if step > 0 else -1), step)]
+        parts, end = self._block(tokens, i, "!DO", "!DOEND")
+        body = parts[0][1]
+        out = []
+        for value in values:
+            env[var] = value
+            out.append(self._render(body, env, depth))
+        return "".join(out), end
+
+    def _if(self, tokens, i, env, depth):
+        """!IF (condition) !THEN ... [!ELSE ...] !IFEND."""
+        i = self._skip(tokens, i + 1)
+        if tokens[i] != "(":
+            raise MacroError("!IF: expected '('")
+        end = self._closing(tokens, i)
+        condition = self._condition(tokens[i + 1:end], env, depth)
+        i = self._skip(tokens, end + 1)
+        if tokens[i].upper() != "!THEN":
+            raise MacroError("!IF: expected !THEN")
+        parts, end = self._block(tokens, i + 1, "!IF", "!IFEND", separators=("!ELSE",))
+        then_part = parts[0][1]
+        else_part = parts[1][1] if len(parts) > 1 else []
+        return self._render(then_part if condition else else_part, env, depth), end
+
+    def _condition(self, tokens, env, depth):
+        """Comparisons joined by !AND / !OR (!AND binds tighter), each optionally !NOT."""
+        items, i = [], 0
+        while True:
+            i = self._skip(tokens, i)
+            if i >= len(tokens):
+                break
+            word = tokens[i].upper()
+            if tokens[i] in ("<", ">", "~") and i + 1 < len(tokens) and tokens[i + 1] == "=":
+                items.append(tokens[i] + "=")
+                i += 2
+            elif word in ("!AND", "!OR", "!NOT") or word in COMPARISONS:
+                items.append(word)
+                i += 1
+            else:
+                value, i = self._value(tokens, i, env, depth)
+                items.append(("value", value))
+        result_or = False
+        for group in _split_items(items, "!OR"):
+            result_and = True
+            for term in _split_items(group, "!AND"):
+                negate = bool(term) and term[0] == "!NOT"
+                if negate:
+                    term = term[1:]
+                if len(term) == 3 and isinstance(term[1], str):
+                    value = _compare(term[0][1], term[1], term[2][1])
+                elif len(term) == 1 and not isinstance(term[0], str):
+                    value = bool(unquote(term[0][1]))
+                else:
+                    raise MacroError("Unsupported !IF condition")
+                result_and = result_and and (value != negate)
+            result_or = result_or or result_and
+        return result_or
+
+    def _let(self, tokens, i, env, depth):
+        """!LET !var = value."""
+        i = self._skip(tokens, i + 1)
+        var = tokens[i].upper()
+        i = self._skip(tokens, i + 1)
+        if tokens[i] != "=":
+            raise MacroError(f"!LET {var}: expected '='")
+        env[var], i = self._value(tokens, i + 1, env, depth)
+        return i
+
+
+def _quoted_spans(text):
+    return [m.span() for m in re.finditer(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"", text)]
+
+
+def _split_args(tokens):
+    """Function arguments: the tokens between the parentheses, split at depth-0 commas."""
+    args, current, depth = [], [], 0
+    for token in tokens:
+        if token == "," and depth == 0:
+            args.append(current)
+            current = []
+            continue
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth -= 1
+        current.append(token)
+    if current or args:
+        args.append(current)
+    return args
+
+
+def _list_items(text):
+    return [m.group() for m in CALL_TOKEN.finditer(unquote(text))]
+
+
+def _split_items(items, separator):
+    groups, current = [], []
+    for item in items:
+        if item == separator:
+            groups.append(current)
+            current = []
+        else:
+            current.append(item)
+    groups.append(current)
+    return groups
+
+
+def _compare(left, op, right):
+    left, right = unquote(left), unquote(right)
+    try:
+        left, right = float(left), float(right)
+    except ValueError:
+        pass
+    return COMPARISONS[op](left, right)
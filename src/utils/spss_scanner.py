@@ -1,9 +1,13 @@
 import os
-import re
 from collections import Counter
+from src.utils.spss_lexer import get_command_cache
+from src.utils.scan_engine import ScanEngine, walk_sps
 
 class SPSSCommandScanner:
-    def __init__(self):
+    def __init__(self, cache=None, scan_cache=None, workers=1):
+        self.cache = cache or get_command_cache()  # Shared lexed command streams
+        self.scan_cache = scan_cache  # Optional persistent ScanCache
+        self.workers = workers  # Parallel readers / parsers (see ScanEngine)
         # Master List of Valid SPSS Commands (The "Allow List")
         self.valid_commands = {
             'ADD FILES', 'AGGREGATE', 'ALTER TYPE', 'AUTORECODE', 'CASESTOVARS', 
@@ -22,36 +26,22 @@ class SPSSCommandScanner:
             'VALUE LABELS', 'VARIABLE LABELS', 'VARSTOCASES', 'VECTOR', 'WEIGHT', 
             'WRITE'
         }
-        
-        # Regex to capture the first word of a line
-        self.pattern = re.compile(r'^\s*([A-Za-z]+(?:\s+[A-Za-z]+)?)', re.MULTILINE)
 
     def scan_directory(self, dir_path):
         command_counts = Counter()
         
-        for root, dirs, files in os.walk(dir_path):
-            for file in files:
-                if file.lower().endswith('.sps'):
-                    full_path = os.path.join(root, file)
-                    with open(full_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        content = f.read()
-                        
-                    # Find matches
-                    matches = self.pattern.findall(content)
-                    
-                    for m in matches:
-                        # Normalize: Uppercase and take first word (mostly)
-                        # We handle multi-word commands like "DATA LIST" by checking prefixes
-                        candidate = m.upper().strip()
-                        first_word = candidate.split()[0]
-                        
-                        # Check exact match or first word match
-                        if candidate in self.valid_commands:
-                            command_counts[candidate] += 1
-                        elif first_word in self.valid_commands:
-                            command_counts[first_word] += 1
-                        elif candidate.startswith("GET DATA"): # Special handling
-                             command_counts["GET DATA"] += 1
+        paths = walk_sps(dir_path)
+        results = ScanEngine(self.workers, scan_cache=self.scan_cache, lexer_cache=self.cache).scan_paths(paths)
+        for path in paths:
+            # One entry per command (not per line), comments excluded
+            for candidate, n in results[path]["commands"].items():
+                first_word = candidate.split()[0]
+                
+                # Check exact match or first word match
+                if candidate in self.valid_commands:
+                    command_counts[candidate] += n
+                elif first_word in self.valid_commands:
+                    command_counts[first_word] += n
         
         return command_counts
 
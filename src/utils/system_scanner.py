@@ -1,62 +1,48 @@
 import os
-import re
+from src.utils.spss_lexer import get_command_cache
+from src.utils.scan_cache import scan_file
+from src.utils.scan_engine import ScanEngine, walk_sps
 
 class SystemScanner:
-    def __init__(self, repo_path):
+    def __init__(self, repo_path, cache=None, scan_cache=None, workers=1):
         self.repo_path = repo_path
+        self.cache = cache or get_command_cache()  # Shared lexed command streams
+        self.scan_cache = scan_cache  # Optional persistent ScanCache
+        self.workers = workers
         self.dependencies = []
         self.external_inputs = []
         self.macros = []
+        self.time_logic = []
 
     def scan(self):
         print(f"--- Scanning System Logic in {self.repo_path} ---")
-        for root, dirs, files in os.walk(self.repo_path):
-            for file in files:
-                if file.lower().endswith('.sps'):
-                    self.analyze_file(os.path.join(root, file))
+        paths = walk_sps(self.repo_path)
+        results = ScanEngine(self.workers, scan_cache=self.scan_cache, lexer_cache=self.cache).scan_paths(paths)
+        for path in paths:
+            self.analyze_file(path, results[path])
         
         self.report()
 
-    def analyze_file(self, path):
+    def analyze_file(self, path, result=None):
         filename = os.path.basename(path)
-        with open(path, 'r', errors='ignore') as f:
-            lines = f.readlines()
-            
-        for i, line in enumerate(lines):
-            line = line.strip().upper()
-            
-            # 1. Detect External Drivers (Excel/Text inputs)
-            if "GET DATA" in line or "GET TRANSLATE" in line:
-                if "TYPE=XLS" in line or "TYPE=ODBC" in line or ".XLS" in line:
-                    self.external_inputs.append(f"{filename}:{i+1} reads External Data (Likely Driver)")
+        if result is None:
+            result = scan_file(path, self.scan_cache, self.cache)
+
+        # 1. External Drivers (Excel/ODBC inputs)
+        for line in result["external_inputs"]:
+            self.external_inputs.append(f"{filename}:{line} reads External Data (Likely Driver)")
 
-            # 2. Detect Control Flow (Chaining)
-            if line.startswith("INSERT") or line.startswith("INCLUDE"):
-                target = re.search(r"FILE=['\"]?([^'\"]+)['\"]?", line)
-                if target:
-                    self.dependencies.append(f"{filename} -> {target.group(1)}")
+        # 2. Control Flow (Chaining)
+        for target in result["includes"]:
+            self.dependencies.append(f"{filename} -> {target}")
 
-            # 3. Detect Macros (The logic engine)
-            if line.startswith("DEFINE"):
-                macro_name = line.split()[1]
-                self.macros.append(f"{filename} defines Macro: {macro_name}")
-   
-            # 4. Detect Time Series / Lag Logic
-            if "LAG(" in line or "LEAD(" in line:
-                risk = "High" if "SORT" not in last_command else "Low"
-                self.time_logic.append(f"{filename}:{i+1} uses LAG/LEAD (Risk: {risk})")
-                
-            if line.startswith("CREATE"):
-                # CREATE is used in SPSS to make moving averages / lags
-                self.time_logic.append(f"{filename}:{i+1} uses CREATE (Explicit Time Series gen)")
-                
-            if line.startswith("TSMODEL") or line.startswith("EXSMOOTH"):
-                self.time_logic.append(f"{filename}:{i+1} uses FORECASTING MODELS")
+        # 3. Macros (The logic engine)
+        for macro_name in result["macros"]:
+            self.macros.append(f"{filename} defines Macro: {macro_name}")
 
-            if line.startswith("SORT CASES"):
-                last_command = "SORT"
-            elif len(line) > 0 and not line.startswith("*"):
-                last_command = line
+        # 4. Time Series / Lag Logic
+        for note in result["time_logic"]:
+            self.time_logic.append(f"{filename}:{note}")
 
 
     def report(self):
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from collections import defaultdict
+from src.utils.model_timing import NS_PER_SECOND
+
+# Upper bounds (seconds) of the Prometheus latency histogram buckets
+LATENCY_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+
+def percentile(values, pct):
+    """Linear-interpolated percentile of a list (0 <= pct <= 100)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+class Telemetry:
+    """
+    Per-call LLM metrics sink.
+
+    Every HTTP reply from Ollama is recorded with its caller tag (stage,
+    function name, attempt), wall-clock latency and the server's token
+    counts and durations. Records are appended to a JSONL file (if
+    `jsonl_path` is set) as they arrive and kept in memory for the
+    end-of-run summary and the Prometheus textfile export.
+    """
+
+    def __init__(self, jsonl_path=None):
+        self.jsonl_path = jsonl_path
+        self._lock = threading.Lock()
+        self._records = []
+        if jsonl_path:
+            os.makedirs(os.path.dirname(os.path.abspath(jsonl_path)), exist_ok=True)
+
+    def record(self, tag, reply, latency, model=None, endpoint=None):
+        """
+        Args:
+            tag (dict): Caller tag; must contain "stage", may add "function", "attempt".
+            reply (dict): Final /api/generate or /api/chat body (or last stream chunk).
+            latency (float): Wall-clock seconds for the HTTP call.
+        """
+        eval_count = reply.get("eval_count", 0)
+        eval_seconds = reply.get("eval_duration", 0) / NS_PER_SECOND
+        record = dict(
+            tag,
+            ts=time.time(),
+            model=model,
+            endpoint=endpoint,
+            latency_seconds=round(latency, 4),
+            prompt_eval_count=reply.get("prompt_eval_count", 0),
+            eval_count=eval_count,
+            load_seconds=reply.get("load_duration", 0) / NS_PER_SECOND,
+            prompt_eval_seconds=reply.get("prompt_eval_duration", 0) / NS_PER_SECOND,
+            eval_seconds=eval_seconds,
+            tokens_per_second=(eval_count / eval_seconds) if eval_seconds else None,
+            done_reason=reply.get("done_reason"),
+        )
+        with self._lock:
+            self._records.append(record)
+            if self.jsonl_path:
+                with open(self.jsonl_path, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+
+    def records(self):
+        with self._lock:
+            return list(self._records)
+
+    def summary(self):
+        """
+        Returns:
+            dict: stage -> calls, p50/p95 latency (s), prompt and output token
+                  totals, and output tokens/sec over the stage's eval time.
+        """
+        by_stage = defaultdict(list)
+        for record in self.records():
+            by_stage[record["stage"]].append(record)
+
+        summary = {}
+        for stage, records in by_stage.items():
+            latencies = [r["latency_seconds"] for r in records]
+            eval_tokens = sum(r["eval_count"] for r in records)
+            eval_seconds = sum(r["eval_seconds"] for r in records)
+            summary[stage] = {
+                "calls": len(records),
+                "p50_latency": percentile(latencies, 50),
+                "p95_latency": percentile(latencies, 95),
+                "prompt_tokens": sum(r["prompt_eval_count"] for r in records),
+                "output_tokens": eval_tokens,
+                "tokens_per_second": (eval_tokens / eval_seconds) if eval_seconds else 0.0,
+            }
+        return summary
+
+    def write_prometheus(self, path):
+        """
+        Writes the metrics in Prometheus text format (for node_exporter's
+        textfile collector). The file is replaced atomically so a scrape
+        never sees a half-written file.
+        """
+        by_stage = defaultdict(list)
+        for record in self.records():
+            by_stage[record["stage"]].append(record)
+
+        lines = [
+            "# HELP llm_request_latency_seconds Wall-clock latency of Ollama calls.",
+            "# TYPE llm_request_latency_seconds histogram",
+        ]
+        for stage, records in sorted(by_stage.items()):
+            latencies = [r["latency_seconds"] for r in records]
+            for bound in LATENCY_BUCKETS:
+                count = sum(1 for v in latencies if v <= bound)
+                lines.append(f'llm_request_latency_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'llm_request_latency_seconds_bucket{{stage="{stage}",le="+Inf"}} {len(latencies)}')
+            lines.append(f'llm_request_latency_seconds_sum{{stage="{stage}"}} {sum(latencies):.4f}')
+            lines.append(f'llm_request_latency_seconds_count{{stage="{stage}"}} {len(latencies)}')
+
+        lines += [
+            "# HELP llm_tokens_total Tokens processed by Ollama.",
+            "# TYPE llm_tokens_total counter",
+        ]
+        for stage, records in sorted(by_stage.items()):
+            prompt_tokens = sum(r["prompt_eval_count"] for r in records)
+            output_tokens = sum(r["eval_count"] for r in records)
+            lines.append(f'llm_tokens_total{{stage="{stage}",kind="prompt"}} {prompt_tokens}')
+            lines.append(f'llm_tokens_total{{stage="{stage}",kind="output"}} {output_tokens}')
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
@@ -0,0 +1,4 @@
+import os
+
+# No retry backoff in the offline suite: tests that exercise retries ask for them
+os.environ.setdefault("OLLAMA_MAX_RETRIES", "0")
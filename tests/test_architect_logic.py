@@ -69,7 +69,7 @@ class TestArchitectLogic(unittest.TestCase):
             glossary = self.architect.load_glossary()
             self.assertIn("dplyr::filter", glossary)
 
-    @patch('src.specs.architect.get_ollama_response')
+    @patch('src.utils.async_ollama_client.get_ollama_response')
     def test_req_arc_04_file_creation(self, mock_llm):
         """REQ-ARC-04: System must generate R code and save it to the correct path."""
         # Mock LLM response
@@ -100,7 +100,7 @@ class TestArchitectLogic(unittest.TestCase):
         self.assertIn("calc_delays <- function", content)
         self.assertNotIn("```r", content) # Markdown should be stripped
 
-    @patch('src.specs.architect.get_ollama_response')
+    @patch('src.utils.async_ollama_client.get_ollama_response')
     def test_full_prompt_structure(self, mock_llm):
         """Verify the final prompt contains ALL required components."""
         
@@ -0,0 +1,195 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import json
+import time
+import asyncio
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.async_ollama_client import AsyncOllamaClient, request_all
+from src.utils.fake_ollama_server import FakeOllamaServer
+from src.utils.ollama_client import OllamaClient
+from src.utils.pipeline_scheduler import PipelineScheduler, Stage, LLM
+from src.specs.analyst import SpecAnalyst
+from src.converter.processor import process_conversion
+
+
+class SlowEchoHandler(BaseHTTPRequestHandler):
+    """Echoes the prompt back after a short delay and tracks peak concurrency."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length))
+        with self.server.lock:
+            self.server.in_flight += 1
+            self.server.peak = max(self.server.peak, self.server.in_flight)
+        time.sleep(0.05)
+        with self.server.lock:
+            self.server.in_flight -= 1
+
+        body = json.dumps({"response": f"echo:{payload['prompt']}", "done": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestAsyncOllamaClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), SlowEchoHandler)
+        self.server.lock = threading.Lock()
+        self.server.in_flight = 0
+        self.server.peak = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}/api/generate"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def run_batch(self, prompts, concurrency):
+        async def _run():
+            async with AsyncOllamaClient(concurrency=concurrency) as client:
+                return await client.generate_batch(prompts, endpoint=self.endpoint)
+        return asyncio.run(_run())
+
+    def test_results_in_submission_order(self):
+        prompts = [f"p{i}" for i in range(8)]
+        results = self.run_batch(prompts, concurrency=4)
+        self.assertEqual(results, [f"echo:{p}" for p in prompts])
+
+    def test_semaphore_bounds_concurrency(self):
+        self.run_batch([f"p{i}" for i in range(10)], concurrency=3)
+        self.assertLessEqual(self.server.peak, 3)
+        self.assertGreater(self.server.peak, 1)
+
+    def test_per_request_overrides(self):
+        results = self.run_batch(["plain", {"prompt": "dict"}], concurrency=2)
+        self.assertEqual(results, ["echo:plain", "echo:dict"])
+
+    def test_on_result_reports_each_request_as_it_finishes(self):
+        seen = []
+
+        async def _run():
+            async with AsyncOllamaClient(concurrency=2) as client:
+                return await client.generate_batch(
+                    ["a", "b", "c"], endpoint=self.endpoint, on_result=lambda i, r: seen.append((i, r))
+                )
+        asyncio.run(_run())
+        self.assertEqual(sorted(seen), [(0, "echo:a"), (1, "echo:b"), (2, "echo:c")])
+
+    def test_errors_become_none(self):
+        async def _run():
+            async with AsyncOllamaClient(concurrency=2, connect_timeout=1, backoff_base=0.01) as client:
+                return await client.generate_batch(["x"], endpoint="http://127.0.0.1:9/api/generate")
+        self.assertEqual(asyncio.run(_run()), [None])
+
+
+class TestStageBatching(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = "temp_batch_test"
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.manifest = []
+        for name in ["b_second", "a_first"]:
+            legacy = os.path.join(self.test_dir, f"{name}.sps")
+            with open(legacy, "w") as f:
+                f.write(f"COMPUTE {name} = 1.")
+            self.manifest.append({
+                "legacy_file": legacy,
+                "legacy_name": f"{name}.sps",
+                "r_function_name": name,
+                "spec_file": os.path.join(self.test_dir, "specs", f"{name}.md"),
+            })
+        self.manifest_path = os.path.join(self.test_dir, "migration_manifest.json")
+        with open(self.manifest_path, "w") as f:
+            json.dump(self.manifest, f)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_analyst_submits_manifest_as_one_batch(self):
+        analyst = SpecAnalyst(self.manifest_path)
+        with patch('src.utils.async_ollama_client.get_client') as mock_client, \
+             patch('src.utils.async_ollama_client.get_ollama_responses') as mock_batch:
+            mock_client.return_value.concurrency = 4
+            mock_batch.side_effect = lambda prompts, **kwargs: [f"spec {i}" for i in range(len(prompts))]
+            analyst.run()
+
+        mock_batch.assert_called_once()
+        prompts = mock_batch.call_args[0][0]
+        self.assertIn("b_second", prompts[0])
+        self.assertIn("a_first", prompts[1])
+        with open(self.manifest[0]["spec_file"]) as f:
+            self.assertEqual(f.read(), "spec 0")
+        with open(self.manifest[1]["spec_file"]) as f:
+            self.assertEqual(f.read(), "spec 1")
+
+    def test_converter_writes_each_result_before_the_batch_ends(self):
+        input_file = os.path.join(self.test_dir, "r_code_data.json")
+        output_file = os.path.join(self.test_dir, "out", "conversion.jsonl")
+        with open(input_file, "w") as f:
+            json.dump([{"function_name": f"f{i}", "code_chunk": f"f{i} <- function() {i}"} for i in range(3)], f)
+
+        replies = iter(["a", "b", "c"])
+
+        def crash_midway(prompt, stage, **req):
+            reply = next(replies)
+            if reply == "c":
+                with open(output_file) as f:
+                    self.assertEqual(len(f.readlines()), 2)  # Earlier results are already on disk
+                raise KeyboardInterrupt
+            return reply
+
+        with patch('src.utils.async_ollama_client.get_client') as mock_client, \
+             patch('src.utils.async_ollama_client.get_ollama_response', side_effect=crash_midway):
+            mock_client.return_value.concurrency = 1
+            with self.assertRaises(KeyboardInterrupt):
+                process_conversion(input_file, output_file)
+
+        with open(output_file) as f:
+            self.assertEqual([json.loads(line)["llm_output"] for line in f], ["a", "b"])
+
+class TestSharedBatchClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeOllamaServer(("127.0.0.1", 0), latency="fixed:0.3").start()
+        self.addCleanup(self.server.stop)
+        self.shared = OllamaClient(concurrency=4, endpoints=[f"{self.server.url}/api/generate"])
+        self.addCleanup(self.shared.close)
+        patcher = patch("src.utils.async_ollama_client.get_client", return_value=self.shared)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_scheduler_workers_share_connections_and_coalesce(self):
+        def stage(entry):
+            return request_all(["translate this"], stage="architect")[0] is not None
+
+        entries = [{"r_function_name": f"f{i}"} for i in range(4)]
+        outcomes = PipelineScheduler([Stage("architect", stage, LLM)], workers={LLM: 4}).run(entries)
+
+        self.assertEqual(set(outcomes.values()), {"done"})
+        self.assertEqual(self.server.stats()["requests"], 1)
+        self.assertEqual(self.shared.single_flight.coalesced, 3)
+        self.assertEqual(self.server.stats()["connections"], 1)
+
+    def test_per_file_calls_reuse_one_connection(self):
+        for i in range(10):
+            self.assertIsNotNone(request_all([f"prompt {i}"], stage="analyst")[0])
+        self.assertEqual(self.server.stats()["requests"], 10)
+        self.assertEqual(self.server.stats()["connections"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import unittest
+import os
+import sys
+import shutil
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.build_tracker import BuildTracker, source_hashes, file_hash
+from src.utils.pipeline_scheduler import PipelineScheduler, Stage, LLM, R
+from src.utils.manifest_manager import ManifestManager
+from src.utils.manifest_store import ManifestStore
+from src.utils.pipeline_context import PipelineContext
+from run_migration import build_stages
+
+
+class TestBuildTracker(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = "temp_build_test"
+        self.syntax = os.path.join(self.test_dir, "syntax")
+        os.makedirs(self.syntax, exist_ok=True)
+        self.write("01_calc.sps", "COMPUTE a = 1.")
+        self.write("02_other.sps", "COMPUTE b = 2.")
+        self.write("main.sps", "INSERT FILE='01_calc.sps'.")
+        self.manifest_path = os.path.join(self.test_dir, "migration_manifest.json")
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def write(self, name, text):
+        with open(os.path.join(self.syntax, name), "w") as f:
+            f.write(text)
+
+    def manifest(self):
+        ManifestManager(self.syntax, manifest_path=self.manifest_path).generate_manifest()
+        return ManifestStore(self.manifest_path).load()
+
+    def pipeline(self, manifest, calls):
+        """Two-stage chain: 'spec' copies the source hash to a file, 'code' depends on that file."""
+        tracker = BuildTracker(ManifestStore(self.manifest_path), manifest)
+        out = lambda entry: os.path.join(self.test_dir, entry["r_function_name"] + ".spec")
+
+        def spec(entry):
+            calls.append(("spec", entry["r_function_name"]))
+            with open(out(entry), "w") as f:
+                f.write("spec for " + entry["r_function_name"])  # Same text whatever the source
+
+        def code(entry):
+            calls.append(("code", entry["r_function_name"]))
+
+        stages = [
+            Stage("spec", spec, LLM, output=out, inputs=lambda e: {"source": e["source_hash"], "model": "m"}),
+            Stage("code", code, R, inputs=lambda e: {"spec": file_hash(out(e))}),
+        ]
+        PipelineScheduler(stages, tracker=tracker).run(manifest)
+        return tracker
+
+    def test_source_hash_covers_included_files(self):
+        files = {n: os.path.join(self.syntax, n) for n in ("01_calc.sps", "02_other.sps", "main.sps")}
+        before = source_hashes(files, {"main.sps": ["01_calc.sps"]})
+        self.write("01_calc.sps", "COMPUTE a = 99.")
+        after = source_hashes(files, {"main.sps": ["01_calc.sps"]})
+        self.assertNotEqual(before["main.sps"], after["main.sps"])
+        self.assertEqual(before["02_other.sps"], after["02_other.sps"])
+
+    def test_unchanged_files_are_skipped(self):
+        calls = []
+        self.pipeline(self.manifest(), calls)
+        self.assertEqual(len(calls), 6)
+
+        calls.clear()
+        tracker = self.pipeline(self.manifest(), calls)
+        self.assertEqual(calls, [])
+        self.assertEqual(tracker.stats()["spec"], {"built": 0, "skipped": 3})
+
+    def test_change_reruns_only_the_dependent_chain(self):
+        self.pipeline(self.manifest(), [])
+        self.write("01_calc.sps", "COMPUTE a = 42.")
+        calls = []
+        self.pipeline(self.manifest(), calls)
+        # calc changed and main includes it; the re-made spec is identical, so 'code' stays skipped
+        self.assertEqual(sorted(calls), [("spec", "calc"), ("spec", "main")])
+
+    def test_rescan_keeps_records_and_resets_status_of_changed_files(self):
+        manifest = self.manifest()
+        tracker = self.pipeline(manifest, [])
+        for entry in manifest:
+            tracker.set_status(entry, "done")
+        self.write("02_other.sps", "COMPUTE b = 3.")
+        rescanned = {e["r_function_name"]: e for e in self.manifest()}
+        self.assertEqual(rescanned["calc"]["status"], "done")
+        self.assertEqual(rescanned["other"]["status"], "pending")
+        self.assertIn("spec", rescanned["other"]["build"])
+
+    def test_failed_stage_with_old_output_is_rebuilt(self):
+        manifest = self.manifest()
+        calc = next(i for i, e in enumerate(manifest) if e["r_function_name"] == "calc")
+        os.makedirs(os.path.dirname(manifest[calc]["spec_file"]), exist_ok=True)
+        with open(manifest[calc]["spec_file"], "w") as f:
+            f.write("# Spec left by an older run")
+
+        def analyse(replies):
+            store = ManifestStore(self.manifest_path)
+            tracker = BuildTracker(store, manifest)
+            context = PipelineContext(self.test_dir, manifest_path=self.manifest_path, store=store)
+            stages = build_stages(context, tracker)[:1]
+            with patch("src.specs.analyst.request_all", side_effect=lambda prompts, **kwargs: replies[:len(prompts)]), \
+                 patch("builtins.print"):
+                return PipelineScheduler(stages, tracker=tracker).run(manifest)
+
+        # The LLM call fails: the old spec is not recorded as this run's output
+        self.assertEqual(analyse([None])[calc], "analyse")
+        with open(manifest[calc]["spec_file"]) as f:
+            self.assertEqual(f.read(), "# Spec left by an older run")
+
+        self.assertEqual(analyse(["# Spec"])[calc], "done")
+        with open(manifest[calc]["spec_file"]) as f:
+            self.assertEqual(f.read(), "# Spec")
+
+    def test_stages_ask_the_configured_model(self):
+        manifest = self.manifest()
+        store = ManifestStore(self.manifest_path)
+        tracker = BuildTracker(store, manifest)
+        context = PipelineContext(self.test_dir, manifest_path=self.manifest_path, store=store)
+        stages = build_stages(context, tracker, model="llama3:8b")[:2]
+
+        models = []
+        def reply(prompts, **kwargs):
+            models.append(kwargs["model"])
+            return ["```r\nx <- 1\n```"] * len(prompts)
+
+        with patch("src.specs.analyst.request_all", side_effect=reply), \
+             patch("src.specs.architect.request_all", side_effect=reply), \
+             patch("builtins.print"):
+            outcomes = PipelineScheduler(stages, tracker=tracker).run(manifest)
+
+        self.assertEqual(set(outcomes.values()), {"done"})
+        self.assertEqual(len(models), 2 * len(manifest) - 1)  # The controller is analysed, not drafted
+        self.assertEqual(set(models), {"llama3:8b"})
+
+if __name__ == "__main__":
+    unittest.main()
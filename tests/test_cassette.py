@@ -0,0 +1,133 @@
+import unittest
+import os
+import sys
+import json
+import shutil
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.cassette import Cassette, CassetteMiss, CASSETTE_ENV, CASSETTE_MODE_ENV
+from src.utils.fake_ollama_server import FakeOllamaServer
+from src.utils.ollama_client import OllamaClient
+from src.utils.async_ollama_client import get_ollama_responses
+
+
+class TestCassette(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = "temp_cassette_test"
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.path = os.path.join(self.test_dir, "llm.json")
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def record_session(self, server):
+        client = OllamaClient(endpoints=[f"{server.url}/api/generate"], cassette=Cassette(self.path, mode="record"))
+        try:
+            answers = [client.generate("translate A"), client.generate("translate B", json_mode=True)]
+            chat = client.chat([{"role": "user", "content": "fix"}], endpoint=f"{server.url}/api/chat")
+        finally:
+            client.close()
+        return answers, chat["message"]["content"]
+
+    def test_replay_needs_no_network(self):
+        server = FakeOllamaServer(("127.0.0.1", 0), latency="fixed:0.05").start()
+        answers, chat = self.record_session(server)
+        server.stop()
+
+        # Different host, server gone: replay keys on path + payload only
+        client = OllamaClient(endpoints=["http://127.0.0.1:9/api/generate"], cassette=Cassette(self.path))
+        try:
+            replayed = [client.generate("translate A"), client.generate("translate B", json_mode=True)]
+            replayed_chat = client.chat([{"role": "user", "content": "fix"}], endpoint="http://127.0.0.1:9/api/chat")
+        finally:
+            client.close()
+
+        self.assertEqual(replayed, answers)
+        self.assertEqual(replayed_chat["message"]["content"], chat)
+        stats = client.cassette.stats()
+        self.assertEqual(stats["hits"], 3)
+        self.assertGreaterEqual(stats["replayed_seconds"], 0.15)
+
+    def test_miss_fails_the_call(self):
+        client = OllamaClient(cassette=Cassette(self.path))
+        try:
+            self.assertIsNone(client.generate("never recorded"))
+        finally:
+            client.close()
+        self.assertEqual(client.cassette.stats()["misses"], 1)
+        with self.assertRaises(CassetteMiss):
+            client.cassette.replay("http://x/api/generate", {"prompt": "never recorded"})
+
+    def test_entries_are_compact(self):
+        cassette = Cassette(self.path, mode="record")
+        cassette.record("http://a/api/generate", {"prompt": "p", "keep_alive": "30m"},
+                        {"response": "r", "done_reason": "stop", "context": list(range(5000)), "created_at": "now"}, 1.0)
+        with open(self.path) as f:
+            entry = json.loads(f.readline())
+        self.assertEqual(entry["reply"], {"response": "r", "done_reason": "stop"})
+        # keep_alive doesn't affect the answer, so it doesn't affect the key either
+        self.assertEqual(cassette.replay("http://b/api/generate", {"prompt": "p"})["response"], "r")
+
+    def test_key_leaves_out_the_environment_context_size(self):
+        payload = {"prompt": "p", "options": {"temperature": 0.0, "num_predict": 512, "num_ctx": 8192}}
+        key = Cassette.make_key("http://a/api/generate", payload)
+        self.assertEqual(key, Cassette.make_key("http://a/api/generate", {
+            "prompt": "p", "options": {"temperature": 0.0, "num_predict": 512, "num_ctx": 16384}}))
+        self.assertNotEqual(key, Cassette.make_key("http://a/api/generate", {
+            "prompt": "p", "options": {"temperature": 0.0, "num_predict": 256, "num_ctx": 8192}}))
+
+    def test_record_appends_and_close_tidies_once(self):
+        cassette = Cassette(self.path, mode="record")
+        with patch.object(cassette, "_save", side_effect=AssertionError("whole-file rewrite")):
+            for prompt in ["b", "a", "b"]:
+                cassette.record("http://a/api/generate", {"prompt": prompt}, {"response": prompt + "!"}, 0.1)
+        with open(self.path) as f:
+            self.assertEqual(len(f.readlines()), 3)
+        self.assertEqual(Cassette(self.path).replay("http://a/api/generate", {"prompt": "b"})["response"], "b!")
+
+        cassette.close()
+        with open(self.path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line["key"] for line in lines], sorted(line["key"] for line in lines))
+        self.assertEqual(sorted(line["reply"]["response"] for line in lines), ["a!", "b!"])
+
+    def test_reads_old_layout_and_skips_a_truncated_line(self):
+        key = Cassette.make_key("http://a/api/generate", {"prompt": "old"})
+        with open(self.path, "w") as f:
+            json.dump({"version": 1, "entries": {key: {"latency": 0.1, "reply": {"response": "kept"}}}}, f, indent=1)
+        cassette = Cassette(self.path, mode="record")
+        cassette.record("http://a/api/generate", {"prompt": "new"}, {"response": "added"}, 0.1)
+        with open(self.path, "a") as f:
+            f.write('{"key": "cut off mid-wri')
+
+        with patch("src.utils.cassette.logger"):
+            replay = Cassette(self.path)
+        self.assertEqual(replay.replay("http://a/api/generate", {"prompt": "old"})["response"], "kept")
+        self.assertEqual(replay.replay("http://a/api/generate", {"prompt": "new"})["response"], "added")
+
+    def test_batch_replay(self):
+        server = FakeOllamaServer(("127.0.0.1", 0)).start()
+        endpoint = f"{server.url}/api/generate"
+        shared = OllamaClient(concurrency=2, cassette=Cassette(self.path, mode="record"))
+        with patch("src.utils.async_ollama_client.get_client", return_value=shared):
+            recorded = get_ollama_responses(["a", "b"], endpoint=endpoint)
+        shared.close()
+        server.stop()
+
+        shared = OllamaClient(concurrency=2, cassette=Cassette(self.path))
+        with patch("src.utils.async_ollama_client.get_client", return_value=shared):
+            self.assertEqual(get_ollama_responses(["a", "b"], endpoint=endpoint), recorded)
+        shared.close()
+
+    def test_from_env(self):
+        with patch.dict(os.environ, {CASSETTE_ENV: self.path, CASSETTE_MODE_ENV: "record"}):
+            cassette = Cassette.from_env()
+        self.assertEqual((cassette.path, cassette.mode), (self.path, "record"))
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertIsNone(Cassette.from_env())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import os
+import sys
+import json
+import threading
+from unittest.mock import patch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.ollama_client import OllamaClient
+from src.utils.chat_session import ChatSession
+from src.utils.refining_agent import RefiningAgent
+
+
+class ChatHandler(BaseHTTPRequestHandler):
+    """Fake /api/chat: replies with an R block numbered by turn, plus fixed timing figures."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length))
+        self.server.payloads.append(payload)
+        turn = len(self.server.payloads)
+        truncated = self.server.truncate_first and turn == 1
+        reply = {
+            "message": {"role": "assistant", "content": f"```r\nx <- {turn}\n" if truncated else f"```r\nx <- {turn}\n```"},
+            "done": True,
+            "done_reason": "length" if truncated else "stop",
+            "prompt_eval_count": 10,
+            "prompt_eval_duration": 100_000_000,
+            "eval_duration": 400_000_000,
+        }
+        body = json.dumps(reply).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_chat_server(truncate_first=False):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ChatHandler)
+    server.payloads = []
+    server.truncate_first = truncate_first
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class TestChatSession(unittest.TestCase):
+
+    def setUp(self):
+        self.servers = [start_chat_server(), start_chat_server()]
+        urls = [f"http://127.0.0.1:{s.server_port}/api/chat" for s in self.servers]
+        self.client = OllamaClient(endpoints=urls)
+        patcher = patch("src.utils.ollama_client.get_client", return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.client.close()
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    def test_turns_stick_to_one_server_with_fixed_context(self):
+        session = ChatSession("system", turns=3)
+        for i in range(3):
+            self.assertIsNotNone(session.send(f"turn {i}"))
+
+        used = [s for s in self.servers if s.payloads]
+        self.assertEqual(len(used), 1)
+        payloads = used[0].payloads
+        self.assertEqual({p["options"]["num_ctx"] for p in payloads}, {payloads[0]["options"]["num_ctx"]})
+        self.assertEqual(len(payloads[2]["messages"]), 6)  # system + 3 user + 2 assistant
+        self.assertEqual(payloads[2]["messages"][:4], payloads[1]["messages"])  # Prefix unchanged
+
+    def test_agent_sends_only_new_error_on_retry(self):
+        agent = RefiningAgent("SYSTEM PROMPT", max_retries=2, chat=True)
+        verdicts = iter([(False, "object 'y' not found"), (False, "bad type"), (True, "OK")])
+        result = agent.run("y + 1", lambda code: next(verdicts))
+
+        self.assertEqual(result, "x <- 2")
+        payloads = next(s for s in self.servers if s.payloads).payloads
+        first_user = payloads[0]["messages"][1]["content"]
+        retry_user = payloads[1]["messages"][-1]["content"]
+        self.assertIn("y + 1", first_user)
+        self.assertNotIn("y + 1", retry_user)
+        self.assertIn("bad type", retry_user)
+        self.assertEqual(payloads[1]["messages"][0]["content"], "SYSTEM PROMPT")
+
+        self.assertAlmostEqual(agent.trace[1]["prompt_eval_seconds"], 0.1)
+        self.assertAlmostEqual(agent.trace[1]["eval_seconds"], 0.4)
+
+
+class TestChatContinuation(unittest.TestCase):
+
+    def test_truncated_reply_is_continued_and_timings_summed(self):
+        server = start_chat_server(truncate_first=True)
+        client = OllamaClient()
+        try:
+            url = f"http://127.0.0.1:{server.server_port}/api/chat"
+            reply = client.chat([{"role": "user", "content": "go"}], endpoint=url)
+        finally:
+            client.close()
+            server.shutdown()
+            server.server_close()
+
+        self.assertEqual(reply["message"]["content"], "```r\nx <- 1\n```r\nx <- 2\n```")
+        self.assertEqual(server.payloads[1]["messages"][-1]["role"], "user")
+        self.assertEqual(reply["prompt_eval_duration"], 200_000_000)
+        self.assertEqual(client.continuations, 1)
+
+if __name__ == "__main__":
+    unittest.main()
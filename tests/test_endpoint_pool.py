@@ -0,0 +1,126 @@
+import unittest
+import os
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.endpoint_pool import EndpointPool, base_url
+from src.utils.ollama_client import OllamaClient
+
+MODEL = "qwen2.5-coder:latest"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """A fake Ollama box: /api/ps lists resident models, /api/generate answers with its name."""
+    protocol_version = "HTTP/1.1"
+
+    def reply(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.server.broken:
+            self.reply(500, {"error": "down"})
+        else:
+            self.reply(200, {"models": [{"name": m} for m in self.server.loaded]})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self.server.hits += 1
+        if self.server.broken:
+            time.sleep(0.5)
+        try:
+            self.reply(200, {"response": self.server.name, "done": True})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stand_in(name, loaded=()):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    server.name = name
+    server.loaded = list(loaded)
+    server.broken = False
+    server.hits = 0
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class TestEndpointPool(unittest.TestCase):
+
+    def setUp(self):
+        self.a = start_stand_in("A")
+        self.b = start_stand_in("B", loaded=[MODEL])
+        self.urls = [f"http://127.0.0.1:{s.server_port}/api/generate" for s in (self.a, self.b)]
+
+    def tearDown(self):
+        for server in (self.a, self.b):
+            server.shutdown()
+            server.server_close()
+
+    def test_base_url(self):
+        self.assertEqual(base_url("http://box:11434/api/generate"), "http://box:11434")
+        self.assertEqual(base_url("http://box:11434/"), "http://box:11434")
+
+    def test_prefers_endpoint_with_model_loaded(self):
+        pool = EndpointPool(self.urls)
+        pool.probe()
+        chosen = pool.acquire(MODEL)
+        self.assertEqual(chosen.base_url, base_url(self.urls[1]))
+
+    def test_routes_to_least_loaded(self):
+        pool = EndpointPool(self.urls, cold_load_penalty=0)
+        first = pool.acquire(MODEL)
+        second = pool.acquire(MODEL)
+        self.assertNotEqual(first.base_url, second.base_url)
+
+        # A slow response makes that endpoint less attractive once both are idle
+        pool.release(first, model=MODEL, latency=5.0)
+        pool.release(second, model=MODEL, latency=0.1)
+        self.assertIs(pool.acquire(MODEL), second)
+
+    def test_probe_keeps_broken_box_out_of_rotation(self):
+        self.a.broken = True
+        client = OllamaClient(endpoints=self.urls, read_timeout=0.2, scale_timeouts=False)
+        try:
+            answers = [client.generate("hi") for _ in range(3)]
+            self.assertEqual(answers, ["B", "B", "B"])
+            self.assertEqual(self.a.hits, 0)
+        finally:
+            client.close()
+
+    def test_timeout_removes_endpoint_and_probe_readmits(self):
+        self.a.loaded = [MODEL]
+        self.b.loaded = []
+        client = OllamaClient(endpoints=self.urls, read_timeout=0.2, scale_timeouts=False, max_retries=3, backoff_base=0.01)
+        pool = client.endpoint_pool
+        try:
+            self.assertEqual(client.generate("hi"), "A")
+
+            # The timed-out call is retried on the other box
+            self.a.broken = True
+            self.assertEqual(client.generate("hi"), "B")
+            self.assertEqual(client.retries, 1)
+            self.assertFalse(pool.endpoints[0].healthy)
+            self.assertEqual(client.generate("hi"), "B")
+
+            self.a.broken = False
+            pool.probe()
+            self.assertTrue(pool.endpoints[0].healthy)
+            self.assertEqual(client.generate("hi"), "A")
+        finally:
+            client.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+import os
+import sys
+import json
+import random
+import requests
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.fake_ollama_server import FakeOllamaServer, parse_latency, prompt_hash
+from src.utils.ollama_client import OllamaClient
+from src.utils.async_ollama_client import AsyncOllamaClient
+
+MODEL = "qwen2.5-coder:latest"
+
+
+class TestFakeOllamaServer(unittest.TestCase):
+
+    def start(self, **config):
+        server = FakeOllamaServer(("127.0.0.1", 0), **config).start()
+        self.addCleanup(server.stop)
+        return server
+
+    def client(self, server, **kwargs):
+        client = OllamaClient(endpoints=[f"{server.url}/api/generate"], read_timeout=5, **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_latency_specs(self):
+        self.assertEqual(parse_latency("fixed:0.2")(random.Random(1)), 0.2)
+        sample = parse_latency("uniform:1:2")(random.Random(1))
+        self.assertTrue(1 <= sample <= 2)
+        with self.assertRaises(ValueError):
+            parse_latency("gamma:1")
+
+    def test_scripted_and_default_responses(self):
+        server = self.start(script={prompt_hash("translate me"): "```r\nx <- 42\n```"})
+        client = self.client(server)
+        self.assertEqual(client.generate("translate me"), "x <- 42")
+        self.assertIn("fake response", client.generate("something else"))
+        self.assertEqual(json.loads(client.generate("extract", json_mode=True))["status"], "ok")
+
+    def test_chat_and_model_listing(self):
+        server = self.start()
+        client = self.client(server)
+        reply = client.chat([{"role": "user", "content": "fix it"}], endpoint=f"{server.url}/api/chat")
+        self.assertIn("fake response", reply["message"]["content"])
+
+        tags = requests.get(f"{server.url}/api/tags", timeout=5).json()
+        self.assertEqual([m["name"] for m in tags["models"]], [MODEL])
+        ps = requests.get(f"{server.url}/api/ps", timeout=5).json()
+        self.assertEqual([m["name"] for m in ps["models"]], [MODEL])
+
+    def test_truncation_and_continuation(self):
+        long_answer = "```r\n" + "x <- 1\n" * 50 + "```"  # ~150 tokens: three 64-token parts
+        server = self.start(script={"default": long_answer})
+        client = self.client(server)
+        text = client.generate("short prompt", task="review")  # Small num_predict budget
+        self.assertEqual(text.count("x <- 1"), 50)
+        self.assertGreater(client.continuations, 0)
+
+    def test_streaming_early_stop(self):
+        server = self.start(script={"default": "```r\nx <- 1\n```\nAnd some commentary " * 5})
+        client = self.client(server, streaming=True)
+        self.assertEqual(client.generate("code please", stop_at_code=True), "x <- 1")
+        self.assertEqual(client.stream_stats.summary()["early_stops"], 1)
+
+    def test_failure_injection(self):
+        server = self.start(failure_rate=1.0)
+        client = self.client(server, max_retries=0)
+        self.assertIsNone(client.generate("hi"))
+        self.assertEqual(server.stats()["failures"], 1)
+
+    def test_failures_are_reproducible_across_runs(self):
+        def failures_for(seed):
+            server = self.start(failure_rate=0.5, seed=seed)
+            client = self.client(server, max_retries=0)
+            return [client.generate(f"prompt {i}") is None for i in range(20)]
+
+        self.assertEqual(failures_for(7), failures_for(7))
+        self.assertIn(True, failures_for(7))
+        self.assertIn(False, failures_for(7))
+
+    def test_concurrency_is_observable(self):
+        import asyncio
+        server = self.start(latency="fixed:0.2")
+
+        async def run():
+            async with AsyncOllamaClient(concurrency=4) as client:
+                return await client.generate_batch(
+                    [f"prompt {i}" for i in range(8)], endpoint=f"{server.url}/api/generate"
+                )
+
+        results = asyncio.run(run())
+        self.assertTrue(all(r and "fake response" in r for r in results))
+        self.assertEqual(server.stats()["peak_in_flight"], 4)
+
+if __name__ == "__main__":
+    unittest.main()
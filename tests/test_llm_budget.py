@@ -0,0 +1,127 @@
+import unittest
+import os
+import sys
+import json
+import threading
+from unittest.mock import patch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.llm_budget import size_options, size_chat_options, context_window, pin_context, TASK_CODE, TASK_JSON, TASK_REVIEW, RUN_CTX
+from src.utils.ollama_client import OllamaClient, build_generate_payload
+from src.utils.async_ollama_client import get_ollama_responses
+
+
+class TruncatingHandler(BaseHTTPRequestHandler):
+    """Returns the answer in pieces, flagging every piece but the last as cut off by num_predict."""
+    protocol_version = "HTTP/1.1"
+    pieces = ["```r\nx <- 1\n", "y <- 2\n", "```"]
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length))
+        self.server.payloads.append(payload)
+        step = len(payload.get("context", []))
+        last = step == len(self.pieces) - 1
+        final = {"done": True, "done_reason": "stop" if last else "length", "context": list(range(step + 1))}
+
+        if payload.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            lines = [{"response": self.pieces[step], "done": False}, dict(final, response="")]
+            for line in lines:
+                data = (json.dumps(line) + "\n").encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+            return
+
+        body = json.dumps(dict(final, response=self.pieces[step])).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSizing(unittest.TestCase):
+
+    def test_budget_scales_with_prompt_and_task(self):
+        small = size_options("x" * 350, TASK_CODE)
+        large = size_options("x" * 35000, TASK_CODE)
+        self.assertGreater(large["num_predict"], small["num_predict"])
+
+        self.assertLess(size_options("x" * 350, TASK_JSON)["num_predict"], small["num_predict"])
+        self.assertLessEqual(size_options("x" * 35000, TASK_REVIEW)["num_predict"], 256)
+
+    def test_context_window_is_fixed_for_the_run(self):
+        # A different num_ctx per prompt would make Ollama reload the model
+        sizes = {size_options("x" * n, task)["num_ctx"] for n in (10, 10000, 10_000_000)
+                 for task in (TASK_CODE, TASK_JSON, TASK_REVIEW)}
+        self.assertEqual(sizes, {RUN_CTX})
+        payloads = [build_generate_payload("x" * n, "m", json_mode=False) for n in (10, 40000)]
+        self.assertEqual({p["options"]["num_ctx"] for p in payloads}, {context_window("m")})
+
+    def test_reply_fits_in_the_window(self):
+        opts = size_options("x" * 10000, TASK_CODE, num_ctx=4096)
+        self.assertLessEqual(10000 / 3.5 + opts["num_predict"], 4096 + 1)
+        chat = size_chat_options("x" * 3500, TASK_CODE, turns=4, num_ctx=8192)
+        self.assertLessEqual(1000 + 8 * chat["num_predict"], 8192)
+
+    def test_pinned_per_model(self):
+        pin_context("pinned-model", 8192)
+        self.assertEqual(build_generate_payload("x", "pinned-model", json_mode=False)["options"]["num_ctx"], 8192)
+
+    def test_payload_uses_json_profile_in_json_mode(self):
+        payload = build_generate_payload("short", "m", json_mode=True)
+        self.assertEqual(payload["options"], dict(size_options("short", TASK_JSON, context_window("m")), temperature=0.0))
+
+
+class TestContinuation(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), TruncatingHandler)
+        self.server.payloads = []
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}/api/generate"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_truncated_answer_is_continued(self):
+        client = OllamaClient()
+        text = client.generate("translate", endpoint=self.endpoint, json_mode=True)
+        client.close()
+
+        self.assertEqual(text, "x <- 1\ny <- 2")
+        self.assertEqual(len(self.server.payloads), 3)
+        self.assertEqual(self.server.payloads[1]["context"], [0])
+        self.assertNotIn("format", self.server.payloads[1])
+        self.assertEqual(client.continuations, 2)
+        self.assertEqual(client.truncated_responses, 0)
+
+    def test_streaming_continuation_detects_fence_across_requests(self):
+        client = OllamaClient(streaming=True)
+        text = client.generate("translate", endpoint=self.endpoint, stop_at_code=True)
+        client.close()
+
+        self.assertEqual(text, "x <- 1\ny <- 2")
+        self.assertEqual(client.continuations, 2)
+
+    def test_batch_counts_reach_shared_client(self):
+        shared = OllamaClient(concurrency=2)
+        with patch("src.utils.async_ollama_client.get_client", return_value=shared):
+            results = get_ollama_responses(["translate"], endpoint=self.endpoint)
+        shared.close()
+
+        self.assertEqual(results, ["x <- 1\ny <- 2"])
+        self.assertEqual(shared.continuations, 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+from unittest.mock import patch
+import os
+import sys
+import shutil
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.llm_cache import ResponseCache
+from src.utils.ollama_client import OllamaClient
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = "temp_llm_cache"
+        self.cache = ResponseCache(self.cache_dir)
+
+    def tearDown(self):
+        if os.path.exists(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
+
+    def test_key_covers_every_input(self):
+        base = ResponseCache.make_key("m", "e", "p", {"temperature": 0.0}, False)
+        self.assertEqual(base, ResponseCache.make_key("m", "e", "p", {"temperature": 0.0}, False))
+        self.assertNotEqual(base, ResponseCache.make_key("m2", "e", "p", {"temperature": 0.0}, False))
+        self.assertNotEqual(base, ResponseCache.make_key("m", "e2", "p", {"temperature": 0.0}, False))
+        self.assertNotEqual(base, ResponseCache.make_key("m", "e", "p2", {"temperature": 0.0}, False))
+        self.assertNotEqual(base, ResponseCache.make_key("m", "e", "p", {"temperature": 0.1}, False))
+        self.assertNotEqual(base, ResponseCache.make_key("m", "e", "p", {"temperature": 0.0}, True))
+        self.assertNotEqual(base, ResponseCache.make_key("m", "e", "p", {"temperature": 0.0}, False, True))
+        self.assertEqual(base, ResponseCache.make_key("m", "e", "p", {"temperature": 0.0}, False, False))
+
+    def test_hit_miss_counters_per_stage(self):
+        key = ResponseCache.make_key("m", "e", "p", {}, False)
+        self.assertIsNone(self.cache.get(key, stage="analyst"))
+        self.cache.put(key, "spec text", stage="analyst")
+        self.assertEqual(self.cache.get(key, stage="analyst"), "spec text")
+        self.assertEqual(self.cache.get(key, stage="architect"), "spec text")
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["analyst"], {"hits": 1, "misses": 1})
+        self.assertEqual(stats["architect"], {"hits": 1, "misses": 0})
+
+    def test_persists_across_instances(self):
+        key = ResponseCache.make_key("m", "e", "p", {}, False)
+        self.cache.put(key, "kept")
+        self.assertEqual(ResponseCache(self.cache_dir).get(key), "kept")
+
+    def test_lru_eviction(self):
+        keys = [ResponseCache.make_key("m", "e", str(i), {}, False) for i in range(3)]
+        for i, key in enumerate(keys):
+            self.cache.put(key, "x" * 100)
+            os.utime(self.cache._path(key), (time.time() - 100 + i, time.time() - 100 + i))
+
+        # Touch the oldest entry so the middle one becomes least recently used
+        self.cache.get(keys[0])
+        entry_size = os.path.getsize(self.cache._path(keys[0]))
+        self.cache.max_bytes = entry_size * 2
+        self.cache.evict()
+
+        self.assertIsNotNone(self.cache.get(keys[0]))
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertIsNotNone(self.cache.get(keys[2]))
+
+    def test_put_over_budget_evicts_to_low_water_without_rescanning(self):
+        keys = [ResponseCache.make_key("m", "e", str(i), {}, False) for i in range(11)]
+        self.cache.put(keys[0], "x" * 100)
+        entry_size = os.path.getsize(self.cache._path(keys[0]))
+        self.cache.max_bytes = entry_size * 10
+
+        with patch.object(self.cache, "_entry_paths", side_effect=AssertionError("disk rescan")):
+            for key in keys[1:]:
+                self.cache.put(key, "x" * 100)
+
+        # The 11th put went over budget: 90% of 10 entries leaves 9
+        self.assertEqual(self.cache.total_bytes, entry_size * 9)
+        self.assertIsNone(self.cache.get(keys[1]))
+        self.assertIsNotNone(self.cache.get(keys[10]))
+        self.assertEqual(ResponseCache(self.cache_dir).total_bytes, entry_size * 9)
+
+    def test_read_only_never_writes(self):
+        key = ResponseCache.make_key("m", "e", "p", {}, False)
+        ro_cache = ResponseCache(self.cache_dir, read_only=True)
+        ro_cache.put(key, "ignored")
+        self.assertIsNone(ro_cache.get(key))
+
+        self.cache.put(key, "seeded")
+        self.assertEqual(ro_cache.get(key), "seeded")
+
+
+class TestClientCaching(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = "temp_client_cache"
+        self.client = OllamaClient(cache=ResponseCache(self.cache_dir))
+
+    def tearDown(self):
+        self.client.close()
+        if os.path.exists(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
+
+    def test_second_call_served_from_cache(self):
+        with patch.object(self.client, 'post_json', return_value={"response": "PASS"}) as mock_post:
+            first = self.client.generate("Review this", stage="validator")
+            second = self.client.generate("Review this", stage="validator")
+
+        self.assertEqual(first, "PASS")
+        self.assertEqual(second, "PASS")
+        mock_post.assert_called_once()
+        self.assertEqual(self.client.cache.stats()["validator"], {"hits": 1, "misses": 1})
+
+    def test_answer_cut_at_first_code_block_is_cached_apart(self):
+        with patch.object(self.client, 'post_json', return_value={"response": "x <- 1"}) as mock_post:
+            self.client.generate("Translate", task="code", stop_at_code=True)
+            self.client.generate("Translate", task="code")
+            self.client.generate("Translate", task="code", stop_at_code=True)
+        self.assertEqual(mock_post.call_count, 2)
+
+    def test_failures_are_not_cached(self):
+        import requests
+        # A fixed endpoint bypasses the pool, whose breaker would now turn the retry away
+        endpoint = "http://127.0.0.1:11434/api/generate"
+        with patch.object(self.client, 'post_json', side_effect=requests.exceptions.ConnectionError("down")):
+            self.assertIsNone(self.client.generate("Review this", endpoint=endpoint))
+        with patch.object(self.client, 'post_json', return_value={"response": "PASS"}) as mock_post:
+            self.assertEqual(self.client.generate("Review this", endpoint=endpoint), "PASS")
+            mock_post.assert_called_once()
+
+if __name__ == "__main__":
+    unittest.main()
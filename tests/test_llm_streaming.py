@@ -0,0 +1,102 @@
+import unittest
+import os
+import sys
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.llm_streaming import CompletionDetector
+from src.utils.ollama_client import OllamaClient
+
+
+class TestCompletionDetector(unittest.TestCase):
+
+    def feed_all(self, detector, chunks):
+        for i, chunk in enumerate(chunks):
+            if detector.feed(chunk):
+                return i
+        return None
+
+    def test_stops_after_closing_fence(self):
+        chunks = ["Here:\n", "```r\n", "x <- 1\n", "``", "`", "\nThis code", " works because..."]
+        detector = CompletionDetector()
+        self.assertEqual(self.feed_all(detector, chunks), 4)
+        self.assertEqual(detector.result, "Here:\n```r\nx <- 1\n```")
+
+    def test_opening_fence_alone_is_not_complete(self):
+        detector = CompletionDetector()
+        self.assertIsNone(self.feed_all(detector, ["```r\n", "x <- 1\n"]))
+        self.assertFalse(detector.complete)
+
+    def test_balanced_json(self):
+        chunks = ['{"a": ', '"}{", ', '"b": {"c": 1}', '}', ' trailing']
+        detector = CompletionDetector(json_mode=True)
+        self.assertEqual(self.feed_all(detector, chunks), 3)
+        self.assertEqual(json.loads(detector.result), {"a": "}{", "b": {"c": 1}})
+
+    def test_escaped_quotes_in_json_strings(self):
+        detector = CompletionDetector(json_mode=True)
+        self.feed_all(detector, ['{"a": "say \\"}\\" now"}'])
+        self.assertEqual(json.loads(detector.result), {"a": 'say "}" now'})
+
+
+class NDJSONHandler(BaseHTTPRequestHandler):
+    """Streams one token per line, then commentary the client should never read."""
+    tokens = ["```r\n", "x <- 1\n", "```", "\n"] + ["blah "] * 200
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.server.payloads.append(json.loads(self.rfile.read(length)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        try:
+            for token in self.tokens:
+                self.wfile.write((json.dumps({"response": token, "done": False}) + "\n").encode())
+                self.wfile.flush()
+                self.server.sent += 1
+                time.sleep(0.002)
+            self.wfile.write((json.dumps({"response": "", "done": True}) + "\n").encode())
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+class TestStreamingClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), NDJSONHandler)
+        self.server.payloads = []
+        self.server.sent = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}/api/generate"
+        self.client = OllamaClient(streaming=True, read_timeout=5)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_early_termination_on_closing_fence(self):
+        text = self.client.generate("write code", endpoint=self.endpoint, stop_at_code=True)
+
+        self.assertEqual(text, "x <- 1")
+        self.assertTrue(self.server.payloads[0]["stream"])
+        stats = self.client.stream_stats.summary()
+        self.assertEqual(stats["early_stops"], 1)
+        self.assertEqual(stats["tokens_received"], 3)
+        num_predict = self.server.payloads[0]["options"]["num_predict"]
+        self.assertEqual(stats["tokens_saved"], num_predict - 3)
+        self.assertGreater(stats["avg_ttft"], 0)
+
+    def test_full_stream_without_stop_at_code(self):
+        text = self.client.generate("write spec", endpoint=self.endpoint)
+        self.assertTrue(text.endswith("blah"))
+        self.assertEqual(self.client.stream_stats.summary()["early_stops"], 0)
+
+if __name__ == "__main__":
+    unittest.main()
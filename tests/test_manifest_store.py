@@ -0,0 +1,165 @@
+import unittest
+import os
+import sys
+import json
+import shutil
+import threading
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.manifest_store import ManifestStore, SQLiteManifestStore, atomic_write_json, open_manifest_store, load_manifest
+from src.utils.build_tracker import BuildTracker
+from src.utils.pipeline_scheduler import PipelineScheduler, Stage, LLM, R
+
+
+class Crash(Exception):
+    pass
+
+
+class TestManifestStore(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = "temp_manifest_store_test"
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.path = os.path.join(self.test_dir, "migration_manifest.json")
+        self.store = ManifestStore(self.path)
+        self.store.save([{"legacy_name": f"{n}.sps", "r_function_name": n, "status": "pending"}
+                         for n in ("a", "b", "c")])
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_failed_write_leaves_previous_manifest_intact(self):
+        with self.assertRaises(TypeError):
+            atomic_write_json(self.path, [{"bad": object()}])
+        with open(self.path) as f:
+            self.assertEqual(len(json.load(f)), 3)
+        self.assertEqual([n for n in os.listdir(self.test_dir) if n.endswith(".tmp")], [])
+
+    def test_journal_is_replayed_and_torn_lines_ignored(self):
+        manifest = self.store.load()
+        self.store.update(manifest[1], status="analyse:done")
+        with open(self.store.journal_path, "a") as f:
+            f.write('{"key": "c.sps", "fields": {"sta')  # Killed mid-write
+
+        reloaded = ManifestStore(self.path).load()
+        self.assertEqual([e["status"] for e in reloaded], ["pending", "analyse:done", "pending"])
+
+        self.store.save(reloaded)
+        self.assertFalse(os.path.exists(self.store.journal_path))
+        self.assertEqual(self.store.load()[1]["status"], "analyse:done")
+
+    def run_pipeline(self, resume, crash_on=None):
+        calls = []
+
+        def step(name):
+            def fn(entry):
+                if (name, entry["r_function_name"]) == crash_on:
+                    raise Crash()
+                calls.append((name, entry["r_function_name"]))
+            return fn
+
+        manifest = self.store.load()
+        tracker = BuildTracker(self.store, manifest, resume=resume)
+        stages = [Stage("analyse", step("analyse"), LLM), Stage("test", step("test"), R)]
+        outcomes = PipelineScheduler(stages, tracker=tracker).run(manifest)
+        for index, outcome in outcomes.items():
+            tracker.set_status(manifest[index], "done" if outcome == "done" else f"failed:{outcome}")
+        return calls
+
+    def test_resume_continues_from_last_committed_step(self):
+        first = self.run_pipeline(resume=False, crash_on=("test", "b"))
+        self.assertNotIn(("test", "b"), first)
+        # Nothing compacted the journal: the status of each step survives on its own
+        statuses = {e["r_function_name"]: e["status"] for e in ManifestStore(self.path).load()}
+        self.assertEqual(statuses, {"a": "done", "b": "failed:test", "c": "done"})
+
+        resumed = self.run_pipeline(resume=True)
+        self.assertEqual(resumed, [("test", "b")])
+
+        fresh = self.run_pipeline(resume=False)
+        self.assertEqual(len(fresh), 6)
+
+
+class TestSQLiteManifestStore(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = "temp_manifest_db_test"
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.json_path = os.path.join(self.test_dir, "migration_manifest.json")
+        self.manifest = [
+            {"legacy_name": f"{n:02d}.sps", "r_function_name": f"f{n}", "status": "pending",
+             "role": "controller" if n == 0 else "logic", "source_hash": f"h{n % 3}"}
+            for n in range(20)
+        ]
+        self.store = open_manifest_store(self.json_path, backend="sqlite")
+        self.store.save(self.manifest)
+
+    def tearDown(self):
+        self.store.close()
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_auto_detects_database_and_exports_json(self):
+        self.assertIsInstance(open_manifest_store(self.json_path), SQLiteManifestStore)
+        with open(self.json_path) as f:
+            self.assertEqual(json.load(f), self.manifest)
+        self.assertEqual(load_manifest(self.json_path), self.manifest)
+
+    def test_indexed_queries(self):
+        self.assertEqual([e["r_function_name"] for e in self.store.query(role="controller")], ["f0"])
+        self.assertEqual(len(self.store.query(role="logic", source_hash="h1")), 7)
+        self.store.update(self.manifest[4], status="done")
+        self.assertEqual([e["r_function_name"] for e in self.store.query(status="done")], ["f4"])
+
+    def test_concurrent_row_updates_do_not_overwrite_each_other(self):
+        def worker(field):
+            local = SQLiteManifestStore(self.store.path)
+            for entry in local.load():  # Each worker has its own stale copy of every entry
+                local.update(entry, **{field: entry["r_function_name"] + "-" + field})
+            local.close()
+
+        threads = [threading.Thread(target=worker, args=(f,)) for f in ("spec", "code", "tests")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for entry in self.store.load():
+            name = entry["r_function_name"]
+            self.assertEqual((entry["spec"], entry["code"], entry["tests"]),
+                             (name + "-spec", name + "-code", name + "-tests"))
+
+    def test_parallel_claims_hand_out_each_entry_once(self):
+        claimed = []
+        lock = threading.Lock()
+
+        def worker(n):
+            local = SQLiteManifestStore(self.store.path)
+            while True:
+                entry = local.claim(f"w{n}", role="logic")
+                if entry is None:
+                    break
+                with lock:
+                    claimed.append(entry["r_function_name"])
+                local.complete(entry)
+            local.close()
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(claimed), sorted(f"f{n}" for n in range(1, 20)))
+        self.assertEqual(len(self.store.query(status="done")), 19)
+        self.assertEqual(len(self.store.query(status="pending")), 1)
+
+    def test_empty_database_is_seeded_from_json(self):
+        other = os.path.join(self.test_dir, "other.json")
+        ManifestStore(other).save(self.manifest[:2])
+        store = open_manifest_store(other, backend="sqlite")
+        self.assertEqual(store.load(), self.manifest[:2])
+        self.assertTrue(store.exists())
+        store.close()
+
+if __name__ == "__main__":
+    unittest.main()
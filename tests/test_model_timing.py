@@ -0,0 +1,97 @@
+import unittest
+import os
+import sys
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.model_timing import ModelTimings
+from src.utils.ollama_client import OllamaClient
+from src.utils.llm_budget import context_window
+
+MODEL = "qwen2.5-coder:latest"
+
+
+class LoadingHandler(BaseHTTPRequestHandler):
+    """Reports a 3s load for the first request per model and ~0 afterwards, like a real Ollama."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length))
+        self.server.payloads.append(payload)
+        cold = payload["model"] not in self.server.resident
+        self.server.resident.add(payload["model"])
+        reply = {
+            "response": "ok" if "prompt" in payload else "",
+            "done": True,
+            "load_duration": 3_000_000_000 if cold else 1_000_000,
+            "prompt_eval_duration": 200_000_000 if "prompt" in payload else 0,
+            "eval_duration": 800_000_000 if "prompt" in payload else 0,
+        }
+        body = json.dumps(reply).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestModelTimings(unittest.TestCase):
+
+    def test_splits_load_from_generation(self):
+        timings = ModelTimings()
+        timings.record("architect", {"load_duration": 2e9, "prompt_eval_duration": 1e9, "eval_duration": 3e9})
+        timings.record("architect", {"load_duration": 1e6, "eval_duration": 1e9})
+        timings.record("architect", {"response": "no timing fields"})
+
+        stats = timings.stats()["architect"]
+        self.assertEqual(stats["calls"], 2)
+        self.assertEqual(stats["cold_loads"], 1)
+        self.assertAlmostEqual(stats["load_seconds"], 2.001)
+        self.assertAlmostEqual(stats["generate_seconds"], 5.0)
+
+
+class TestWarmUp(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), LoadingHandler)
+        self.server.payloads = []
+        self.server.resident = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{self.server.server_port}/api/generate"
+        self.client = OllamaClient(endpoints=[url], keep_alive="30m")
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_preload_moves_cold_load_out_of_stages(self):
+        loaded = self.client.preload([MODEL])
+        self.assertEqual(list(loaded.values()), [3.0])
+        self.assertNotIn("prompt", self.server.payloads[0])
+        self.assertEqual(self.server.payloads[0]["keep_alive"], "30m")
+        # Loaded with the window every later call uses, so the first call doesn't reload it
+        self.assertEqual(self.server.payloads[0]["options"]["num_ctx"], context_window(MODEL))
+
+        self.assertEqual(self.client.generate("hi", stage="analyst"), "ok")
+        stats = self.client.timings.stats()
+        self.assertEqual(stats["warmup"]["cold_loads"], 1)
+        self.assertEqual(stats["analyst"]["cold_loads"], 0)
+        self.assertAlmostEqual(stats["analyst"]["generate_seconds"], 1.0)
+
+    def test_every_request_carries_keep_alive(self):
+        self.client.generate("hi")
+        self.assertEqual(self.server.payloads[-1]["keep_alive"], "30m")
+
+    def test_preload_marks_model_resident_for_routing(self):
+        self.client.preload([MODEL])
+        self.assertIn(MODEL, self.client.endpoint_pool.endpoints[0].loaded_models)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+import os
+import sys
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.ollama_client import OllamaClient, strip_code_fences
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Minimal keep-alive stand-in for /api/generate."""
+    protocol_version = "HTTP/1.1"
+    reply = "```r\nx <- 1\n```"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.server.payloads.append(json.loads(self.rfile.read(length)))
+        body = json.dumps({"response": self.reply, "done": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestOllamaClient(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllamaHandler)
+        self.server.payloads = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}/api/generate"
+        self.client = OllamaClient(pool_size=2, connect_timeout=1, read_timeout=5)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_strip_code_fences(self):
+        self.assertEqual(strip_code_fences("```spss\nCOMPUTE x = 1.\n```"), "COMPUTE x = 1.")
+        self.assertEqual(strip_code_fences("plain text"), "plain text")
+
+    def test_generate_returns_clean_text(self):
+        text = self.client.generate("hello", endpoint=self.endpoint)
+        self.assertEqual(text, "x <- 1")
+        payload = self.server.payloads[0]
+        self.assertEqual(payload["options"]["temperature"], 0.0)
+        self.assertNotIn("format", payload)
+
+    def test_connections_are_reused(self):
+        """Sequential calls must share one keep-alive connection."""
+        for _ in range(5):
+            self.client.generate("hello", endpoint=self.endpoint)
+
+        stats = self.client.pool_stats()
+        self.assertEqual(stats["requests"], 5)
+        self.assertEqual(stats["connections_opened"], 1)
+        self.assertEqual(stats["reused"], 4)
+        self.assertAlmostEqual(stats["reuse_rate"], 0.8)
+
+    def test_separate_timeouts(self):
+        self.assertEqual(self.client.timeout, (1, 5))
+
+    def test_unreachable_endpoint_returns_none(self):
+        self.client.max_retries = 3
+        start = time.perf_counter()
+        text = self.client.generate("hello", endpoint="http://127.0.0.1:9/api/generate")
+        self.assertIsNone(text)
+        # A refused connection is not transient: no retries, no backoff
+        stats = self.client.pool_stats()
+        self.assertEqual(stats["failed_requests"], 1)
+        self.assertEqual(stats["retries"], 0)
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+if __name__ == "__main__":
+    unittest.main()
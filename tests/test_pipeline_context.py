@@ -0,0 +1,66 @@
+import unittest
+import os
+import sys
+import shutil
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.pipeline_context import PipelineContext
+from src.utils.manifest_store import ManifestStore
+from src.specs.architect import RArchitect
+from src.specs.qa_engineer import QAEngineer
+from src.specs.controller import PipelineController
+
+
+class TestPipelineContext(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = os.path.abspath("temp_context_test")
+        os.makedirs(self.test_dir, exist_ok=True)
+        with open(os.path.join(self.test_dir, "input_data.csv"), "w") as f:
+            f.write("id,date_reg\n1,2020-01-01\n")
+        with open(os.path.join(self.test_dir, "DESCRIPTION"), "w") as f:
+            f.write("Package: x\nImports:\n    dplyr,\n    tidyr\nEncoding: UTF-8\n")
+        self.manifest_path = os.path.join(self.test_dir, "migration_manifest.json")
+        ManifestStore(self.manifest_path).save([{
+            "legacy_name": "calc.sps", "r_function_name": "calc", "role": "logic",
+            "r_file": os.path.join(self.test_dir, "r_from_spec", "calc.R"),
+        }])
+        self.context = PipelineContext(self.test_dir)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_inputs_are_read_once_until_invalidated(self):
+        self.assertEqual(self.context.schema, "`id`, `date_reg`")
+        self.assertEqual(self.context.package_libs,
+                         ["library(dplyr)", "library(testthat)", "library(tidyr)"])
+        manifest = self.context.manifest
+        with patch("builtins.open", side_effect=AssertionError("re-read")):
+            self.context.schema
+            self.context.package_libs
+            self.assertIs(self.context.manifest, manifest)
+
+        os.remove(os.path.join(self.test_dir, "DESCRIPTION"))
+        self.context.invalidate("package_libs")
+        self.assertIn("library(readr)", self.context.package_libs)
+
+    def test_stages_share_the_context(self):
+        architect = RArchitect(context=self.context)
+        qa = QAEngineer(context=self.context)
+        controller = PipelineController(context=self.context)
+
+        self.assertEqual(architect.repo_root, self.test_dir)
+        self.assertEqual(architect.manifest_path, self.manifest_path)
+        self.assertEqual(architect.get_schema(), "`id`, `date_reg`")
+        self.assertIs(qa.get_package_libs(), self.context.package_libs)
+        self.assertIs(controller.manifest, self.context.manifest)
+        self.assertEqual(controller.output_path, os.path.join(self.test_dir, "main.R"))
+
+    def test_macros_on_a_fresh_context(self):
+        # The macro table is built from the manifest, which is not loaded yet
+        self.assertEqual(len(self.context.macros.table), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import unittest
+import os
+import sys
+import time
+import threading
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.pipeline_scheduler import PipelineScheduler, Stage, LLM, R
+
+
+class Recorder:
+    """Stage function that sleeps per entry and records order and peak concurrency."""
+
+    def __init__(self, name, delays, log):
+        self.name = name
+        self.delays = delays
+        self.log = log
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def __call__(self, entry):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delays.get(entry["r_function_name"], 0.01))
+        with self.lock:
+            self.active -= 1
+            self.log.append((self.name, entry["r_function_name"]))
+
+
+class TestPipelineScheduler(unittest.TestCase):
+
+    def test_files_do_not_wait_at_stage_barriers(self):
+        log = []
+        # "slow" dominates stage 1, "late" dominates stage 2
+        first = Recorder("analyse", {"slow": 0.6}, log)
+        second = Recorder("optimize", {"late": 0.6}, log)
+        entries = [{"r_function_name": n} for n in ("slow", "late", "quick")]
+        scheduler = PipelineScheduler([Stage("analyse", first, LLM), Stage("optimize", second, R)],
+                                      workers={LLM: 3, R: 3})
+        outcomes = scheduler.run(entries)
+
+        self.assertEqual(outcomes, {0: "done", 1: "done", 2: "done"})
+        # "quick" finished both stages while "slow" was still analysing
+        self.assertLess(log.index(("optimize", "quick")), log.index(("analyse", "slow")))
+        stats = scheduler.stats()
+        self.assertAlmostEqual(stats["barrier_seconds"], 1.2, delta=0.2)
+        self.assertLess(stats["wall_seconds"], 0.95)
+        self.assertAlmostEqual(stats["critical_path_seconds"], 0.6, delta=0.15)
+
+    def test_worker_counts_bound_each_pool(self):
+        log = []
+        llm = Recorder("analyse", {}, log)
+        r = Recorder("test", {}, log)
+        entries = [{"r_function_name": f"f{i}"} for i in range(12)]
+        PipelineScheduler([Stage("analyse", llm, LLM), Stage("test", r, R)], workers={LLM: 2, R: 3}).run(entries)
+        self.assertLessEqual(llm.peak, 2)
+        self.assertLessEqual(r.peak, 3)
+        self.assertEqual(len(log), 24)
+
+    def test_failures_stop_the_entry_and_skipped_stages_are_passed(self):
+        seen = []
+
+        def architect(entry):
+            if entry["r_function_name"] == "broken":
+                raise RuntimeError("no spec")
+            seen.append(("architect", entry["r_function_name"]))
+
+        def test(entry):
+            seen.append(("test", entry["r_function_name"]))
+            return entry["r_function_name"] != "failing"
+
+        entries = [
+            {"r_function_name": "ok", "role": "logic"},
+            {"r_function_name": "broken", "role": "logic"},
+            {"r_function_name": "failing", "role": "logic"},
+            {"r_function_name": "main", "role": "controller"},
+        ]
+        stages = [
+            Stage("architect", architect, LLM, applies=lambda e: e["role"] != "controller"),
+            Stage("test", test, R, applies=lambda e: e["role"] != "controller"),
+        ]
+        scheduler = PipelineScheduler(stages)
+        outcomes = scheduler.run(entries)
+
+        self.assertEqual(outcomes, {0: "done", 1: "architect", 2: "test", 3: "done"})
+        self.assertNotIn(("test", "broken"), seen)
+        self.assertEqual(scheduler.stats()["stopped"], {1: "architect", 2: "test"})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -39,7 +39,7 @@ class TestQALogic(unittest.TestCase):
         if os.path.exists(self.test_dir):
             shutil.rmtree(self.test_dir)
 
-    @patch('src.specs.qa_engineer.get_ollama_response')
+    @patch('src.utils.async_ollama_client.get_ollama_response')
     def test_test_generation_path(self, mock_llm):
         """Does QA Engineer save tests to tests/test_funcname.R?"""
         mock_llm.return_value = "test_that('foo', { expect_equal(1,1) })"
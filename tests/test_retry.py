@@ -0,0 +1,267 @@
+import unittest
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.retry import (
+    backoff_delay, is_retryable, is_endpoint_failure, retry_delay, retry_limit, scaled_read_timeout,
+)
+from src.utils.cassette import Cassette
+from src.utils.endpoint_pool import EndpointPool, CircuitOpen
+from src.utils.ollama_client import OllamaClient, build_generate_payload
+from src.utils.async_ollama_client import AsyncOllamaClient
+from unittest.mock import patch
+from src.specs.architect import RArchitect
+from src.specs.validator import CodeValidator
+from src.converter.spss_to_r import SPSSMigrationAgent
+
+MODEL = "qwen2.5-coder:latest"
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """Answers 503 to the first `server.fail_first` requests, then succeeds."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        with self.server.lock:
+            self.server.hits += 1
+            failing = self.server.hits <= self.server.fail_first
+        status, data = (503, {"error": "busy"}) if failing else (200, {"response": "x <- 1", "done": True})
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(response=response)
+
+
+class TestRetryPolicy(unittest.TestCase):
+
+    def test_backoff_is_jittered_and_capped(self):
+        delays = [backoff_delay(3, base=1.0, cap=5.0) for _ in range(200)]
+        self.assertTrue(all(0 <= d <= 5.0 for d in delays))
+        self.assertGreater(len(set(delays)), 100)
+        self.assertTrue(all(backoff_delay(0, base=0.5) <= 0.5 for _ in range(50)))
+
+    def test_classification(self):
+        self.assertTrue(is_retryable(requests.exceptions.ReadTimeout()))
+        self.assertTrue(is_retryable(http_error(503)))
+        self.assertTrue(is_retryable(http_error(429)))
+        self.assertFalse(is_endpoint_failure(http_error(429)))  # Busy, not broken
+        self.assertFalse(is_retryable(http_error(404)))
+
+    def test_refused_connection_only_fails_over(self):
+        try:
+            requests.post("http://127.0.0.1:9/api/generate", timeout=2)
+        except requests.exceptions.ConnectionError as e:
+            refused = e
+        self.assertTrue(is_endpoint_failure(refused))
+        self.assertFalse(is_retryable(refused))  # Nobody listening: waiting won't help
+        self.assertTrue(is_retryable(refused, failover=True))
+        self.assertEqual(retry_delay(refused, 3), 0.0)
+        self.assertGreaterEqual(retry_delay(requests.exceptions.ReadTimeout(), 3), 0.0)
+
+    def test_no_retries_while_replaying(self):
+        self.assertEqual(retry_limit(3), 3)
+        self.assertEqual(retry_limit(3, Cassette("temp_retry_cassette.json", mode="record")), 3)
+        with patch("src.utils.cassette.logger"):
+            self.assertEqual(retry_limit(3, Cassette("temp_retry_cassette.json")), 0)
+
+    def test_read_timeout_scales_with_request_size(self):
+        small = build_generate_payload("x = 1.", MODEL, json_mode=False, task="review")
+        large = build_generate_payload("COMPUTE x = 1.\n" * 2000, MODEL, json_mode=False, task="code")
+        self.assertLess(scaled_read_timeout(small, 120), scaled_read_timeout(large, 120))
+        self.assertGreaterEqual(scaled_read_timeout(small, 120), 120)
+        self.assertEqual(scaled_read_timeout(large, 120, ceiling=300), 300)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_open_half_open_closed(self):
+        pool = EndpointPool(["http://a:1/api/generate", "http://b:1/api/generate"],
+                            failure_threshold=2, open_seconds=0.2)
+        a, b = pool.endpoints
+
+        for _ in range(2):
+            a.in_flight += 1
+            pool.release(a, failed=True)
+        self.assertEqual(a.state, "open")
+        self.assertIs(pool.acquire(MODEL), b)
+        pool.release(b, latency=0.1)
+
+        time.sleep(0.25)
+        self.assertEqual(a.state, "half-open")
+        trial = pool.acquire(MODEL)
+        self.assertIs(trial, a)
+        self.assertIs(pool.acquire(MODEL), b)  # Only one trial at a time
+        pool.release(b, latency=0.1)
+
+        pool.release(trial, latency=0.1)
+        self.assertEqual(a.state, "closed")
+        self.assertEqual(a.consecutive_failures, 0)
+
+    def test_failed_trial_reopens(self):
+        pool = EndpointPool(["http://a:1/api/generate"], open_seconds=0.1)
+        a = pool.endpoints[0]
+        a.in_flight += 1
+        pool.release(a, failed=True)
+        time.sleep(0.15)
+        pool.release(pool.acquire(MODEL), failed=True)
+        self.assertEqual(a.state, "open")
+
+    def test_open_breaker_rejects_requests_until_the_trial(self):
+        pool = EndpointPool(["http://a:1/api/generate"], open_seconds=0.1)
+        a = pool.endpoints[0]
+        pool.release(pool.acquire(MODEL), failed=True)
+        with self.assertRaises(CircuitOpen):
+            pool.acquire(MODEL)
+        self.assertEqual(a.requests, 1)
+
+        client = OllamaClient(endpoints=["http://127.0.0.1:9/api/generate"], max_retries=3)
+        try:
+            self.assertIsNone(client.generate("hi"))
+            self.assertIsNone(client.generate("hi"))  # Breaker open: nothing is sent
+            self.assertEqual(client.failed_requests, 1)
+        finally:
+            client.close()
+
+    def test_one_trial_after_earlier_requests_finish(self):
+        pool = EndpointPool(["http://a:1/api/generate"], open_seconds=0.1)
+        a = pool.endpoints[0]
+        first, second = pool.acquire(MODEL), pool.acquire(MODEL)
+        pool.release(first, failed=True)  # Opens; `second` is still running
+        time.sleep(0.15)
+        self.assertEqual(a.state, "half-open")
+        with self.assertRaises(CircuitOpen):
+            pool.acquire(MODEL)  # No trial while an earlier request is in flight
+        pool.release(second, failed=True)
+
+        time.sleep(0.15)
+        trial = pool.acquire(MODEL)
+        with self.assertRaises(CircuitOpen):
+            pool.acquire(MODEL)  # Only one trial at a time
+        self.assertTrue(a.trial_in_flight)
+        pool.release(trial, latency=0.1)
+        self.assertFalse(a.trial_in_flight)
+        self.assertEqual(a.state, "closed")
+
+
+class TestClientRetries(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyHandler)
+        self.server.lock = threading.Lock()
+        self.server.hits = 0
+        self.server.fail_first = 2
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}/api/generate"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_sync_retries_until_success(self):
+        client = OllamaClient(max_retries=3, backoff_base=0.01)
+        try:
+            self.assertEqual(client.generate("hi", endpoint=self.endpoint), "x <- 1")
+            self.assertEqual(client.retries, 2)
+            self.assertEqual(self.server.hits, 3)
+        finally:
+            client.close()
+
+    def test_gives_up_after_max_retries(self):
+        client = OllamaClient(max_retries=1, backoff_base=0.01)
+        try:
+            self.assertIsNone(client.generate("hi", endpoint=self.endpoint))
+            self.assertEqual(self.server.hits, 2)
+        finally:
+            client.close()
+
+    def test_async_retries_until_success(self):
+        async def _run():
+            async with AsyncOllamaClient(max_retries=3, backoff_base=0.01) as client:
+                return await client.generate("hi", endpoint=self.endpoint), client.retries
+        self.assertEqual(asyncio.run(_run()), ("x <- 1", 2))
+
+
+class TestArchitectNoneGuard(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = "temp_retry_test"
+        os.makedirs(self.test_dir, exist_ok=True)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_failed_request_keeps_existing_draft(self):
+        r_file = os.path.join(self.test_dir, "calc.R")
+        with open(r_file, "w") as f:
+            f.write("calc <- function(df) df")
+        architect = RArchitect(manifest_path=os.path.join(self.test_dir, "missing.json"), project_root=self.test_dir)
+        architect.save_code({"r_function_name": "calc", "r_file": r_file}, None)
+        with open(r_file) as f:
+            self.assertEqual(f.read(), "calc <- function(df) df")
+
+
+class TestValidatorNoneGuard(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = "temp_retry_test"
+        os.makedirs(self.test_dir, exist_ok=True)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_failed_request_is_not_approved(self):
+        r_file = os.path.join(self.test_dir, "calc.R")
+        with open(r_file, "w") as f:
+            f.write("calc <- function(df) df")
+        validator = CodeValidator(manifest_path=os.path.join(self.test_dir, "missing.json"))
+        entry = {"r_function_name": "calc", "r_file": r_file, "legacy_file": None}
+        with patch("src.specs.validator.get_ollama_response", return_value=None):
+            self.assertFalse(validator.validate_file(entry))
+
+
+class TestConverterNoneGuard(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = "temp_retry_test"
+        os.makedirs(self.test_dir, exist_ok=True)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_failed_request_writes_nothing(self):
+        sps_path = os.path.join(self.test_dir, "calc.sps")
+        with open(sps_path, "w") as f:
+            f.write("COMPUTE x = 1.\n")
+        agent = SPSSMigrationAgent(rosetta_path=os.path.join(self.test_dir, "missing.csv"))
+        with patch("src.converter.spss_to_r.get_ollama_response", return_value=None):
+            agent.migrate_file(sps_path, self.test_dir)
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, "calc.R")))
+
+if __name__ == "__main__":
+    unittest.main()
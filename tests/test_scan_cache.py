@@ -0,0 +1,65 @@
+import unittest
+import os
+import sys
+import time
+import shutil
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.scan_cache import ScanCache
+from src.utils.spss_lexer import CommandCache
+from src.utils.dependency_resolver import DependencyResolver
+
+
+class TestScanCache(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = "temp_scan_cache_test"
+        self.syntax = os.path.join(self.test_dir, "syntax")
+        os.makedirs(self.syntax, exist_ok=True)
+        self.db = os.path.join(self.test_dir, ".scan_cache.db")
+        for n in range(1000):
+            self.write(f"f{n:04d}.sps", f"COMPUTE x{n} = {n}.\nEXECUTE.\n")
+        self.write("main.sps", "INSERT FILE='f0001.sps'.\nINSERT FILE='f0002.sps'.\n")
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def write(self, name, text):
+        with open(os.path.join(self.syntax, name), "w") as f:
+            f.write(text)
+
+    def resolve(self):
+        """A fresh process's view: new lexer cache, scan cache reopened from disk."""
+        lexer = CommandCache()
+        cache = ScanCache(self.db, lexer_cache=lexer)
+        resolver = DependencyResolver(self.syntax, cache=lexer, scan_cache=cache)
+        resolver.scan()
+        return resolver, cache, lexer
+
+    def test_unchanged_tree_is_not_parsed_again(self):
+        first, cache, _ = self.resolve()
+        self.assertEqual(cache.stats()["parsed"], 1001)
+
+        start = time.perf_counter()
+        second, cache, lexer = self.resolve()
+        elapsed = time.perf_counter() - start
+        self.assertEqual(cache.stats(), {"hits": 1001, "rehashed": 0, "parsed": 0})
+        self.assertEqual(lexer.stats()["misses"], 0)
+        self.assertEqual(dict(second.includes), dict(first.includes))
+        self.assertEqual(second.scans["main.sps"]["role"], "controller")
+        self.assertLess(elapsed, 1.0)
+
+    def test_touched_files_are_rehashed_and_edited_files_reparsed(self):
+        self.resolve()
+        path = os.path.join(self.syntax, "f0005.sps")
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))  # Touched, content unchanged
+        self.write("main.sps", "INSERT FILE='f0003.sps'.\n")
+
+        resolver, cache, _ = self.resolve()
+        self.assertEqual(cache.stats(), {"hits": 999, "rehashed": 1, "parsed": 1})
+        self.assertEqual(dict(resolver.includes), {"main.sps": ["f0003.sps"]})
+
+if __name__ == "__main__":
+    unittest.main()
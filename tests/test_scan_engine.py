@@ -0,0 +1,67 @@
+import unittest
+import os
+import sys
+import shutil
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.scan_engine import ScanEngine, walk_sps
+from src.utils.scan_cache import ScanCache
+from src.utils.spss_lexer import CommandCache
+from src.utils.dependency_resolver import DependencyResolver
+
+
+class TestScanEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = "temp_scan_engine_test"
+        self.syntax = os.path.join(self.test_dir, "syntax")
+        for sub in ("a", "b/c"):
+            os.makedirs(os.path.join(self.syntax, sub), exist_ok=True)
+        for n in range(90):
+            sub = ("", "a", "b/c")[n % 3]
+            with open(os.path.join(self.syntax, sub, f"f{n:02d}.sps"), "w") as f:
+                f.write(f"* file {n}.\nCOMPUTE x = {n}.\n")
+        with open(os.path.join(self.syntax, "main.sps"), "w") as f:
+            f.write("".join(f"INSERT FILE='f{n:02d}.sps'.\n" for n in (30, 4, 17)))
+        with open(os.path.join(self.syntax, "notes.txt"), "w") as f:
+            f.write("not syntax")
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_walk_finds_nested_files_in_sorted_order(self):
+        paths = walk_sps(self.syntax)
+        self.assertEqual(len(paths), 91)
+        self.assertEqual(paths, sorted(paths))
+
+    def test_parallel_scan_matches_sequential(self):
+        paths = walk_sps(self.syntax)
+        sequential = ScanEngine(1, lexer_cache=CommandCache()).scan_paths(paths)
+        # process_min_files=1 forces the process pool even for this small tree
+        parallel = ScanEngine(4, process_min_files=1).scan_paths(paths)
+        self.assertEqual(list(parallel), paths)
+        self.assertEqual(parallel, sequential)
+
+    def test_parallel_scan_fills_and_uses_the_cache(self):
+        db = os.path.join(self.test_dir, ".scan_cache.db")
+        paths = walk_sps(self.syntax)
+        cache = ScanCache(db)
+        ScanEngine(4, scan_cache=cache, process_min_files=1).scan_paths(paths)
+        self.assertEqual(cache.stats()["parsed"], 91)
+
+        cache = ScanCache(db)
+        ScanEngine(4, scan_cache=cache).scan_paths(paths)
+        self.assertEqual(cache.stats(), {"hits": 91, "rehashed": 0, "parsed": 0})
+
+    def test_resolver_graph_is_independent_of_worker_count(self):
+        orders = []
+        for workers in (1, 8):
+            resolver = DependencyResolver(self.syntax, cache=CommandCache(), workers=workers)
+            resolver.scan()
+            orders.append((resolver.get_execution_order(), dict(resolver.includes)))
+        self.assertEqual(orders[0], orders[1])
+        self.assertEqual(orders[0][1], {"main.sps": ["f30.sps", "f04.sps", "f17.sps"]})
+
+if __name__ == "__main__":
+    unittest.main()
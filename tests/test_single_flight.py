@@ -0,0 +1,152 @@
+import unittest
+import os
+import sys
+import json
+import time
+import asyncio
+import threading
+from unittest.mock import patch
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.single_flight import SingleFlight, AsyncSingleFlight
+from src.utils.ollama_client import OllamaClient
+from src.utils.async_ollama_client import get_ollama_responses
+
+
+class SlowCountingHandler(BaseHTTPRequestHandler):
+    """Answers after a short delay so identical requests overlap."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        prompt = json.loads(self.rfile.read(length))["prompt"]
+        self.server.hits += 1
+        time.sleep(0.2)
+        body = json.dumps({"response": f"echo:{prompt}", "done": True}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSingleFlight(unittest.TestCase):
+
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        calls = []
+        release = threading.Event()
+
+        def work():
+            calls.append(1)
+            release.wait(2)
+            return "done"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do("k", work))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        while flight.coalesced < 4:
+            time.sleep(0.01)
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["done"] * 5)
+        self.assertEqual(flight.coalesced, 4)
+
+    def test_sequential_calls_are_not_coalesced(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do("k", lambda: 1), 1)
+        self.assertEqual(flight.do("k", lambda: 2), 2)
+        self.assertEqual(flight.coalesced, 0)
+
+    def test_errors_reach_every_caller(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        errors = []
+
+        def boom():
+            started.set()
+            time.sleep(0.1)
+            raise RuntimeError("upstream failed")
+
+        def call():
+            try:
+                flight.do("k", boom)
+            except RuntimeError as e:
+                errors.append(str(e))
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(1)
+        follower = threading.Thread(target=call)
+        follower.start()
+        leader.join()
+        follower.join()
+        self.assertEqual(errors, ["upstream failed"] * 2)
+
+    def test_async_single_flight(self):
+        flight = AsyncSingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "done"
+
+        async def run():
+            return await asyncio.gather(*(flight.do("k", work) for _ in range(3)))
+
+        self.assertEqual(asyncio.run(run()), ["done"] * 3)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.coalesced, 2)
+
+
+class TestClientCoalescing(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), SlowCountingHandler)
+        self.server.hits = 0
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint = f"http://127.0.0.1:{self.server.server_port}/api/generate"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_threads_sending_same_prompt_hit_server_once(self):
+        client = OllamaClient()
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(client.generate("same", endpoint=self.endpoint)))
+            for _ in range(4)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        client.close()
+
+        self.assertEqual(results, ["echo:same"] * 4)
+        self.assertEqual(self.server.hits, 1)
+        self.assertEqual(client.single_flight.coalesced, 3)
+
+    def test_batch_with_duplicate_prompts(self):
+        shared = OllamaClient(concurrency=4)
+        with patch("src.utils.async_ollama_client.get_client", return_value=shared):
+            results = get_ollama_responses(["a", "b", "a", "a"], endpoint=self.endpoint)
+        shared.close()
+
+        self.assertEqual(results, ["echo:a", "echo:b", "echo:a", "echo:a"])
+        self.assertEqual(self.server.hits, 2)
+        self.assertEqual(shared.single_flight.coalesced, 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import unittest
+import os
+import sys
+import shutil
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.spss_chunker import split_commands, split_units, chunk_spss
+from src.specs.analyst import SpecAnalyst
+
+BLOCK = """DO IF (region = 1).
+  COMPUTE north = 1.
+  LOOP #i = 1 TO 3.
+    COMPUTE total = total + #i.
+  END LOOP.
+END IF."""
+
+
+def big_script(blocks):
+    parts = []
+    for n in range(blocks):
+        parts.append(f"COMPUTE step{n} = step{n - 1} + 1.")
+        parts.append(BLOCK)
+    return "\n".join(parts)
+
+
+class TestSPSSChunker(unittest.TestCase):
+
+    def test_commands_end_at_periods_and_data_blocks_stay_whole(self):
+        source = "DATA LIST FREE / a b.\nBEGIN DATA\n1 2\n3 4\nEND DATA.\nCOMPUTE c = a\n  + b.\n\nEXECUTE."
+        self.assertEqual(split_commands(source), [(0, 1), (1, 4), (5, 2), (8, 1)])
+
+    def test_blocks_are_units(self):
+        units = split_units("COMPUTE a = 1.\n" + BLOCK + "\nEXECUTE.")
+        self.assertEqual(units, [(0, 1), (1, 6), (7, 1)])
+
+    def test_chunks_respect_budget_and_boundaries(self):
+        source = big_script(40)
+        chunks = chunk_spss(source, max_tokens=200)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("\n".join(c.text for c in chunks), source)
+        for chunk in chunks:
+            self.assertLessEqual(chunk.tokens, 200)
+            self.assertTrue(chunk.text.rstrip().endswith("."))
+            self.assertEqual(chunk.text.count("DO IF"), chunk.text.count("END IF."))
+        self.assertEqual(chunks[0].first_line, 1)
+        self.assertEqual(chunks[1].first_line, chunks[0].last_line + 1)
+
+    def test_oversized_block_is_split_at_commands(self):
+        source = "DO IF (x = 1).\n" + "\n".join(f"COMPUTE v{i} = {i}." for i in range(100)) + "\nEND IF."
+        chunks = chunk_spss(source, max_tokens=100)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("\n".join(c.text for c in chunks), source)
+
+
+class TestAnalystMapReduce(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = "temp_chunk_test"
+        os.makedirs(self.test_dir, exist_ok=True)
+        self.legacy = os.path.join(self.test_dir, "big.sps")
+        with open(self.legacy, "w") as f:
+            f.write(big_script(60))
+        self.entry = {
+            "legacy_file": self.legacy,
+            "legacy_name": "big.sps",
+            "r_function_name": "big",
+            "spec_file": os.path.join(self.test_dir, "specs", "big.md"),
+        }
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_large_file_is_chunked_and_merged(self):
+        analyst = SpecAnalyst(chunk_tokens=300)
+        batches = []
+
+        def fake_request_all(prompts, stage, tags=None, **kwargs):
+            batches.append((prompts, tags))
+            return [f"spec {len(batches)}.{i}" for i in range(len(prompts))]
+
+        with patch("src.specs.analyst.request_all", side_effect=fake_request_all):
+            analyst.analyze_file(self.entry)
+
+        map_prompts, map_tags = batches[0]
+        self.assertGreater(len(map_prompts), 2)
+        self.assertIn(f"part 1 of {len(map_prompts)}", map_prompts[0])
+        self.assertEqual(map_tags[1], {"function": "big", "part": 2})
+        self.assertTrue(all("PARTIAL SPECIFICATIONS" in p for p in batches[1][0]))
+        with open(self.entry["spec_file"]) as f:
+            self.assertTrue(f.read().startswith(f"spec {len(batches)}.0"))
+
+    def test_small_file_is_one_request(self):
+        analyst = SpecAnalyst()
+        with patch("src.specs.analyst.request_all", return_value=["# Spec"]) as request_all:
+            analyst.analyze_file(self.entry)
+        request_all.assert_called_once()
+        self.assertEqual(len(request_all.call_args[0][0]), 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import os
+import sys
+import shutil
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.spss_compactor import compact_spss, strip_inline_comment
+from src.converter.spss_to_r import SPSSMigrationAgent
+
+SOURCE = """* Calculate registration delays.
+* Author: legacy team, 2009.
+
+DATA LIST FREE / id dor dod.
+BEGIN DATA
+1 20200101 20191231
+2 20200105 20200101
+3 20200110 20200102
+4 20200111 20200103
+5 20200112 20200104
+END DATA.
+
+COMPUTE delay = dor - dod. /* days between death and registration
+VALUE LABELS region
+  1 'North'
+  2 'South'
+  3 'East'
+  4 'West'
+  5 'Islands'.
+COMMENT the next block is
+  important but verbose.
+EXECUTE.
+"""
+
+
+class TestSPSSCompactor(unittest.TestCase):
+
+    def test_removes_comments_blanks_and_inline_data(self):
+        compacted = compact_spss(SOURCE, data_preview=2, max_label_lines=3)
+        text = compacted.text
+        self.assertNotIn("Author", text)
+        self.assertNotIn("verbose", text)
+        self.assertNotIn("days between", text)
+        self.assertNotIn("\n\n", text)
+        self.assertIn("2 20200105 20200101", text)
+        self.assertNotIn("3 20200110", text)
+        self.assertIn("3 more data rows omitted (5 in total)", text)
+        self.assertIn("/* ... 3 more label lines omitted */", text)
+        self.assertIn("  5 'Islands'.", text)
+        self.assertTrue(text.rstrip().endswith("EXECUTE."))
+        self.assertEqual(compacted.removed["data"], 3)
+        self.assertGreater(compacted.tokens_saved, 0)
+        self.assertIn("tokens (-", compacted.summary())
+
+    def test_line_map_points_at_original_lines(self):
+        compacted = compact_spss(SOURCE, data_preview=2, max_label_lines=3)
+        original = SOURCE.splitlines()
+        for n, line in enumerate(compacted.text.splitlines(), start=1):
+            source = original[compacted.source_line(n) - 1]
+            if "omitted" not in line:
+                self.assertTrue(source.startswith(line), (line, source))
+        first = compacted.text.splitlines()[0]
+        self.assertEqual(first, "DATA LIST FREE / id dor dod.")
+        self.assertEqual(compacted.source_line(1), 4)
+
+    def test_multiplication_is_not_a_comment(self):
+        source = "COMPUTE x = a\n  * b.\nCOMPUTE y = 2 * x."
+        self.assertEqual(compact_spss(source).text, source)
+
+    def test_inline_comment_inside_quotes_is_kept(self):
+        self.assertEqual(strip_inline_comment("TITLE '/* not a comment'."), "TITLE '/* not a comment'.")
+        self.assertEqual(strip_inline_comment("COMPUTE x = 1. /* note */"), "COMPUTE x = 1.")
+
+    def test_previews_can_be_disabled(self):
+        text = compact_spss(SOURCE, data_preview=None, max_label_lines=None).text
+        self.assertIn("5 20200112 20200104", text)
+        self.assertIn("  3 'East'", text)
+        self.assertNotIn("omitted", text)
+        self.assertNotIn("Author", text)
+
+    def test_converter_sends_every_data_row_and_label(self):
+        test_dir = "temp_compactor_test"
+        os.makedirs(test_dir, exist_ok=True)
+        self.addCleanup(shutil.rmtree, test_dir)
+        source = SOURCE.replace("5 20200112 20200104", "\n".join(f"{n} 20200112 20200104" for n in range(5, 40)))
+        sps_path = os.path.join(test_dir, "delays.sps")
+        with open(sps_path, "w") as f:
+            f.write(source)
+
+        with patch("src.converter.spss_to_r.get_ollama_response", return_value="x <- 1") as mock_llm, \
+             patch("builtins.print"):
+            SPSSMigrationAgent(rosetta_path=os.path.join(test_dir, "missing.csv")).migrate_file(sps_path, test_dir)
+        prompt = mock_llm.call_args[0][0]
+        self.assertIn("39 20200112 20200104", prompt)
+        self.assertIn("  4 'West'", prompt)
+        self.assertNotIn("omitted", prompt)
+        self.assertNotIn("Author", prompt)
+
+if __name__ == "__main__":
+    unittest.main()
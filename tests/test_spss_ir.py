@@ -0,0 +1,132 @@
+import unittest
+import os
+import sys
+import json
+import shutil
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.spss_ir import parse_ir, ir_units, save_ir, load_ir, Node
+from src.utils.spss_parser import parse_spss_value_labels
+from src.utils.spss_compactor import compact_spss
+from src.utils.spss_chunker import chunk_spss
+from src.utils.manifest_manager import ManifestManager
+from src.utils.manifest_store import load_manifest
+
+SOURCE = """* Build the analysis file.
+GET FILE='survey.sav'.
+COMPUTE score = q1 * 1.5
+  + q2.
+IF (age > 65) grp = 3.
+DO IF (region = 'N. East').
+  COMPUTE w = 1.
+ELSE IF (region = 'South').
+  LOOP #i = 1 TO 3.
+    COMPUTE v = #i.
+  END LOOP.
+ELSE.
+  COMPUTE w = 0.
+END IF.
+SELECT IF (score > 0 & grp ~= 2).
+RECODE a b (1=2) (ELSE=COPY) INTO c d /e (3 THRU 5 = 1).
+AGGREGATE OUTFILE=* MODE=ADDVARIABLES /BREAK=id /total = SUM(score) /n = N.
+MATCH FILES /FILE=* /TABLE='lookup.sav' /BY id.
+VALUE LABELS grp 1 'Jr. Staff' 2 'It''s senior' / a b 1.5 'Half'.
+"""
+
+
+class TestSpssIR(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = "temp_ir_test"
+        os.makedirs(os.path.join(self.test_dir, "syntax"), exist_ok=True)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_typed_nodes_with_spans(self):
+        nodes = parse_ir(SOURCE)
+        kinds = [n.kind for n in nodes]
+        self.assertEqual(kinds, ["COMMAND", "COMPUTE", "IF", "DO IF", "SELECT IF", "RECODE",
+                                 "AGGREGATE", "MATCH FILES", "VALUE LABELS"])
+        compute = nodes[1]
+        self.assertEqual((compute.target, compute.span), ("score", (3, 4)))
+        self.assertEqual(nodes[2].condition, "age > 65")
+
+        do_if = nodes[3]
+        self.assertEqual(do_if.span, (6, 14))
+        self.assertEqual([b["condition"] for b in do_if.branches], ["region = 'N. East'", "region = 'South'", None])
+        loop = do_if.branches[1]["body"][0]
+        self.assertEqual((loop.kind, loop.span, loop.body[0].target), ("LOOP", (9, 11), "v"))
+        self.assertEqual(len(list(do_if.walk())), 5)
+
+        self.assertEqual(nodes[4].condition, "score > 0 & grp ~= 2")
+        self.assertEqual(nodes[5].groups[0]["into"], ["c", "d"])
+        self.assertEqual(nodes[5].groups[1]["mappings"], [["3 THRU 5", "1"]])
+        aggregate = nodes[6]
+        self.assertEqual((aggregate.outfile, aggregate.fields["break"]), ("*", ["id"]))
+        self.assertEqual([a["function"] for a in aggregate.aggregations], ["SUM", "N"])
+        self.assertEqual(aggregate.options, {"MODE": "ADDVARIABLES"})
+        self.assertEqual([f["name"] for f in nodes[7].files], ["*", "lookup.sav"])
+        self.assertEqual(nodes[7].by, ["id"])
+
+    def test_value_labels_survive_periods_and_decimals(self):
+        labels = parse_spss_value_labels(SOURCE)
+        self.assertEqual(labels["grp"], {1: "Jr. Staff", 2: "It's senior"})
+        self.assertEqual(labels["a"], {1.5: "Half"})
+        self.assertEqual(labels["b"], {1.5: "Half"})
+
+    def test_value_labels_end_at_next_command_on_same_line(self):
+        labels = parse_spss_value_labels("VALUE LABELS sex 1 'Male' 2 'Female'. VALUE LABELS reg 1 'N'.\n"
+                                         "VALUE LABELS grp 1 'Jr. Staff'. COMPUTE x = 1.\n")
+        self.assertEqual(labels, {"sex": {1: "Male", 2: "Female"}, "reg": {1: "N"}, "grp": {1: "Jr. Staff"}})
+
+    def test_round_trip_and_staleness(self):
+        path = os.path.join(self.test_dir, "ir", "x.json")
+        nodes = parse_ir(SOURCE)
+        save_ir(path, nodes, "abc")
+        with open(path) as f:
+            self.assertNotIn("\n", f.read())  # Compact
+
+        loaded = load_ir(path, "abc")
+        self.assertEqual([n.to_dict() for n in loaded], [n.to_dict() for n in nodes])
+        self.assertIsNone(load_ir(path, "other"))
+        self.assertIsNone(load_ir(os.path.join(self.test_dir, "missing.json")))
+
+    def test_ir_units_follow_compacted_lines(self):
+        source = SOURCE + "BEGIN DATA\n" + "1 2\n" * 200 + "END DATA.\nSAVE OUTFILE='out.sav'.\n"
+        nodes = parse_ir(source)
+        compacted = compact_spss(source)
+        units = ir_units(nodes, compacted.line_map)
+        self.assertEqual(sum(count for _, count in units), len(compacted.line_map))
+
+        # The DO IF block is one unit, so no chunk boundary falls inside it
+        chunks = chunk_spss(compacted.text, 80, units=units)
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            first = compacted.source_line(chunk.first_line)
+            last = compacted.source_line(chunk.last_line)
+            self.assertFalse(6 < first <= 14 or 6 <= last < 14, (first, last))
+
+    def test_manifest_writes_and_reuses_ir(self):
+        syntax = os.path.join(self.test_dir, "syntax")
+        with open(os.path.join(syntax, "01_prep.sps"), "w") as f:
+            f.write(SOURCE)
+        manifest_path = os.path.join(self.test_dir, "migration_manifest.json")
+
+        ManifestManager(syntax, manifest_path).generate_manifest()
+        entry = load_manifest(manifest_path)[0]
+        self.assertEqual(entry["ir_file"], os.path.abspath(os.path.join(self.test_dir, "ir", "prep.json")))
+        self.assertEqual(load_ir(entry["ir_file"], entry["ir_hash"])[3].kind, "DO IF")
+
+        # Unchanged source: the IR file is left alone
+        mtime = os.stat(entry["ir_file"]).st_mtime_ns
+        with open(entry["ir_file"]) as f:
+            data = json.load(f)
+        ManifestManager(syntax, manifest_path).generate_manifest()
+        self.assertEqual(os.stat(entry["ir_file"]).st_mtime_ns, mtime)
+        self.assertEqual(Node.from_dict(data["nodes"][0]).kind, "COMMAND")
+
+
+if __name__ == '__main__':
+    unittest.main()
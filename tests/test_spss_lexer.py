@@ -0,0 +1,131 @@
+import unittest
+import os
+import sys
+import shutil
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.spss_lexer import lex_spss, CommandCache
+from src.utils.dependency_resolver import DependencyResolver
+from src.utils.manifest_manager import ManifestManager
+from src.utils.system_scanner import SystemScanner
+from src.utils.spss_scanner import SPSSCommandScanner
+from src.utils.scan_cache import scan_file
+
+SOURCE = """* Header comment
+  over two lines.
+do if(age > 65). /* pensioners.
+  compute grp = 1.
+end if.
+SORT CASES BY id.
+COMPUTE prev = LAG(score).
+
+BEGIN DATA
+1 2
+3 4
+END DATA.
+DEFINE !scale (v = !TOKENS(1))
+compute !v = !v * 2.
+!ENDDEFINE.
+T-TEST GROUPS=g(1 2)
+  /VARIABLES=x.
+"""
+
+
+class TestSPSSLexer(unittest.TestCase):
+
+    def test_command_stream(self):
+        commands = lex_spss(SOURCE)
+        self.assertEqual([c.keyword for c in commands],
+                         ["*", "DO IF", "COMPUTE", "END IF", "SORT CASES", "COMPUTE", "BEGIN DATA", "DEFINE", "T-TEST"])
+        comment, do_if = commands[0], commands[1]
+        self.assertTrue(comment.is_comment)
+        self.assertEqual((comment.first_line, comment.last_line), (1, 2))
+        self.assertEqual(do_if.args, "(age > 65)")  # Inline comment gone, period stripped
+        data = commands[6]
+        self.assertTrue(data.is_data)
+        self.assertEqual((data.first_line, data.last_line), (9, 12))
+        macro = commands[7]
+        self.assertEqual((macro.first_line, macro.last_line), (13, 15))  # Periods in the body don't end it
+        self.assertEqual(commands[8].args, "GROUPS=g(1 2)\n  /VARIABLES=x")
+
+    def test_file_arg_with_trailing_subcommands(self):
+        commands = lex_spss(
+            "INSERT FILE='a.sps' /CD=YES ERROR=STOP.\n"
+            "INCLUDE FILE = \"b c.sps\" ERROR=STOP.\n"
+            "INSERT FILE=d.sps.\n"
+            "SAVE OUTFILE='out.sav'.\n"
+        )
+        self.assertEqual([c.file_arg() for c in commands], ["a.sps", "b c.sps", "d.sps", None])
+
+        test_dir = "temp_lexer_test"
+        os.makedirs(test_dir, exist_ok=True)
+        self.addCleanup(shutil.rmtree, test_dir)
+        for name, text in {"main.sps": "INSERT FILE='a.sps' /CD=YES ERROR=STOP.\n", "a.sps": "COMPUTE x = 1.\n"}.items():
+            with open(os.path.join(test_dir, name), "w") as f:
+                f.write(text)
+        resolver = DependencyResolver(test_dir, cache=CommandCache())
+        resolver.scan()
+        self.assertEqual(dict(resolver.includes), {"main.sps": ["a.sps"]})
+        self.assertEqual(scan_file(os.path.join(test_dir, "main.sps"), lexer_cache=CommandCache())["role"], "controller")
+
+    def test_cache_lexes_each_file_once_until_it_changes(self):
+        test_dir = "temp_lexer_test"
+        os.makedirs(test_dir, exist_ok=True)
+        self.addCleanup(shutil.rmtree, test_dir)
+        path = os.path.join(test_dir, "a.sps")
+        with open(path, "w") as f:
+            f.write("COMPUTE x = 1.\n")
+
+        cache = CommandCache()
+        first = cache.commands(path)
+        self.assertIs(cache.commands(path), first)
+        with open(path, "w") as f:
+            f.write("COMPUTE x = 1.\nEXECUTE.\n")
+        self.assertEqual(len(cache.commands(path)), 2)
+        self.assertEqual(cache.stats(), {"files": 1, "hits": 1, "misses": 2})
+
+
+class TestScannersAgree(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = "temp_scanners_test"
+        self.syntax = os.path.join(self.test_dir, "syntax")
+        os.makedirs(self.syntax, exist_ok=True)
+        files = {
+            "main.sps": "* INSERT FILE='old.sps'.\ninsert file = 'calc.sps'.\nGET DATA /TYPE=XLS /FILE='in.xls'.\n",
+            "calc.sps": SOURCE,
+            "old.sps": "COMPUTE y = 0.\n",
+        }
+        for name, text in files.items():
+            with open(os.path.join(self.syntax, name), "w") as f:
+                f.write(text)
+        self.cache = CommandCache()
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_one_read_per_file_and_commented_commands_ignored(self):
+        resolver = DependencyResolver(self.syntax, cache=self.cache)
+        resolver.scan()
+        self.assertEqual(dict(resolver.includes), {"main.sps": ["calc.sps"]})
+
+        manager = ManifestManager(self.syntax, manifest_path=os.path.join(self.test_dir, "m.json"), cache=self.cache)
+        self.assertEqual(manager.determine_role(resolver.file_map["main.sps"]), "controller")
+        self.assertEqual(manager.determine_role(resolver.file_map["old.sps"]), "logic")
+
+        scanner = SystemScanner(self.syntax, cache=self.cache)
+        scanner.scan()
+        self.assertEqual(scanner.dependencies, ["main.sps -> calc.sps"])
+        self.assertEqual(scanner.external_inputs, ["main.sps:3 reads External Data (Likely Driver)"])
+        self.assertEqual(scanner.macros, ["calc.sps defines Macro: !SCALE"])
+        self.assertIn("calc.sps:7 uses LAG/LEAD (Risk: Low)", scanner.time_logic)
+
+        counts = SPSSCommandScanner(cache=self.cache).scan_directory(self.syntax)
+        self.assertEqual(counts["COMPUTE"], 3)
+        self.assertEqual(counts["INSERT"], 1)
+
+        self.assertEqual(self.cache.stats()["misses"], 3)
+
+if __name__ == "__main__":
+    unittest.main()
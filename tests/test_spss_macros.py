@@ -0,0 +1,139 @@
+import unittest
+import os
+import sys
+import time
+import shutil
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.spss_lexer import lex_spss, CommandCache
+from src.utils.spss_macros import MacroTable, MacroExpander
+from src.specs.analyst import SpecAnalyst
+
+MACROS = """DEFINE !scale (!POSITIONAL !TOKENS(1) / by = !DEFAULT(2) !TOKENS(1))
+COMPUTE !1 = !1 * !by.
+!ENDDEFINE.
+DEFINE !lags (vars = !CHAREND('/') / n = !TOKENS(1))
+!DO !v !IN (!vars)
+!DO !i = 1 !TO !n
+COMPUTE !CONCAT(!v, '_lag', !i) = LAG(!v, !i).
+!DOEND
+!DOEND
+!ENDDEFINE.
+DEFINE !pick (kind = !TOKENS(1) / cols = !ENCLOSE('(', ')'))
+!IF (!kind = 'mean') !THEN
+AGGREGATE /BREAK=id /m = MEAN(!cols).
+!ELSE
+AGGREGATE /BREAK=id /m = SUM(!cols).
+!IFEND
+!scale m.
+!ENDDEFINE.
+DEFINE !tag () 'v2' !ENDDEFINE.
+"""
+
+
+def expander(source):
+    return MacroExpander(MacroTable().add_commands(lex_spss(source)))
+
+
+class TestMacroExpansion(unittest.TestCase):
+
+    def test_arguments_loops_and_conditions(self):
+        source = MACROS + """GET FILE='a.sav'.
+!scale score by = 10.
+!lags vars = a b / n = 2.
+!pick kind = 'sum' cols = (x).
+COMPUTE version = !tag.
+STRING s (A8).
+COMPUTE s = '!tag'.
+"""
+        expanded = expander(source).expand_source(source)
+        self.assertEqual(expanded.text.splitlines(), [
+            "GET FILE='a.sav'.",
+            "COMPUTE score = score * 10.",
+            "COMPUTE a_lag1 = LAG(a, 1).",
+            "COMPUTE a_lag2 = LAG(a, 2).",
+            "COMPUTE b_lag1 = LAG(b, 1).",
+            "COMPUTE b_lag2 = LAG(b, 2).",
+            "AGGREGATE /BREAK=id /m = SUM(x).",
+            "COMPUTE m = m * 2.",  # Nested call, default argument
+            "COMPUTE version = 'v2'.",
+            "STRING s (A8).",
+            "COMPUTE s = '!tag'.",  # Inside quotes: not a call
+        ])
+        self.assertEqual(expanded.calls, 4)
+        # Every expanded line traces back to its call site; the DEFINE blocks are gone
+        self.assertEqual(expanded.line_map, [20, 21, 22, 22, 22, 22, 23, 23, 24, 25, 26])
+
+    def test_repeated_calls_are_expanded_once(self):
+        source = MACROS + "!lags vars = a b c / n = 3.\n" * 5000
+        macros = expander(source)
+        start = time.time()
+        expanded = macros.expand_source(source)
+        self.assertLess(time.time() - start, 2.0)
+        self.assertEqual(len(expanded.text.splitlines()), 5000 * 9)
+        self.assertEqual(macros.stats()["misses"], 1)
+        self.assertEqual(macros.stats()["hits"], 4999)
+
+    def test_bad_calls_are_left_alone(self):
+        source = "DEFINE !loop () !loop !ENDDEFINE.\n!loop.\nCOMPUTE x = 1.\n"
+        macros = expander(source)
+        with patch("builtins.print"):
+            expanded = macros.expand_source(source)
+        self.assertIsNone(expanded)  # Nothing could be expanded
+        self.assertEqual(macros.stats()["failed"], 1)
+
+    def test_source_without_calls(self):
+        self.assertIsNone(expander(MACROS).expand_source("COMPUTE x = 1.\n"))
+
+
+class TestMacroTable(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = "temp_macro_test"
+        os.makedirs(self.test_dir, exist_ok=True)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def write(self, name, text):
+        path = os.path.join(self.test_dir, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_repo_wide_table_later_definition_wins(self):
+        first = self.write("01_macros.sps", MACROS)
+        second = self.write("02_override.sps", "DEFINE !tag () 'v3' !ENDDEFINE.\n")
+        table = MacroTable.from_paths([first, second], lexer_cache=CommandCache())
+        self.assertEqual(len(table), 4)
+        self.assertEqual(table.redefined, 1)
+        self.assertEqual(MacroExpander(table).expand_text("COMPUTE v = !tag."), "COMPUTE v = 'v3'.")
+
+        before = table.digest()
+        self.write("02_override.sps", "DEFINE !tag () 'v4' !ENDDEFINE.\n")
+        self.assertNotEqual(MacroTable.from_paths([first, second], lexer_cache=CommandCache()).digest(), before)
+
+    def test_analyst_sees_expanded_source(self):
+        macros = self.write("01_macros.sps", MACROS)
+        job = self.write("02_job.sps", "GET FILE='a.sav'.\n" + "!lags vars = a b / n = 2.\n" * 40)
+        entry = {
+            "legacy_file": job,
+            "legacy_name": "02_job.sps",
+            "r_function_name": "job",
+            "spec_file": os.path.join(self.test_dir, "specs", "job.md"),
+        }
+        analyst = SpecAnalyst(chunk_tokens=200, macros=MacroExpander(MacroTable.from_paths([macros, job])))
+        prompts = analyst.build_prompts(entry)
+
+        self.assertGreater(len(prompts), 1)
+        self.assertIn("COMPUTE b_lag2 = LAG(b, 2).", prompts[0])
+        self.assertNotIn("!lags", "".join(prompts))
+        # Chunk notes and the line map still point at the original file
+        self.assertIn("original lines 1-", prompts[0])
+        self.assertEqual(analyst.compacted["job"].line_map[-1], 41)
+
+
+if __name__ == '__main__':
+    unittest.main()
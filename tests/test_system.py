@@ -23,6 +23,8 @@ class TestManifest(unittest.TestCase):
             shutil.rmtree(self.test_dir)
         if os.path.exists("migration_manifest.json"):
             os.remove("migration_manifest.json")
+        if os.path.exists("ir"):
+            shutil.rmtree("ir")
 
     def test_manifest_generation(self):
         """Does the Manifest Manager find files and create JSON?"""
@@ -0,0 +1,106 @@
+import unittest
+import os
+import sys
+import json
+import shutil
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.utils.telemetry import Telemetry, percentile
+from src.utils.ollama_client import OllamaClient
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Answers like Ollama, with token counts and durations."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        body = json.dumps({
+            "response": "ok",
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": 40,
+            "prompt_eval_duration": 200_000_000,
+            "eval_count": 50,
+            "eval_duration": 1_000_000_000,
+            "load_duration": 1_000_000,
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestTelemetry(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = "temp_telemetry_test"
+        os.makedirs(self.test_dir, exist_ok=True)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir)
+
+    def test_percentile(self):
+        self.assertEqual(percentile([], 50), 0.0)
+        self.assertEqual(percentile([3, 1, 2], 50), 2)
+        self.assertAlmostEqual(percentile(list(range(1, 101)), 95), 95.05)
+
+    def test_summary_per_stage(self):
+        telemetry = Telemetry()
+        for latency in (1.0, 2.0, 3.0):
+            telemetry.record({"stage": "architect"}, {"eval_count": 100, "eval_duration": 2e9, "prompt_eval_count": 10}, latency)
+        telemetry.record({"stage": "qa"}, {}, 0.5)
+
+        summary = telemetry.summary()
+        self.assertEqual(summary["architect"]["calls"], 3)
+        self.assertEqual(summary["architect"]["p50_latency"], 2.0)
+        self.assertEqual(summary["architect"]["output_tokens"], 300)
+        self.assertEqual(summary["architect"]["prompt_tokens"], 30)
+        self.assertAlmostEqual(summary["architect"]["tokens_per_second"], 50.0)
+        self.assertEqual(summary["qa"]["tokens_per_second"], 0.0)
+
+    def test_prometheus_textfile(self):
+        telemetry = Telemetry()
+        telemetry.record({"stage": "qa"}, {"eval_count": 7}, 1.5)
+        path = os.path.join(self.test_dir, "llm.prom")
+        telemetry.write_prometheus(path)
+
+        with open(path) as f:
+            text = f.read()
+        self.assertIn('llm_request_latency_seconds_bucket{stage="qa",le="1"} 0', text)
+        self.assertIn('llm_request_latency_seconds_bucket{stage="qa",le="2"} 1', text)
+        self.assertIn('llm_request_latency_seconds_count{stage="qa"} 1', text)
+        self.assertIn('llm_tokens_total{stage="qa",kind="output"} 7', text)
+
+    def test_client_writes_tagged_jsonl(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        path = os.path.join(self.test_dir, "calls.jsonl")
+        client = OllamaClient(telemetry=Telemetry(path))
+        try:
+            endpoint = f"http://127.0.0.1:{server.server_port}/api/generate"
+            client.generate("hi", endpoint=endpoint, stage="optimizer", tag={"function": "calc", "attempt": 2})
+        finally:
+            client.close()
+            server.shutdown()
+            server.server_close()
+
+        with open(path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 1)
+        record = records[0]
+        self.assertEqual((record["stage"], record["function"], record["attempt"]), ("optimizer", "calc", 2))
+        self.assertEqual(record["eval_count"], 50)
+        self.assertAlmostEqual(record["tokens_per_second"], 50.0)
+        self.assertGreater(record["latency_seconds"], 0)
+
+if __name__ == "__main__":
+    unittest.main()